@@ -0,0 +1,16 @@
+# coding: utf-8
+"""
+    benchmarks
+    ----------
+
+    Benchmarks measuring the speed of WeasyPrint on synthetic documents.
+
+    They are not part of the test suite. Run them from the root of the
+    repository, eg. ``python -m benchmarks.floats``. The time spent in each
+    stage of the rendering for all the corpora is measured, stored as JSON
+    and compared with a baseline by ``python -m benchmarks.run``.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
@@ -0,0 +1,180 @@
+# coding: utf-8
+"""
+    benchmarks.corpora
+    ------------------
+
+    Synthetic documents used by the benchmarks.
+
+    Documents are generated from a fixed seed, so that they are the same for
+    every run. Their size is multiplied by a ``scale`` factor.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, unicode_literals
+
+import os.path
+import random
+
+import weasyprint
+
+from . import floats
+
+RESOURCES = os.path.join(
+    os.path.dirname(weasyprint.__file__), 'tests', 'resources')
+
+# Base URL of the documents, for their images
+BASE_URL = os.path.join(RESOURCES, 'dummy.html')
+
+WORDS = '''
+    the of and to in is was that for on with as by at from his her which be
+    this are or had not but have an they one were their all there been has
+    document printing layout paragraph typography hyphenation justification
+    stylesheet rendering pagination characteristic internationalization
+    responsibility understanding administrative representation extraordinary
+    comfortable independent development environment measurement performance
+    '''.split()
+
+
+def _sizes(scale, *sizes):
+    return [max(1, int(size * scale)) for size in sizes]
+
+
+def _sentences(rng, count):
+    sentences = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 25))]
+        sentences.append(' '.join(words).capitalize() + '.')
+    return ' '.join(sentences)
+
+
+def prose(scale=1):
+    """Long prose with hyphenation and justified text."""
+    chapters, paragraphs = _sizes(scale, 20, 30)
+    rng = random.Random(0)
+    body = []
+    for chapter in range(chapters):
+        body.append('<h1>Chapter %i</h1>' % (chapter + 1))
+        body.extend(
+            '<p>%s</p>' % _sentences(rng, rng.randint(3, 8))
+            for _ in range(paragraphs))
+    return ['''
+        <html lang=en>
+        <style>
+            @page { size: A5; margin: 2cm;
+                    @bottom-center { content: counter(page) } }
+            h1 { page-break-before: always; string-set: chapter content() }
+            p { text-align: justify; hyphens: auto; orphans: 3; widows: 3 }
+        </style>
+        %s''' % ''.join(body)]
+
+
+def table(scale=1):
+    """A long table with a repeated header."""
+    rows, = _sizes(scale, 10000)
+    rng = random.Random(1)
+    body = ''.join(
+        '<tr><td>%i</td><td>%s</td><td>%s</td><td>%.2f</td></tr>' % (
+            row, rng.choice(WORDS), _sentences(rng, 1),
+            rng.random() * 1000)
+        for row in range(rows))
+    return ['''
+        <style>
+            @page { size: A4; margin: 1cm }
+            table { border-collapse: collapse; width: 100%% }
+            td, th { border: 1px solid #888; padding: 2px 4px }
+            tr:nth-child(2n) td { background: #eee }
+        </style>
+        <table>
+            <thead><tr><th>#</th><th>Name</th><th>Description</th>
+                <th>Price</th></tr></thead>
+            <tbody>%s</tbody>
+        </table>''' % body]
+
+
+def catalog(scale=1):
+    """Pages crowded with floats, see :mod:`benchmarks.floats`."""
+    floats_per_page, pages = _sizes(scale, 1000, 3)
+    return [floats.make_document(floats_per_page, pages)]
+
+
+def brochure(scale=1):
+    """Pages with many images in various formats, and backgrounds."""
+    pages, = _sizes(scale, 50)
+    rng = random.Random(2)
+    images = ['pattern.png', 'blue.jpg', 'logo_small.png', 'pattern.svg',
+              'pattern.gif', 'icon.png']
+    body = []
+    for page in range(pages):
+        body.append('<section><h2>Page %i</h2>' % (page + 1))
+        for _ in range(12):
+            body.append(
+                '<figure><img src=%s style="width: %ipx">'
+                '<figcaption>%s</figcaption></figure>' % (
+                    rng.choice(images), rng.randint(40, 200),
+                    _sentences(rng, 1)))
+        body.append('</section>')
+    return ['''
+        <style>
+            @page { size: A4; margin: 1cm;
+                    background: url(pattern.png) repeat }
+            section { page-break-after: always;
+                      background: url(logo_small.png) no-repeat right top }
+            figure { display: inline-block; margin: 5px; width: 220px;
+                     background: linear-gradient(white, #ddd) }
+            img { border-radius: 4px }
+        </style>
+        %s''' % ''.join(body)]
+
+
+def invoices(scale=1):
+    """Many small one-page documents."""
+    documents, = _sizes(scale, 200)
+    rng = random.Random(3)
+    sources = []
+    for number in range(documents):
+        lines = ''.join(
+            '<tr><td>%s</td><td>%i</td><td>%.2f</td></tr>' % (
+                rng.choice(WORDS), rng.randint(1, 10), rng.random() * 100)
+            for _ in range(rng.randint(3, 15)))
+        sources.append('''
+            <style>
+                @page { size: A4; margin: 2cm;
+                        @top-right { content: "Invoice %i" } }
+                header { overflow: hidden }
+                header img { float: right }
+                table { width: 100%%; border-collapse: collapse }
+                td { border-bottom: 1px solid #ccc }
+            </style>
+            <header><img src=logo_small.png>
+                <address>%s</address></header>
+            <table>%s</table>
+            <p>%s</p>''' % (
+            number, _sentences(rng, 2), lines, _sentences(rng, 3)))
+    return sources
+
+
+def nesting(scale=1):
+    """Deeply nested blocks and inlines."""
+    depth, repeat = _sizes(scale, 200, 20)
+    rng = random.Random(4)
+    blocks = ''.join(
+        '<div>%s' % _sentences(rng, 1) for _ in range(depth)) + (
+        '</div>' * depth)
+    inlines = ''.join(
+        '<span>%s ' % rng.choice(WORDS) for _ in range(depth)) + (
+        '</span>' * depth)
+    return ['''
+        <style>
+            div { margin-left: 1px; padding: 1px 0; border-left: 1px solid }
+            span { font-size: 100.1%% }
+        </style>
+        %s''' % ((blocks + '<p>' + inlines + '</p>') * repeat)]
+
+
+#: Names and functions returning the list of HTML sources of each corpus.
+CORPORA = dict(
+    prose=prose, table=table, catalog=catalog, brochure=brochure,
+    invoices=invoices, nesting=nesting)
@@ -0,0 +1,68 @@
+# coding: utf-8
+"""
+    benchmarks.floats
+    -----------------
+
+    Lay out pages crowded with floats, like catalogs of thumbnails.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import os.path
+import time
+
+import weasyprint
+from weasyprint import HTML
+
+IMAGE = os.path.join(os.path.dirname(weasyprint.__file__),
+                     'tests', 'resources', 'pattern.png')
+
+STYLESHEET = '''
+    @page { size: 1000px 1500px; margin: 0 }
+    body { margin: 0 }
+    section { page-break-after: always }
+    img { float: left; width: 20px; height: 20px; margin: 2px }
+    img:nth-child(4n) { float: right; height: 30px }
+    img:nth-child(7n) { width: 40px }
+    p { clear: left; margin: 0 }
+'''
+
+
+def make_document(floats, pages):
+    """Return the HTML source of ``pages`` sections with ``floats``
+    floated images each.
+
+    """
+    section = '<section>%s<p>Catalog page</p></section>' % (
+        '<img src=pattern.png>' * floats)
+    return '<style>%s</style>%s' % (STYLESHEET, section * pages)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Lay out pages crowded with floats.')
+    parser.add_argument('--floats', type=int, default=1000,
+                        help='Number of floats per page, defaults to 1000')
+    parser.add_argument('--pages', type=int, default=3,
+                        help='Number of pages, defaults to 3')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of renders, the best time is kept')
+    args = parser.parse_args(argv)
+
+    source = make_document(args.floats, args.pages)
+    times = []
+    for _ in range(args.repeat):
+        start = time.time()
+        document = HTML(string=source, base_url=IMAGE).render()
+        times.append(time.time() - start)
+    print('%i pages, %i floats per page: %.3f s' % (
+        len(document.pages), args.floats, min(times)))
+
+
+if __name__ == '__main__':
+    main()
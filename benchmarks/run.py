@@ -0,0 +1,252 @@
+# coding: utf-8
+"""
+    benchmarks.run
+    --------------
+
+    Render the corpora of :mod:`benchmarks.corpora`, measure each stage of
+    the rendering and compare the results with a baseline::
+
+        python -m benchmarks.run --output before.json
+        # Hack hack hack
+        python -m benchmarks.run --baseline before.json
+
+    The time of each stage is measured with
+    :func:`weasyprint.collect_timings`. The best time of all the runs is
+    kept: caches filled by the first runs are warm for the next ones. The
+    time needed by a new process to import WeasyPrint is measured too.
+
+    Memory is measured by another run, as tracing it slows the rendering
+    down.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from weasyprint import HTML, VERSION, collect_timings
+
+from .corpora import BASE_URL, CORPORA
+
+# Stages of the rendering, in order. Other measured paths are reported too.
+STAGES = ('prefetch', 'styles', 'boxes', 'layout', 'pages', 'paint', 'pdf')
+
+# Differences smaller than this number of seconds are never regressions
+MINIMUM_DIFFERENCE = 0.005
+
+
+def render_corpus(sources, memory=False):
+    """Render the HTML ``sources`` to PDF.
+
+    Return the :class:`weasyprint.timing.Timings` of the renders and the
+    number of pages.
+
+    """
+    pages = 0
+    with collect_timings(memory) as timings:
+        for source in sources:
+            document = HTML(string=source, base_url=BASE_URL).render()
+            document.write_pdf()
+            pages += len(document.pages)
+    return timings, pages
+
+
+def run_corpus(sources, repeat):
+    """Render the HTML ``sources`` to PDF ``repeat`` times.
+
+    Return a dict with the best ``times`` of each stage and of the ``total``
+    in seconds, the number of ``pages`` and the ``peak_memory`` in bytes:
+    the largest memory allocated by Python during a stage, or :obj:`None`
+    if it can not be measured.
+
+    """
+    times = {}
+    for _ in range(repeat):
+        start = time.time()
+        timings, pages = render_corpus(sources)
+        run_times = dict(
+            (stage, stats['time'])
+            for stage, stats in timings.stages.items())
+        run_times['total'] = time.time() - start
+        for stage, seconds in run_times.items():
+            times[stage] = min(seconds, times.get(stage, seconds))
+    timings, _pages = render_corpus(sources, memory=True)
+    memories = [
+        stats['peak_memory'] for stats in timings.stages.values()
+        if stats['peak_memory'] is not None]
+    peak_memory = max(memories) if memories else None
+    return dict(times=times, pages=pages, peak_memory=peak_memory)
+
+
+def measure_import(repeat):
+    """Return the best time in seconds needed to import WeasyPrint in a new
+    Python process, among ``repeat`` runs."""
+    code = ('import time; start = time.time(); import weasyprint; '
+            'print(time.time() - start)')
+    return min(
+        float(subprocess.check_output([sys.executable, '-c', code]))
+        for _ in range(repeat))
+
+
+def run(names, scale=1, repeat=3, log=None):
+    """Run the benchmarks of the corpora called ``names``.
+
+    Progress is written to the ``log`` file object if given.
+
+    :returns: The results, as a JSON-serializable dict.
+
+    """
+    results = dict(
+        weasyprint=VERSION, python=platform.python_version(),
+        platform=platform.platform(), scale=scale, repeat=repeat,
+        corpora={})
+    if log:
+        log.write('import... ')
+        log.flush()
+    results['import'] = measure_import(repeat)
+    if log:
+        log.write('%.3f s\n' % results['import'])
+    for name in names:
+        if log:
+            log.write('%s... ' % name)
+            log.flush()
+        sources = CORPORA[name](scale)
+        result = run_corpus(sources, repeat)
+        result['documents'] = len(sources)
+        results['corpora'][name] = result
+        if log:
+            log.write('%.3f s\n' % result['times']['total'])
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """Compare ``results`` with ``baseline`` results.
+
+    :returns:
+        A list of ``(corpus, stage, baseline_time, time, ratio)`` tuples for
+        the stages measured in both results, and a list of the regressions:
+        tuples of stages slower than the baseline by more than ``threshold``
+        (``0.1`` is 10%).
+
+    """
+    comparisons = []
+    regressions = []
+
+    def add_comparison(name, stage, old, new):
+        if old:
+            ratio = new / old
+        else:
+            ratio = float('inf') if new else 1
+        comparison = (name, stage, old, new, ratio)
+        comparisons.append(comparison)
+        if ratio > 1 + threshold and new - old > MINIMUM_DIFFERENCE:
+            regressions.append(comparison)
+
+    if 'import' in results and 'import' in baseline:
+        add_comparison(
+            'import', 'total', baseline['import'], results['import'])
+    for name, result in sorted(results['corpora'].items()):
+        if name not in baseline['corpora']:
+            continue
+        baseline_times = baseline['corpora'][name]['times']
+        stages = [stage for stage in STAGES if stage in result['times']]
+        stages.extend(sorted(
+            set(result['times']) - set(STAGES) - set(['total'])))
+        stages.append('total')
+        for stage in stages:
+            if stage not in baseline_times:
+                continue
+            add_comparison(
+                name, stage, baseline_times[stage], result['times'][stage])
+    return comparisons, regressions
+
+
+def print_results(results, output):
+    """Write a table of ``results`` to the ``output`` file object."""
+    if 'import' in results:
+        output.write('\nimport: %.3f s\n' % results['import'])
+    for name, result in sorted(results['corpora'].items()):
+        output.write('\n%s: %i documents, %i pages\n' % (
+            name, result['documents'], result['pages']))
+        for stage in STAGES + ('total',):
+            if stage in result['times']:
+                output.write('    %-10s %8.3f s\n' % (
+                    stage, result['times'][stage]))
+
+
+def print_comparisons(comparisons, regressions, output):
+    """Write a table of ``comparisons`` to the ``output`` file object."""
+    output.write('\n%-10s %-14s %10s %10s %8s\n' % (
+        'corpus', 'stage', 'baseline', 'current', 'ratio'))
+    for comparison in comparisons:
+        name, stage, old, new, ratio = comparison
+        output.write('%-10s %-14s %9.3fs %9.3fs %7.2fx%s\n' % (
+            name, stage, old, new, ratio,
+            '  SLOWER' if comparison in regressions else ''))
+
+
+def main(argv=None, stdout=None):
+    """Run the benchmarks from the command line, see the module docstring.
+
+    Return 1 if some stages are slower than the baseline, 0 otherwise.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Measure the rendering stages of synthetic documents.')
+    parser.add_argument('corpora', nargs='*', metavar='CORPUS',
+                        help='Corpora to render among %s, defaults to all' %
+                             ', '.join(sorted(CORPORA)))
+    parser.add_argument('-s', '--scale', type=float, default=1,
+                        help='Multiply the size of documents, defaults to 1')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of runs, the best times are kept. '
+                             'Defaults to 3.')
+    parser.add_argument('-o', '--output',
+                        help='Write the results as JSON to this file')
+    parser.add_argument('-b', '--baseline',
+                        help='Compare with the JSON results in this file')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='Slowdown ratio reported as a regression, '
+                             'defaults to 0.1 (10%%)')
+    args = parser.parse_args(argv)
+    unknown = set(args.corpora) - set(CORPORA)
+    if unknown:
+        parser.error('Unknown corpora: %s' % ', '.join(sorted(unknown)))
+    baseline = None
+    if args.baseline:
+        with io.open(args.baseline, encoding='utf8') as fd:
+            baseline = json.load(fd)
+        if baseline['scale'] != args.scale:
+            parser.error('The baseline was measured with --scale %s' %
+                         baseline['scale'])
+
+    if stdout is None:
+        stdout = sys.stdout
+    results = run(args.corpora or sorted(CORPORA), args.scale, args.repeat,
+                  log=sys.stderr)
+    print_results(results, stdout)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        comparisons, regressions = compare(
+            results, baseline, args.threshold)
+        print_comparisons(comparisons, regressions, stdout)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -26,7 +26,8 @@ __version__ = VERSION
 VERSION_STRING = 'WeasyPrint %s (http://weasyprint.org/)' % VERSION
 
 __all__ = ['HTML', 'CSS', 'Attachment', 'Document', 'Page',
-           'default_url_fetcher', 'VERSION']
+           'default_url_fetcher', 'render_many', 'collect_timings',
+           'VERSION']
 
 
 # Import after setting the version, as the version is used in other modules
@@ -34,6 +35,7 @@ from .urls import (fetch, default_url_fetcher, path2url, ensure_url,
                    url_is_absolute)  # noqa
 from .compat import unicode  # noqa
 from .logger import LOGGER  # noqa
+from .timing import collect_timings  # noqa
 # Some imports are at the end of the file (after the CSS class)
 # to work around circular imports.
 
@@ -105,16 +107,16 @@ class HTML(object):
         self.media_type = media_type
 
     def _ua_stylesheets(self):
-        return [HTML5_UA_STYLESHEET]
+        return [html5_ua_stylesheet()]
 
     def _ph_stylesheets(self):
-        return [HTML5_PH_STYLESHEET]
+        return [html5_ph_stylesheet()]
 
     def _get_metadata(self):
         return get_html_metadata(self.root_element)
 
     def render(self, stylesheets=None, enable_hinting=False,
-               presentational_hints=False):
+               presentational_hints=False, updatable=False):
         """Lay out and paginate the document, but do not (yet) export it
         to PDF or another format.
 
@@ -136,14 +138,22 @@ class HTML(object):
         :type presentational_hints: bool
         :param presentational_hints: Whether HTML presentational hints are
             followed.
+        :type updatable: bool
+        :param updatable:
+            Whether the document can be laid out again after changes in
+            ``root_element``, with :meth:`Document.update()
+            <document.Document.update>`. Updatable documents keep the
+            styles and the boxes of the whole document in memory.
         :returns: A :class:`~document.Document` object.
 
         """
         return Document._render(
-            self, stylesheets, enable_hinting, presentational_hints)
+            self, stylesheets, enable_hinting, presentational_hints,
+            updatable=updatable)
 
     def write_pdf(self, target=None, stylesheets=None, zoom=1,
-                  attachments=None, presentational_hints=False):
+                  attachments=None, presentational_hints=False, workers=1,
+                  streaming=False, object_streams=False):
         """Render the document to a PDF file.
 
         This is a shortcut for calling :meth:`render`, then
@@ -169,16 +179,32 @@ class HTML(object):
         :type presentational_hints: bool
         :param presentational_hints: Whether HTML presentational hints are
             followed.
+        :type workers: int
+        :param workers: The number of processes painting pages in parallel,
+            see :meth:`Document.write_pdf() <document.Document.write_pdf>`.
+        :type streaming: bool
+        :param streaming:
+            Whether each page is painted as soon as it is laid out, instead
+            of laying out the whole document first. Memory is then used by
+            a few pages at a time rather than by all the pages. Documents
+            with fixed boxes or showing the number of pages in margin boxes
+            are laid out twice. ``workers`` is ignored.
+        :type object_streams: bool
+        :param object_streams:
+            Whether the objects added to the PDF file for metadata, links and
+            bookmarks are packed in compressed object streams. Files are
+            smaller, but require PDF 1.5.
         :returns:
             The PDF as byte string if :obj:`target` is not provided or
             :obj:`None`, otherwise :obj:`None` (the PDF is written to
             :obj:`target`.)
 
         """
-        return self.render(
-            stylesheets, enable_hinting=False,
-            presentational_hints=presentational_hints).write_pdf(
-                target, zoom, attachments)
+        return Document._render(
+            self, stylesheets, enable_hinting=False,
+            presentational_hints=presentational_hints,
+            streaming=streaming).write_pdf(
+                target, zoom, attachments, workers, object_streams)
 
     def write_image_surface(self, stylesheets=None, resolution=96,
                             presentational_hints=False):
@@ -245,24 +271,15 @@ class CSS(object):
             base_url=base_url, url_fetcher=url_fetcher,
             check_css_mime_type=_check_mime_type)
         with result as (source_type, source, base_url, protocol_encoding):
-            if source_type == 'string' and not isinstance(source, bytes):
-                # unicode, no encoding
-                stylesheet = PARSER.parse_stylesheet(source)
-            else:
-                if source_type == 'file_obj':
-                    source = source.read()
-                stylesheet = PARSER.parse_stylesheet_bytes(
-                    source, linking_encoding=encoding,
-                    protocol_encoding=protocol_encoding)
+            if source_type == 'file_obj':
+                source = source.read()
         self.base_url = base_url
-        self.rules = []
+        # Unicode strings are parsed without encoding, byte strings are
+        # decoded according to the given encodings.
         # TODO: fonts are stored here and should be cleaned after rendering
-        self.fonts = []
-        preprocess_stylesheet(
-            media_type, base_url, stylesheet.rules, url_fetcher, self.rules,
-            self.fonts, font_config)
-        for error in stylesheet.errors:
-            LOGGER.warning(error)
+        self.rules, self.fonts = load_stylesheet(
+            source, encoding, protocol_encoding, media_type, base_url,
+            url_fetcher, font_config)
 
 
 class Attachment(object):
@@ -358,8 +375,9 @@ def _select_source(guess=None, filename=None, url=None, file_obj=None,
         ))
 
 # Work around circular imports.
-from .css import PARSER, preprocess_stylesheet  # noqa
+from .css import load_stylesheet  # noqa
 from .html import (
-    find_base_url, HTML5_UA_STYLESHEET, HTML5_PH_STYLESHEET,
+    find_base_url, html5_ua_stylesheet, html5_ph_stylesheet,
     get_html_metadata)  # noqa
 from .document import Document, Page  # noqa
+from .batch import render_many  # noqa
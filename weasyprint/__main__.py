@@ -14,10 +14,12 @@
 # Native strings are fine with argparse, unicode makes --help crash on 2.6.
 
 import argparse
+import json
 import logging
 import sys
 
-from . import HTML, LOGGER, VERSION
+from . import HTML, LOGGER, VERSION, render_many
+from .timing import collect_timings
 
 
 def main(argv=None, stdout=None, stdin=None):
@@ -67,10 +69,43 @@ def main(argv=None, stdout=None, stdin=None):
         Adds an attachment to the document which is included in the PDF output.
         This option can be added multiple times to attach more files.
 
+    .. option:: --object-streams
+
+        For PDF output only. Pack the objects added for metadata, links and
+        bookmarks in compressed object streams. Files are smaller but
+        require PDF 1.5.
+
     .. option:: -p, --presentational-hints
 
         Follow HTML presentational hints.
 
+    .. option:: --timing
+
+        Write to stderr a JSON object with the time spent in each stage of
+        the rendering, see :func:`weasyprint.collect_timings`. With
+        ``--batch``, the timings of each job are given in its ``timings``.
+
+    .. option:: --batch <manifest>
+
+        Render many documents instead of a single one. The manifest is a
+        filename, or ``-`` to read from stdin. Each of its lines is a JSON
+        object describing a job with the keys accepted by
+        :func:`weasyprint.render_many`, such as
+        ``{"input": "a.html", "output": "a.pdf"}``. Every job needs an
+        ``output`` filename. The input and output arguments must be omitted,
+        and the other options are used as defaults for the jobs.
+
+        A JSON object is written to stdout for each finished job, with the
+        ``index`` of the job in the manifest, its ``input`` and ``output``,
+        the rendering ``time`` in seconds, an ``error`` message (or
+        ``null``) and the list of logged ``warnings``. The exit status is 1
+        if any job failed.
+
+    .. option:: -w <number>, --workers <number>
+
+        With ``--batch`` only. The number of worker processes rendering the
+        jobs. Defaults to the number of CPUs.
+
     .. option:: --version
 
         Show the version number. Other options and arguments are ignored.
@@ -105,15 +140,38 @@ def main(argv=None, stdout=None, stdin=None):
     parser.add_argument('-a', '--attachment', action='append',
                         help='URL or filename of a file '
                              'to attach to the PDF document')
+    parser.add_argument('--object-streams', action='store_true',
+                        help='PDF only: pack the objects added for links, '
+                             'bookmarks and metadata in compressed object '
+                             'streams (PDF 1.5).')
     parser.add_argument('-p', '--presentational-hints', action='store_true',
                         help='Follow HTML presentational hints.')
+    parser.add_argument('--timing', action='store_true',
+                        help='Write the time spent in each rendering stage '
+                             'as JSON to stderr.')
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help='Render the jobs listed as JSON lines in '
+                             'MANIFEST, or - for stdin. '
+                             'Input and output must be omitted.')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Batch only: the number of worker processes. '
+                             'Defaults to the number of CPUs.')
     parser.add_argument(
-        'input', help='URL or filename of the HTML input, or - for stdin')
+        'input', nargs='?',
+        help='URL or filename of the HTML input, or - for stdin')
     parser.add_argument(
-        'output', help='Filename where output is written, or - for stdout')
+        'output', nargs='?',
+        help='Filename where output is written, or - for stdout')
 
     args = parser.parse_args(argv)
 
+    if args.batch is not None:
+        return _main_batch(parser, args, stdout, stdin)
+    if args.input is None or args.output is None:
+        parser.error('input and output are required without --batch')
+    if args.workers is not None:
+        parser.error('--workers only applies with --batch.')
+
     if args.format is None:
         output_lower = args.output.lower()
         if output_lower.endswith('.pdf'):
@@ -160,16 +218,87 @@ def main(argv=None, stdout=None, stdin=None):
         else:
             parser.error('--attachment only applies for the PDF format.')
 
+    if args.object_streams:
+        if format_ == 'pdf':
+            kwargs['object_streams'] = True
+        else:
+            parser.error('--object-streams only applies for the PDF format.')
+
     # Default to logging to stderr.
     LOGGER.setLevel(logging.INFO)
     handler = logging.StreamHandler()
     handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
     LOGGER.addHandler(handler)
 
+    if args.timing:
+        with collect_timings() as timings:
+            _render(args, format_, source, output, kwargs)
+        sys.stderr.write(timings.to_json() + '\n')
+    else:
+        _render(args, format_, source, output, kwargs)
+
+
+def _render(args, format_, source, output, kwargs):
+    """Render a single document, see :func:`main`."""
     html = HTML(source, base_url=args.base_url, encoding=args.encoding,
                 media_type=args.media_type)
     getattr(html, 'write_' + format_)(output, **kwargs)
 
 
+def _main_batch(parser, args, stdout, stdin):
+    """Render the jobs of a batch manifest, see :func:`main`."""
+    if args.input is not None or args.output is not None:
+        parser.error('input and output must be omitted with --batch')
+
+    if args.batch == '-':
+        if stdin is None:
+            stdin = sys.stdin
+        # stdin.buffer on Py3, stdin on Py2
+        lines = getattr(stdin, 'buffer', stdin).readlines()
+    else:
+        with open(args.batch, 'rb') as manifest:
+            lines = manifest.readlines()
+
+    defaults = {
+        'format': args.format,
+        'encoding': args.encoding,
+        'base_url': args.base_url,
+        'media_type': args.media_type,
+        'stylesheets': args.stylesheet,
+        'presentational_hints': args.presentational_hints,
+        'attachments': args.attachment,
+        'object_streams': args.object_streams,
+        'timing': args.timing}
+    if args.resolution:
+        defaults['resolution'] = args.resolution
+    jobs = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line.decode('utf8'))
+        except ValueError as exception:
+            parser.error('Invalid JSON on line %i of the manifest: %s' % (
+                line_number, exception))
+        if not isinstance(job, dict) or not job.get('output'):
+            parser.error(
+                'Line %i of the manifest is not a job with an output' %
+                line_number)
+        jobs.append(dict(defaults, **job))
+
+    if stdout is None:
+        stdout = sys.stdout
+    # stdout.buffer on Py3, stdout on Py2
+    output = getattr(stdout, 'buffer', stdout)
+    failed = False
+    for index, result in render_many(jobs, args.workers):
+        del result['bytes']
+        result['index'] = index
+        failed = failed or result['error'] is not None
+        output.write((json.dumps(result, sort_keys=True) + '\n').encode())
+        output.flush()
+    return 1 if failed else 0
+
+
 if __name__ == '__main__':  # pragma: no cover
-    main()
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# coding: utf-8
+"""
+    weasyprint.batch
+    ----------------
+
+    Render many documents with a pool of worker processes.
+
+    Importing WeasyPrint, loading the native libraries and parsing the user
+    agent stylesheets is done once per worker process instead of once per
+    document. Stylesheets and layouts cached by WeasyPrint are also reused
+    between the documents rendered by a worker.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, unicode_literals
+
+import logging
+import multiprocessing
+import time
+
+from . import CSS, HTML
+from .logger import LOGGER
+from .urls import default_url_fetcher
+from .timing import collect_timings
+
+# Keys of job dicts, with their default values. See render_many().
+JOB_DEFAULTS = {
+    'input': None,
+    'string': None,
+    'output': None,
+    'format': None,
+    'base_url': None,
+    'encoding': None,
+    'media_type': 'print',
+    'stylesheets': None,
+    'css': None,
+    'presentational_hints': False,
+    'zoom': 1,
+    'resolution': 96,
+    'attachments': None,
+    'object_streams': False,
+    'timing': False,
+}
+
+
+class _ListHandler(logging.Handler):
+    """Keep the messages of the log records emitted during a job."""
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def output_format(job):
+    """Return the output format of ``job``, ``'pdf'`` or ``'png'``."""
+    format_ = job['format']
+    if format_ is None:
+        output = job['output']
+        if output and output.lower().endswith('.png'):
+            format_ = 'png'
+        else:
+            format_ = 'pdf'
+    format_ = format_.lower()
+    if format_ not in ('pdf', 'png'):
+        raise ValueError('Unknown output format: %r' % format_)
+    return format_
+
+
+def render_job(job, url_fetcher=default_url_fetcher):
+    """Render a single job and return its result.
+
+    :param job: a job dict, see :func:`render_many`.
+    :param url_fetcher: the URL fetcher used to load the documents and
+        their resources.
+    :returns: a result dict, see :func:`render_many`.
+
+    """
+    unknown = set(job) - set(JOB_DEFAULTS)
+    options = dict(JOB_DEFAULTS, **job)
+    result = {'input': options['input'], 'output': options['output'],
+              'bytes': None, 'error': None, 'warnings': []}
+    handler = _ListHandler()
+    LOGGER.addHandler(handler)
+    start = time.time()
+    try:
+        if unknown:
+            raise ValueError(
+                'Unknown job options: %s' % ', '.join(sorted(unknown)))
+        if (options['input'] is None) == (options['string'] is None):
+            raise ValueError('Jobs need exactly one of input and string')
+        format_ = output_format(options)
+        if options['timing']:
+            with collect_timings() as timings:
+                result['bytes'] = _render_options(
+                    options, format_, url_fetcher)
+            result['timings'] = timings.stages
+        else:
+            result['bytes'] = _render_options(options, format_, url_fetcher)
+    except Exception as exception:
+        result['error'] = '%s: %s' % (type(exception).__name__, exception)
+    finally:
+        LOGGER.removeHandler(handler)
+    result['time'] = time.time() - start
+    result['warnings'] = handler.messages
+    return result
+
+
+def _render_options(options, format_, url_fetcher):
+    html = HTML(
+        options['input'], string=options['string'],
+        base_url=options['base_url'], encoding=options['encoding'],
+        media_type=options['media_type'], url_fetcher=url_fetcher)
+    stylesheets = [
+        CSS(guess=stylesheet, media_type=options['media_type'],
+            url_fetcher=url_fetcher)
+        for stylesheet in options['stylesheets'] or []]
+    stylesheets.extend(
+        CSS(string=css, base_url=options['base_url'],
+            media_type=options['media_type'], url_fetcher=url_fetcher)
+        for css in options['css'] or [])
+    document = html.render(
+        stylesheets, enable_hinting=format_ == 'png',
+        presentational_hints=options['presentational_hints'])
+    if format_ == 'pdf':
+        return document.write_pdf(
+            options['output'], options['zoom'], options['attachments'],
+            object_streams=options['object_streams'])
+    else:
+        png_bytes, _width, _height = document.write_png(
+            options['output'], options['resolution'])
+        return png_bytes
+
+
+def _render_indexed_job(indexed_job):
+    index, job = indexed_job
+    return index, render_job(job)
+
+
+def init_worker():
+    """Warm up a worker process before it gets jobs."""
+    # Load the fonts and the caches needed by a simple document.
+    try:
+        HTML(string='<p>WeasyPrint</p>').render()
+    except Exception:
+        # A worker raising here would be replaced again and again by the
+        # pool. Let the real jobs report the error instead.
+        pass
+
+
+def render_many(jobs, workers=None):
+    """Render many documents with a pool of worker processes.
+
+    :param jobs:
+        An iterable of job dicts. Jobs need an ``input`` (filename or URL
+        of the HTML document) or a ``string`` (HTML source). Other optional
+        keys are ``output`` (filename where the result is written),
+        ``format`` (``'pdf'`` or ``'png'``, guessed from ``output`` and
+        defaulting to PDF), ``base_url``, ``encoding``, ``media_type``,
+        ``stylesheets`` (list of filenames or URLs), ``css`` (list of
+        stylesheets given as strings), ``presentational_hints``, ``zoom``,
+        ``attachments`` and ``object_streams`` for PDF, ``resolution`` for
+        PNG, and ``timing`` (whether the rendering stages are measured).
+    :type workers: int
+    :param workers:
+        The number of worker processes. Defaults to the number of CPUs.
+        With one worker, jobs are rendered in the current process.
+    :returns:
+        An iterator of ``(index, result)`` tuples, in the order in which
+        jobs are finished. ``index`` is the position of the job in ``jobs``.
+        ``result`` is a dict with ``input`` and ``output`` (copied from the
+        job), ``bytes`` (the rendered document if the job has no output,
+        or :obj:`None`), ``time`` (rendering time in seconds), ``error``
+        (a message, or :obj:`None` if the job succeeded) and ``warnings``
+        (list of messages logged during the job). Jobs with ``timing`` also
+        have ``timings``, the stages measured by
+        :func:`weasyprint.collect_timings`.
+
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    indexed_jobs = enumerate(jobs)
+    if workers <= 1:
+        for indexed_job in indexed_jobs:
+            yield _render_indexed_job(indexed_job)
+        return
+
+    pool = multiprocessing.Pool(workers, initializer=init_worker)
+    try:
+        for indexed_result in pool.imap_unordered(
+                _render_indexed_job, indexed_jobs):
+            yield indexed_result
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
@@ -0,0 +1,106 @@
+# coding: utf-8
+"""
+    weasyprint.caches
+    -----------------
+
+    Process-wide caches shared between renders.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, unicode_literals
+
+import collections
+import threading
+
+
+class LRUCache(object):
+    """A thread-safe mapping keeping at most ``maxsize`` entries.
+
+    When full, the least recently used entry is evicted. Hits and misses
+    are counted so that the efficiency of the cache can be monitored.
+
+    :param maxsize:
+        The maximum number of entries, or :obj:`None` for no limit.
+        A ``maxsize`` of ``0`` disables the cache.
+    :param maxmemory:
+        The maximum memory used by the values in bytes, or :obj:`None` for
+        no limit. A ``maxmemory`` of ``0`` disables the cache.
+    :param sizeof:
+        A function returning the memory used by a value in bytes, required
+        with ``maxmemory``.
+
+    """
+    def __init__(self, maxsize=128, maxmemory=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxmemory = maxmemory
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        #: The memory used by the values in bytes, if ``sizeof`` is given.
+        self.memory = 0
+        # Maps keys to (value, memory) tuples
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Return the value for ``key`` and mark it as recently used."""
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Store ``value`` for ``key``, evicting old entries if needed."""
+        if self.maxsize == 0 or self.maxmemory == 0:
+            return
+        memory = self.sizeof(value) if self.sizeof is not None else 0
+        if self.maxmemory is not None and memory > self.maxmemory:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.memory -= old_entry[1]
+            self._entries[key] = (value, memory)
+            self.memory += memory
+            while ((self.maxsize is not None and
+                    len(self._entries) > self.maxsize) or
+                   (self.maxmemory is not None and
+                    self.memory > self.maxmemory)):
+                _, (_, evicted_memory) = self._entries.popitem(last=False)
+                self.memory -= evicted_memory
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.memory = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return a dict with the ``hits``, ``misses``, ``hit_rate``,
+        ``size``, ``maxsize``, ``memory`` and ``maxmemory`` of the cache.
+
+        ``hit_rate`` is the ratio of hits in all lookups, or :obj:`None`
+        before the first lookup.
+
+        """
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses,
+                    hit_rate=self.hits / lookups if lookups else None,
+                    size=len(self._entries), maxsize=self.maxsize,
+                    memory=self.memory, maxmemory=self.maxmemory)
@@ -16,9 +16,10 @@ import codecs
 import email
 import sys
 
-__all__ = ['Request', 'base64_decode', 'base64_encode', 'basestring',
-           'ints_from_bytes', 'iteritems', 'izip', 'parse_email', 'parse_qs',
-           'pathname2url', 'quote', 'unicode', 'unichr', 'unquote',
+__all__ = ['HTTPError', 'HTTPRedirectHandler', 'Request', 'base64_decode',
+           'base64_encode', 'basestring', 'build_opener', 'ints_from_bytes',
+           'iteritems', 'izip', 'parse_email', 'parse_qs', 'pathname2url',
+           'queue', 'quote', 'socketserver', 'unicode', 'unichr', 'unquote',
            'unquote_to_bytes', 'urlencode', 'urljoin', 'urlopen',
            'urllib_get_content_type', 'urllib_get_charset',
            'urllib_get_filename', 'urlparse_uses_relative', 'urlsplit',
@@ -39,7 +40,11 @@ if sys.version_info[0] >= 3:
     from urllib.parse import (
         urljoin, urlsplit, quote, unquote, unquote_to_bytes, parse_qs,
         urlencode, uses_relative as urlparse_uses_relative)
-    from urllib.request import urlopen, Request, pathname2url
+    from urllib.request import (
+        urlopen, Request, pathname2url, build_opener, HTTPRedirectHandler)
+    from urllib.error import HTTPError
+    import queue
+    import socketserver
     from array import array
     from base64 import (decodebytes as base64_decode,
                         encodebytes as base64_encode)
@@ -73,7 +78,10 @@ else:
     # Python 2
     from urlparse import (urljoin, urlsplit, parse_qs,
                           uses_relative as urlparse_uses_relative)
-    from urllib2 import urlopen, Request
+    from urllib2 import (
+        urlopen, Request, build_opener, HTTPError, HTTPRedirectHandler)
+    import Queue as queue
+    import SocketServer as socketserver
     from urllib import pathname2url as _pathname2url, quote, unquote, urlencode
     from array import array as _array
     from itertools import izip, imap
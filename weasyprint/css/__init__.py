@@ -20,7 +20,12 @@
 
 from __future__ import division, unicode_literals
 
+import functools
+import hashlib
+import logging
+import pickle
 import re
+import threading
 
 import tinycss
 import cssselect
@@ -29,16 +34,22 @@ import lxml.etree
 from . import properties
 from . import computed_values
 from .descriptors import preprocess_descriptors
+from .selectors import compile_selector, depends_on_siblings, match_selectors
 from .validation import preprocess_declarations
 from ..urls import (element_base_url, get_url_attribute, url_join,
                     URLFetchingError)
+from ..caches import LRUCache
 from ..logger import LOGGER
-from ..compat import iteritems
+from ..compat import basestring, iteritems
 from .. import CSS
 
 
 PARSER = tinycss.make_parser('page3', 'fonts3')
 
+# Preprocessed stylesheets, shared by all the documents rendered in the
+# process. See :func:`load_stylesheet`.
+STYLESHEET_CACHE = LRUCache(maxsize=64)
+
 
 # Reject anything not in here:
 PSEUDO_ELEMENTS = (None, 'before', 'after', 'first-line', 'first-letter')
@@ -71,17 +82,83 @@ RE_INITIAL_NOT_COMPUTED = re.compile(
     '^(display|column_gap|'
     '(border_[a-z]+|outline|column_rule)_(width|color))$').match
 
+# Properties whose computed value may depend on the attributes of the element,
+# with attr() functions. Styles with such cascaded values are not shared.
+ELEMENT_DEPENDENT_PROPERTIES = ('anchor', 'content', 'lang', 'link')
+
 
-class StyleDict(dict):
+class StyleDict(object):
     """A mapping (dict-like) that allows attribute access to values.
 
     Allow eg. ``style.font_size`` instead of ``style['font-size']``.
 
+    Copies share their values until one of them is modified (copy-on-write),
+    so that the many boxes with the same style do not each hold a full dict
+    of all the properties.
+
     """
+    __slots__ = ('_values', '_owned', '_inherited', 'anonymous')
+
+    def __init__(self, *args, **kwargs):
+        self._values = dict(*args, **kwargs)
+        # False if _values may be shared with copies.
+        self._owned = True
+        # Cached result of inherit_from()
+        self._inherited = None
+        self.anonymous = False
+
+    def __getattr__(self, key):
+        if key.startswith('__') or key in StyleDict.__slots__:
+            raise AttributeError(key)
+        return self._values[key]
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        if not self._owned:
+            self._values = dict(self._values)
+            self._owned = True
+        self._values[key] = value
+        self._inherited = None
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, StyleDict):
+            other = other._values
+        return self._values == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self._values)
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
 
-    # TODO: We should remove that. Some attributes (eg. "clear") exist as
-    # dict methods and can only be accessed with getitem.
-    __getattr__ = dict.__getitem__
+    def keys(self):
+        return self._values.keys()
+
+    def values(self):
+        return self._values.values()
+
+    def items(self):
+        return self._values.items()
+
+    def update(self, *args, **kwargs):
+        for key, value in iteritems(dict(*args, **kwargs)):
+            self[key] = value
 
     def get_color(self, key):
         value = self[key]
@@ -89,7 +166,10 @@ class StyleDict(dict):
 
     def copy(self):
         """Copy the ``StyleDict``."""
-        style = type(self)(self)
+        style = type(self).__new__(type(self))
+        style._values = self._values
+        style._owned = self._owned = False
+        style._inherited = self._inherited
         style.anonymous = self.anonymous
         return style
 
@@ -100,15 +180,15 @@ class StyleDict(dict):
         This is the method used for an anonymous box.
 
         """
-        style = computed_from_cascaded(
-            cascaded={}, parent_style=self,
-            # Only used by non-inherited properties. eg `content: attr(href)`
-            element=None)
-        style.anonymous = True
-        return style
-
-    # Default values, may be overriden on instances
-    anonymous = False
+        if self._inherited is None:
+            style = computed_from_cascaded(
+                cascaded={}, parent_style=self,
+                # Only used by non-inherited properties.
+                # eg `content: attr(href)`
+                element=None)
+            style.anonymous = True
+            self._inherited = style
+        return self._inherited.copy()
 
 
 def get_child_text(element):
@@ -507,13 +587,17 @@ def add_declaration(cascaded_styles, prop_name, prop_values, weight, element,
 
 
 def set_computed_styles(cascaded_styles, computed_styles, element, parent,
-                        root=None, pseudo_type=None):
+                        root=None, pseudo_type=None, shared_styles=None):
     """Set the computed values of styles to ``element``.
 
     Take the properties left by ``apply_style_rule`` on an element or
     pseudo-element and assign computed values with respect to the cascade,
     declaration priority (ie. ``!important``) and selector specificity.
 
+    If ``shared_styles`` is a dict, computed styles are stored in it and
+    shared between elements with the same parent style and the same cascaded
+    values. Shared styles must not be modified.
+
     """
     parent_style = computed_styles[parent, None] \
         if parent is not None else None
@@ -523,9 +607,46 @@ def set_computed_styles(cascaded_styles, computed_styles, element, parent,
         if element is root else computed_styles[root, None]
     cascaded = cascaded_styles.get((element, pseudo_type), {})
 
-    computed_styles[element, pseudo_type] = computed_from_cascaded(
-        element, cascaded, parent_style, pseudo_type, root_style
-    )
+    key = None
+    # The root element and page types get a different computed display.
+    if (shared_styles is not None and element is not root and
+            not isinstance(element, basestring)):
+        key = style_sharing_key(cascaded, parent_style, pseudo_type)
+        if key is not None:
+            style = shared_styles.get(key)
+            if style is not None:
+                computed_styles[element, pseudo_type] = style
+                return
+
+    style = computed_from_cascaded(
+        element, cascaded, parent_style, pseudo_type, root_style)
+    computed_styles[element, pseudo_type] = style
+    if key is not None:
+        shared_styles[key] = style
+
+
+def style_sharing_key(cascaded, parent_style, pseudo_type=None):
+    """Return a key identifying the computed style of an element.
+
+    Elements with the same parent style and the same cascaded values have
+    the same computed style, unless some values depend on the attributes of
+    the element. Return :obj:`None` in this case.
+
+    Values are compared by identity: they come from the same declarations,
+    and are kept alive by ``cascaded`` during the cascade.
+
+    """
+    for name in ELEMENT_DEPENDENT_PROPERTIES:
+        if name in cascaded:
+            values, _weight = cascaded[name]
+            if values in ('none', 'normal', 'inherit', 'initial'):
+                continue
+            if name != 'content':
+                values = [values]
+            if any(type_ == 'attr' for type_, _value in values):
+                return None
+    return id(parent_style), pseudo_type, frozenset(
+        (name, id(values)) for name, (values, _weight) in iteritems(cascaded))
 
 
 def computed_from_cascaded(element, cascaded, parent_style, pseudo_type=None,
@@ -580,19 +701,145 @@ def computed_from_cascaded(element, cascaded, parent_style, pseudo_type=None,
 
 
 class Selector(object):
-    def __init__(self, specificity, pseudo_element, match):
+    def __init__(self, specificity, pseudo_element, match, key=None,
+                 test=None, siblings=False):
         self.specificity = specificity
         self.pseudo_element = pseudo_element
+        #: A function taking a document and returning the matched elements.
         self.match = match
+        #: The bucket and the test used by :func:`selectors.match_selectors`,
+        #: see :func:`selectors.compile_selector`. Selectors with no ``key``
+        #: are matched with ``match``.
+        self.key = key
+        self.test = test
+        #: Whether the selector may match other elements when the siblings
+        #: of an element change, see :func:`selectors.depends_on_siblings`.
+        self.siblings = siblings
+
+
+def _page_types_match(page_types, _document):
+    return page_types
+
+
+class _RulesPickler(pickle.Pickler):
+    """Pickler storing compiled XPath expressions as their source."""
+    def persistent_id(self, obj):
+        if isinstance(obj, lxml.etree.XPath):
+            return obj.path
+
+
+class _RulesUnpickler(pickle.Unpickler):
+    """Unpickler compiling again the XPath expressions."""
+    def persistent_load(self, path):
+        return lxml.etree.XPath(path)
+
+
+# Version of the format of the rules pickled by dump_rules(), to increment
+# when pickled objects change in ways not detected by the snapshots of the
+# HTML5 stylesheets, see html._load_html5_stylesheet().
+SNAPSHOT_FORMAT = 1
+
+
+def dump_rules(rules, file_obj):
+    """Pickle preprocessed ``rules`` to a binary file object.
+
+    The tinycss rules, first items of the ``rules`` tuples, are not kept and
+    are loaded as :obj:`None`.
+
+    """
+    _RulesPickler(file_obj, 2).dump([
+        (None, selector_list, declarations)
+        for _rule, selector_list, declarations in rules])
+
+
+def load_rules(file_obj):
+    """Load preprocessed rules pickled by :func:`dump_rules`."""
+    return _RulesUnpickler(file_obj).load()
+
+
+class _RecordingHandler(logging.Handler):
+    """A logging handler keeping the records emitted by the current thread.
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.thread = threading.current_thread().ident
+        self.records = []
+
+    def emit(self, record):
+        if record.thread == self.thread:
+            self.records.append(record)
+
+
+def load_stylesheet(source, encoding, protocol_encoding, device_media_type,
+                    base_url, url_fetcher, font_config):
+    """Parse and preprocess a stylesheet given as a byte or Unicode string.
+
+    Return a ``(rules, fonts)`` tuple, as stored on :class:`CSS` objects.
+
+    Parsed and preprocessed rules (including compiled selectors) are kept in
+    :data:`STYLESHEET_CACHE`, keyed by the hash of the source, the media type
+    and the base URL. When the cache is hit, the warnings logged while
+    parsing are logged again and the ``@font-face`` rules are added to
+    ``font_config``, as if the stylesheet was parsed again. Stylesheets with
+    ``@import`` rules are not cached, as imported stylesheets may change.
+
+    """
+    is_bytes = isinstance(source, bytes)
+    digest = hashlib.sha1(
+        source if is_bytes else source.encode('utf-8')).hexdigest()
+    key = (digest, is_bytes, encoding, protocol_encoding, device_media_type,
+           base_url)
+    cached = STYLESHEET_CACHE.get(key)
+    if cached is None:
+        handler = _RecordingHandler()
+        LOGGER.addHandler(handler)
+        try:
+            if is_bytes:
+                stylesheet = PARSER.parse_stylesheet_bytes(
+                    source, linking_encoding=encoding,
+                    protocol_encoding=protocol_encoding)
+            else:
+                stylesheet = PARSER.parse_stylesheet(source)
+            rules = []
+            font_faces = []
+            preprocess_stylesheet(
+                device_media_type, base_url, stylesheet.rules, url_fetcher,
+                rules, [], font_config, font_faces)
+            for error in stylesheet.errors:
+                LOGGER.warning(error)
+        finally:
+            LOGGER.removeHandler(handler)
+        if not any(rule.at_keyword == '@import' for rule in stylesheet.rules):
+            STYLESHEET_CACHE.set(key, (rules, font_faces, handler.records))
+    else:
+        rules, font_faces, records = cached
+        for record in records:
+            if LOGGER.isEnabledFor(record.levelno):
+                LOGGER.handle(record)
+
+    fonts = []
+    if font_config is not None:
+        for rule_descriptors in font_faces:
+            font_filename = font_config.add_font_face(
+                rule_descriptors, url_fetcher)
+            if font_filename:
+                fonts.append(font_filename)
+    # Rules are shared with the cache, only copy the list.
+    return list(rules), fonts
 
 
 def preprocess_stylesheet(device_media_type, base_url, stylesheet_rules,
-                          url_fetcher, rules, fonts, font_config):
+                          url_fetcher, rules, fonts, font_config,
+                          font_faces=None):
     """Do the work that can be done early on stylesheet, before they are
     in a document.
 
+    If ``font_faces`` is a list, the descriptors of valid ``@font-face`` rules
+    are appended to it instead of being added to ``font_config``.
+
     """
-    selector_to_xpath = cssselect.HTMLTranslator().selector_to_xpath
+    translator = cssselect.HTMLTranslator()
+    selector_to_xpath = translator.selector_to_xpath
     for rule in stylesheet_rules:
         if not rule.at_keyword:
             declarations = list(preprocess_declarations(
@@ -611,9 +858,11 @@ def preprocess_stylesheet(device_media_type, base_url, stylesheet_rules,
                             # characters), but these characters are valid in
                             # the CSS2.1 specification.
                             raise cssselect.SelectorError(str(exc))
+                        key, test = compile_selector(translator, selector)
                         selector_list.append(Selector(
                             (0,) + selector.specificity(),
-                            selector.pseudo_element, lxml_xpath))
+                            selector.pseudo_element, lxml_xpath, key, test,
+                            depends_on_siblings(selector.parsed_tree)))
                     for selector in selector_list:
                         if selector.pseudo_element not in PSEUDO_ELEMENTS:
                             raise cssselect.ExpressionError(
@@ -649,7 +898,7 @@ def preprocess_stylesheet(device_media_type, base_url, stylesheet_rules,
                 continue
             preprocess_stylesheet(
                 device_media_type, base_url, rule.rules, url_fetcher, rules,
-                fonts, font_config)
+                fonts, font_config, font_faces)
 
         elif rule.at_keyword == '@page':
             page_name, pseudo_class = rule.selector
@@ -662,9 +911,9 @@ def preprocess_stylesheet(device_media_type, base_url, stylesheet_rules,
             declarations = list(preprocess_declarations(
                 base_url, rule.declarations))
 
-            # Use a double lambda to have a closure that holds page_types
-            match = (lambda page_types: lambda _document: page_types)(
-                PAGE_PSEUDOCLASS_TARGETS[pseudo_class])
+            # Use a partial object holding page_types, that can be pickled
+            match = functools.partial(
+                _page_types_match, PAGE_PSEUDOCLASS_TARGETS[pseudo_class])
             specificity = rule.specificity
 
             if declarations:
@@ -689,26 +938,191 @@ def preprocess_stylesheet(device_media_type, base_url, stylesheet_rules,
                         key.replace('_', '-'), rule.line, rule.column)
                     break
             else:
-                if font_config is not None:
+                if font_faces is not None:
+                    font_faces.append(rule_descriptors)
+                elif font_config is not None:
                     font_filename = font_config.add_font_face(
                         rule_descriptors, url_fetcher)
                     if font_filename:
                         fonts.append(font_filename)
 
 
+class StyleFor(object):
+    """The computed styles of the elements and pages of a document.
+
+    Call it with an element (or a page type) and an optional pseudo-element
+    type to get a StyleDict object. See :func:`get_all_computed_styles`.
+
+    """
+    def __init__(self, element_tree, cascaded_styles, selectors,
+                 presentational_hints):
+        self._element_tree = element_tree
+        self._cascaded_styles = cascaded_styles
+        self._selectors = selectors
+        self._presentational_hints = presentational_hints
+        # Whether changes in an element can change the style of its siblings
+        self._sibling_selectors = any(
+            selector.siblings for selector, _data in selectors)
+
+        # keys: (element, pseudo_element_type), like cascaded_styles
+        # values: StyleDict objects:
+        #     keys: property name as a string
+        #     values: a PropertyValue-like object
+        self._computed_styles = {}
+        self._set_computed_styles([element_tree], page_types=True)
+
+    def __call__(self, element, pseudo_type=None):
+        return self._computed_styles.get((element, pseudo_type))
+
+    def _set_computed_styles(self, subtrees, page_types=False):
+        """Set the computed styles of the elements in ``subtrees``."""
+        cascaded_styles = self._cascaded_styles
+        computed_styles = self._computed_styles
+        element_tree = self._element_tree
+
+        # First, computed styles for "real" elements *in tree order*
+        # Tree order is important so that parents have computed styles before
+        # their children, for inheritance.
+
+        # keys: values of style_sharing_key(), values: StyleDict objects
+        # Elements with identical cascades, such as the cells of a large
+        # table, share their computed style.
+        shared_styles = {}
+
+        # Iterate on all elements, even if there is no cascaded style for
+        # them.
+        for subtree in subtrees:
+            for element in subtree.iter():
+                set_computed_styles(
+                    cascaded_styles, computed_styles, element,
+                    root=element_tree, parent=element.getparent(),
+                    shared_styles=shared_styles)
+
+        # Then computed styles for @page.
+
+        # Iterate on all possible page types, even if there is no cascaded
+        # style for them.
+        # @page inherits from the root element:
+        # http://lists.w3.org/Archives/Public/www-style/2012Jan/1164.html
+        if page_types:
+            for page_type in PAGE_PSEUDOCLASS_TARGETS[None]:
+                set_computed_styles(
+                    cascaded_styles, computed_styles, page_type,
+                    root=element_tree, parent=element_tree)
+
+        # Then computed styles for pseudo elements, in any order.
+        # Pseudo-elements inherit from their associated element so they come
+        # last. Do them in a second pass as there is no easy way to iterate
+        # on the pseudo-elements for a given element with the current
+        # structure of cascaded_styles. (Keys are (element, pseudo_type)
+        # tuples.)
+
+        # Only iterate on pseudo-elements that have cascaded styles. (Others
+        # might as well not exist.)
+        elements = None
+        if not page_types:
+            elements = set(
+                element for subtree in subtrees for element in subtree.iter())
+        for element, pseudo_type in cascaded_styles:
+            if pseudo_type and (elements is None or element in elements):
+                set_computed_styles(
+                    cascaded_styles, computed_styles,
+                    element, pseudo_type=pseudo_type,
+                    # The pseudo-element inherits from the element.
+                    root=element_tree, parent=element,
+                    shared_styles=shared_styles)
+
+    def restyle(self, elements):
+        """Compute again the styles of ``elements``, of their descendants
+        and of their pseudo-elements, after changes in their attributes or
+        in their children.
+
+        The styles of their siblings are computed again too when some
+        selectors depend on siblings. Changes in stylesheets are not taken
+        into account.
+
+        """
+        subtrees = set(elements)
+        if self._sibling_selectors:
+            for element in elements:
+                parent = element.getparent()
+                if parent is not None:
+                    subtrees.update(
+                        child for child in parent
+                        if isinstance(child.tag, basestring))
+        if self._element_tree in subtrees:
+            # Page styles inherit from the root element.
+            self._cascaded_styles = {}
+            cascade_styles(
+                self._cascaded_styles, self._element_tree, self._selectors,
+                self._presentational_hints)
+            self._computed_styles = {}
+            self._set_computed_styles([self._element_tree], page_types=True)
+            return
+        # Only keep the roots of the subtrees, in tree order.
+        subtrees = [
+            element for element in self._element_tree.iter()
+            if element in subtrees and not any(
+                ancestor in subtrees for ancestor in element.iterancestors())]
+        restyled = set(
+            element for subtree in subtrees for element in subtree.iter())
+        for styles in (self._cascaded_styles, self._computed_styles):
+            for key in [key for key in styles if key[0] in restyled]:
+                del styles[key]
+        for subtree in subtrees:
+            cascade_styles(
+                self._cascaded_styles, self._element_tree, self._selectors,
+                self._presentational_hints, subtree)
+        self._set_computed_styles(subtrees)
+
+
+def cascade_styles(cascaded_styles, element_tree, selectors,
+                   presentational_hints=False, subtree=None):
+    """Add to ``cascaded_styles`` the declarations applying to the elements
+    of ``element_tree``, or only to those of ``subtree`` if given.
+
+    :param selectors:
+        A list of ``(selector, (pseudo_type, weighted_declarations))``, in
+        the order of the stylesheets.
+
+    """
+    for specificity, attributes in find_style_attributes(
+            element_tree if subtree is None else subtree,
+            presentational_hints):
+        element, declarations, base_url = attributes
+        for name, values, importance in preprocess_declarations(
+                base_url, declarations):
+            precedence = declaration_precedence('author', importance)
+            weight = (precedence, specificity)
+            add_declaration(cascaded_styles, name, values, weight, element)
+
+    # Walk the tree once, only testing the selectors that may match each
+    # element. For a given element, declarations are added in the order of
+    # the stylesheets, as needed by add_declaration().
+    for element, (pseudo_type, weighted_declarations) in match_selectors(
+            element_tree, selectors, subtree):
+        for name, values, weight in weighted_declarations:
+            add_declaration(
+                cascaded_styles, name, values, weight, element, pseudo_type)
+
+
 def get_all_computed_styles(html, user_stylesheets=None,
-                            presentational_hints=False, font_config=None):
+                            presentational_hints=False, font_config=None,
+                            url_fetcher=None):
     """Compute all the computed styles of all elements in ``html`` document.
 
     Do everything from finding author stylesheets to parsing and applying them.
+    Stylesheets are fetched with ``url_fetcher`` if given, with the URL fetcher
+    of ``html`` otherwise.
 
-    Return a ``style_for`` function that takes an element and an optional
+    Return a :class:`StyleFor` object, that takes an element and an optional
     pseudo-element type, and return a StyleDict object.
 
     """
     element_tree = html.root_element
     device_media_type = html.media_type
-    url_fetcher = html.url_fetcher
+    if url_fetcher is None:
+        url_fetcher = html.url_fetcher
     ua_stylesheets = html._ua_stylesheets()
     author_stylesheets = list(find_stylesheets(
         element_tree, device_media_type, url_fetcher, font_config))
@@ -717,27 +1131,8 @@ def get_all_computed_styles(html, user_stylesheets=None,
     else:
         ph_stylesheets = []
 
-    # keys: (element, pseudo_element_type)
-    #    element: a lxml element object or the '@page' string for @page styles
-    #    pseudo_element_type: a string such as 'first' (for @page) or 'after',
-    #        or None for normal elements
-    # values: dicts of
-    #     keys: property name as a string
-    #     values: (values, weight)
-    #         values: a PropertyValue-like object
-    #         weight: values with a greater weight take precedence, see
-    #             http://www.w3.org/TR/CSS21/cascade.html#cascading-order
-    cascaded_styles = {}
-
-    for specificity, attributes in find_style_attributes(
-            element_tree, presentational_hints):
-        element, declarations, base_url = attributes
-        for name, values, importance in preprocess_declarations(
-                base_url, declarations):
-            precedence = declaration_precedence('author', importance)
-            weight = (precedence, specificity)
-            add_declaration(cascaded_styles, name, values, weight, element)
-
+    # (selector, data) tuples, in the order of the stylesheets.
+    selectors = []
     for sheets, origin, sheet_specificity in (
         # Order here is not important ('origin' is).
         # Use this order for a regression test
@@ -750,62 +1145,27 @@ def get_all_computed_styles(html, user_stylesheets=None,
             for _rule, selector_list, declarations in sheet.rules:
                 for selector in selector_list:
                     specificity = sheet_specificity or selector.specificity
-                    pseudo_type = selector.pseudo_element
-                    for element in selector.match(element_tree):
-                        for name, values, importance in declarations:
-                            precedence = declaration_precedence(
-                                origin, importance)
-                            weight = (precedence, specificity)
-                            add_declaration(
-                                cascaded_styles, name, values, weight,
-                                element, pseudo_type)
-
-    # keys: (element, pseudo_element_type), like cascaded_styles
-    # values: StyleDict objects:
-    #     keys: property name as a string
-    #     values: a PropertyValue-like object
-    computed_styles = {}
-
-    # First, computed styles for "real" elements *in tree order*
-    # Tree order is important so that parents have computed styles before
-    # their children, for inheritance.
+                    weighted_declarations = [
+                        (name, values,
+                         (declaration_precedence(origin, importance),
+                          specificity))
+                        for name, values, importance in declarations]
+                    selectors.append((selector, (
+                        selector.pseudo_element, weighted_declarations)))
 
-    # Iterate on all elements, even if there is no cascaded style for them.
-    for element in element_tree.iter():
-        set_computed_styles(cascaded_styles, computed_styles, element,
-                            root=element_tree, parent=element.getparent())
-
-    # Then computed styles for @page.
-
-    # Iterate on all possible page types, even if there is no cascaded style
-    # for them.
-    for page_type in PAGE_PSEUDOCLASS_TARGETS[None]:
-        set_computed_styles(
-            cascaded_styles, computed_styles, page_type,
-            # @page inherits from the root element:
-            # http://lists.w3.org/Archives/Public/www-style/2012Jan/1164.html
-            root=element_tree, parent=element_tree)
-
-    # Then computed styles for pseudo elements, in any order.
-    # Pseudo-elements inherit from their associated element so they come
-    # last. Do them in a second pass as there is no easy way to iterate
-    # on the pseudo-elements for a given element with the current structure
-    # of cascaded_styles. (Keys are (element, pseudo_type) tuples.)
-
-    # Only iterate on pseudo-elements that have cascaded styles. (Others
-    # might as well not exist.)
-    for element, pseudo_type in cascaded_styles:
-        if pseudo_type:
-            set_computed_styles(cascaded_styles, computed_styles,
-                                element, pseudo_type=pseudo_type,
-                                # The pseudo-element inherits from the element.
-                                root=element_tree, parent=element)
-
-    # This is mostly useful to make pseudo_type optional.
-    def style_for(element, pseudo_type=None, __get=computed_styles.get):
-        """
-        Convenience function to get the computed styles for an element.
-        """
-        return __get((element, pseudo_type))
+    # keys: (element, pseudo_element_type)
+    #    element: a lxml element object or the '@page' string for @page styles
+    #    pseudo_element_type: a string such as 'first' (for @page) or 'after',
+    #        or None for normal elements
+    # values: dicts of
+    #     keys: property name as a string
+    #     values: (values, weight)
+    #         values: a PropertyValue-like object
+    #         weight: values with a greater weight take precedence, see
+    #             http://www.w3.org/TR/CSS21/cascade.html#cascading-order
+    cascaded_styles = {}
+    cascade_styles(
+        cascaded_styles, element_tree, selectors, presentational_hints)
 
-    return style_for
+    return StyleFor(
+        element_tree, cascaded_styles, selectors, presentational_hints)
@@ -311,6 +311,7 @@ def length(computer, name, value, font_size=None, pixels_only=False):
             layout.set_text('0')
             line, = layout.iter_lines()
             logical_width, _ = text.get_size(line, computer.computed)
+            layout.release()
             result = value.value * logical_width
         elif unit == 'em':
             result = value.value * font_size
@@ -583,6 +584,7 @@ def strut_layout(style, context=None):
     line, = layout.iter_lines()
     _, _, _, _, text_height, baseline = text.first_line_metrics(
         line, '', layout, resume_at=None, space_collapse=False, style=style)
+    layout.release()
     if style['line_height'] == 'normal':
         result = text_height, baseline
         if context:
@@ -604,6 +606,7 @@ def ex_ratio(style):
     layout.set_text('x')
     line, = layout.iter_lines()
     _, ink_height_above_baseline = text.get_ink_position(line)
+    layout.release()
     # Zero means some kind of failure, fallback is 0.5.
     # We round to try keeping exact values that were altered by Pango.
     return round(-ink_height_above_baseline / font_size, 5) or 0.5
@@ -0,0 +1,258 @@
+# coding: utf-8
+"""
+    weasyprint.css.selectors
+    ------------------------
+
+    Match selectors against the elements of a document.
+
+    Like the "rule hashes" of web browsers, selectors are put in buckets
+    according to their rightmost compound selector (by id, class, tag or
+    universal). The document tree is then walked only once, each element
+    being tested against the selectors of the buckets it may belong to.
+
+    Selectors that can not be indexed (eg. with namespaces) are matched
+    against the whole document with their XPath expression, as before.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, unicode_literals
+
+import functools
+import operator
+import re
+
+import cssselect
+import lxml.etree
+
+from ..compat import basestring
+
+# Whitespace as in XPath's normalize-space(), used by cssselect for classes.
+CLASS_NAMES_RE = re.compile('[^ \t\n\r]+')
+
+# Map combinators to the XPath steps going from the element matched by the
+# right part of a combined selector to the element matched by its left part.
+COMBINATOR_AXES = {
+    ' ': 'ancestor::',
+    '>': 'parent::',
+    '+': 'preceding-sibling::*[1]/self::',
+    '~': 'preceding-sibling::',
+}
+
+# Pseudo-classes whose matching depends on the siblings or on the children
+# of elements.
+STRUCTURAL_PSEUDO_CLASSES = frozenset([
+    'first-child', 'last-child', 'only-child', 'first-of-type',
+    'last-of-type', 'only-of-type', 'empty', 'nth-child', 'nth-last-child',
+    'nth-of-type', 'nth-last-of-type'])
+
+
+def _compound_parts(compound):
+    """Return ``(tag, ids, classes, simple)`` for a compound selector.
+
+    ``simple`` is :obj:`True` if the compound selector has no other
+    condition than its tag, ids and classes. Return :obj:`None` if the tag
+    can not be compared with lxml's tags.
+
+    """
+    ids = []
+    classes = []
+    simple = True
+    node = compound
+    while not isinstance(node, cssselect.parser.Element):
+        if isinstance(node, cssselect.parser.Hash):
+            ids.append(node.id)
+        elif isinstance(node, cssselect.parser.Class):
+            classes.append(node.class_name)
+        else:
+            simple = False
+        node = getattr(node, 'selector', None)
+        if node is None:
+            return None
+    if node.namespace not in (None, '*'):
+        return None
+    # Tags are lower-cased by cssselect's HTMLTranslator.
+    tag = (node.element or '*').lower()
+    return tag, ids, classes, simple
+
+
+def _compound_xpath(translator, compound):
+    """Return an XPath step matching ``compound`` on the context node,
+    or :obj:`None` if the translated expression is not self-contained.
+
+    """
+    xpath = translator.xpath(compound)
+    if xpath.path or getattr(xpath, 'star_prefix', False):
+        # Some conditions (eg. position() in old versions of cssselect)
+        # depend on the path leading to the element.
+        return None
+    if xpath.condition:
+        return '%s[%s]' % (xpath.element, xpath.condition)
+    return xpath.element
+
+
+def _reversed_xpath(translator, tree):
+    """Return an XPath step matching ``tree`` on the context node.
+
+    The compound selectors on the left of combinators are tested with
+    predicates following the reversed axes.
+
+    """
+    if isinstance(tree, cssselect.parser.CombinedSelector):
+        right = _compound_xpath(translator, tree.subselector)
+        left = _reversed_xpath(translator, tree.selector)
+        axis = COMBINATOR_AXES.get(tree.combinator)
+        if right is None or left is None or axis is None:
+            return None
+        return '%s[%s%s]' % (right, axis, left)
+    return _compound_xpath(translator, tree)
+
+
+def depends_on_siblings(tree):
+    """Return whether the parsed cssselect selector ``tree`` may match
+    other elements when siblings are inserted, removed or changed.
+
+    This is the case with the ``+`` and ``~`` combinators and with
+    structural pseudo-classes such as ``:last-child``, even in ``:not()``.
+
+    """
+    while tree is not None:
+        if isinstance(tree, cssselect.parser.CombinedSelector):
+            if tree.combinator in ('+', '~'):
+                return True
+        elif isinstance(tree, cssselect.parser.Pseudo):
+            if tree.ident.lower() in STRUCTURAL_PSEUDO_CLASSES:
+                return True
+        elif isinstance(tree, cssselect.parser.Function):
+            if tree.name.lower() in STRUCTURAL_PSEUDO_CLASSES:
+                return True
+        subselectors = list(getattr(tree, 'selector_list', None) or [])
+        if getattr(tree, 'subselector', None) is not None:
+            subselectors.append(tree.subselector)
+        if any(depends_on_siblings(subtree) for subtree in subselectors):
+            return True
+        tree = getattr(tree, 'selector', None)
+    return False
+
+
+def _test_simple(tag, ids, classes, element):
+    if tag != '*' and element.tag != tag:
+        return False
+    if ids and any(element.get('id') != id_ for id_ in ids):
+        return False
+    return classes.issubset(CLASS_NAMES_RE.findall(element.get('class', '')))
+
+
+def _simple_test(tag, ids, classes):
+    """Return a function testing the tag, ids and classes of an element.
+
+    The function is a partial object that can be pickled with the rules of
+    stylesheets.
+
+    """
+    return functools.partial(_test_simple, tag, ids, set(classes))
+
+
+def compile_selector(translator, selector):
+    """Prepare a parsed cssselect ``selector`` for indexed matching.
+
+    Return ``(key, test)``. ``key`` is the bucket of the selector, one of
+    ``('id', id)``, ``('class', class_name)``, ``('tag', tag)`` or
+    ``('*', None)``. ``test`` is a function taking an element of the bucket
+    and returning whether it is matched, or :obj:`None` if all the elements
+    of the bucket are matched.
+
+    Return ``(None, None)`` if the selector can not be indexed.
+
+    """
+    tree = selector.parsed_tree
+    combined = isinstance(tree, cssselect.parser.CombinedSelector)
+    parts = _compound_parts(tree.subselector if combined else tree)
+    if parts is None:
+        return None, None
+    tag, ids, classes, simple = parts
+
+    if ids:
+        key = ('id', ids[0])
+    elif classes:
+        key = ('class', classes[0])
+    elif tag != '*':
+        key = ('tag', tag)
+    else:
+        key = ('*', None)
+
+    if simple and not combined:
+        if len(ids) + len(classes) + (tag != '*') <= 1:
+            # The bucket is enough
+            return key, None
+        return key, _simple_test(tag, ids, classes)
+
+    expression = _reversed_xpath(translator, tree)
+    if expression is None:
+        return None, None
+    try:
+        return key, lxml.etree.XPath('self::' + expression)
+    except (ValueError, lxml.etree.XPathError):
+        return None, None
+
+
+def match_selectors(element_tree, selectors, subtree=None):
+    """Match ``selectors`` against the elements of ``element_tree``.
+
+    :param selectors:
+        An iterable of ``(selector, data)`` tuples, where ``selector`` is a
+        :class:`weasyprint.css.Selector` object.
+    :param subtree:
+        An element of ``element_tree``. If given, only the elements of its
+        subtree are matched.
+    :returns:
+        An iterable of ``(element, data)`` tuples. For a given element, the
+        tuples are in the same order as ``selectors``. Selectors that are not
+        indexed may give other objects than elements, such as page types.
+
+    """
+    buckets = {}
+    # Elements matched by selectors that are not indexed.
+    # keys: elements, values: lists of (index, test, data) tuples.
+    matched = {}
+    elements = None
+    if subtree is not None:
+        elements = set(subtree.iter())
+    for index, (selector, data) in enumerate(selectors):
+        if selector.key is None:
+            for element in selector.match(element_tree):
+                if elements is None or element in elements:
+                    matched.setdefault(element, []).append(
+                        (index, None, data))
+        else:
+            buckets.setdefault(selector.key, []).append(
+                (index, selector.test, data))
+
+    by_index = operator.itemgetter(0)
+    universal = buckets.get(('*', None), [])
+    for element in (element_tree if subtree is None else subtree).iter():
+        tag = element.tag
+        if not isinstance(tag, basestring):
+            # Comments and processing instructions
+            continue
+        candidates = list(universal)
+        candidates.extend(buckets.get(('tag', tag), ()))
+        element_id = element.get('id')
+        if element_id:
+            candidates.extend(buckets.get(('id', element_id), ()))
+        class_names = element.get('class')
+        if class_names:
+            for class_name in set(CLASS_NAMES_RE.findall(class_names)):
+                candidates.extend(buckets.get(('class', class_name), ()))
+        candidates.extend(matched.pop(element, ()))
+        candidates.sort(key=by_index)
+        for _index, test, data in candidates:
+            if test is None or test(element):
+                yield element, data
+
+    # Objects matched by selectors that are not in the tree (eg. page types).
+    for element, candidates in matched.items():
+        for _index, _test, data in candidates:
+            yield element, data
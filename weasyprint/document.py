@@ -10,24 +10,136 @@
 
 from __future__ import division, unicode_literals
 
+import binascii
+import contextlib
 import functools
 import io
 import math
+import multiprocessing
+import os
 import shutil
+import tempfile
+import threading
 
 import cairocffi as cairo
 
 from . import CSS, images
 from .compat import FILESYSTEM_ENCODING, iteritems, izip
 from .css import get_all_computed_styles
-from .draw import draw_page, stacked
+from .draw import draw_page, make_background_tiles, stacked
 from .fonts import FontConfiguration
 from .formatting_structure import boxes
 from .formatting_structure.build import build_formatting_structure
 from .layout import layout_document
+from .layout.incremental import DocumentLayout
 from .layout.backgrounds import percentage
 from .logger import LOGGER
-from .pdf import write_pdf_metadata
+from .pdf import write_pdf
+from .prefetch import PrefetchedURLFetcher, prefetch
+from .timing import stage, timed_iter
+
+# PDF files painted by cairo are kept in memory up to this size in bytes, and
+# spooled to a temporary file above.
+PDF_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+
+@contextlib.contextmanager
+def _replacing_file(filename):
+    """Open a new file replacing ``filename`` once it is completely written.
+
+    The file is written next to ``filename`` and renamed when the context
+    exits. If an exception is raised, ``filename`` is left untouched.
+
+    """
+    if isinstance(filename, bytes):
+        filename = filename.decode(FILESYSTEM_ENCODING)
+    directory, basename = os.path.split(os.path.abspath(filename))
+    temp_filename = os.path.join(directory, '.%s.%s.tmp' % (
+        basename, binascii.hexlify(os.urandom(6)).decode('ascii')))
+    # The permissions of new files follow the umask, as with open()
+    fd = os.open(
+        temp_filename,
+        os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0),
+        0o666)
+    try:
+        with os.fdopen(fd, 'wb') as file_obj:
+            yield file_obj
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_filename)
+        # os.replace() also replaces existing files on Windows, Python 3.3+
+        getattr(os, 'replace', os.rename)(temp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+        raise
+
+
+# The document painted by worker processes, inherited when they are forked.
+_FORKED_DOCUMENT = None
+_FORK_LOCK = threading.Lock()
+
+
+def _paint_pdf(pages, file_obj, scale):
+    """Paint ``pages`` in a new PDF file written to ``file_obj``."""
+    # (1, 1) is overridden by .set_size() below.
+    surface = cairo.PDFSurface(file_obj, 1, 1)
+    context = cairo.Context(surface)
+    background_tiles = make_background_tiles()
+    for page in pages:
+        surface.set_size(
+            math.floor(page.width * scale),
+            math.floor(page.height * scale))
+        page._paint(context, scale=scale, background_tiles=background_tiles)
+        surface.show_page()
+    surface.finish()
+
+
+def _paint_forked_pdf_pages(args):
+    """Paint a range of pages of the forked document, return PDF bytes."""
+    start, stop, scale = args
+    file_obj = io.BytesIO()
+    _paint_pdf(_FORKED_DOCUMENT.pages[start:stop], file_obj, scale)
+    return file_obj.getvalue()
+
+
+def _forget_prefetched(url_fetcher):
+    """Forget the resources prefetched by ``url_fetcher`` and not used by the
+    layout of the document."""
+    if isinstance(url_fetcher, PrefetchedURLFetcher):
+        url_fetcher.clear()
+
+
+def _fork_pool(document, workers):
+    """Return a pool of ``workers`` processes forked with ``document``,
+    or :obj:`None` if processes can not be safely forked.
+
+    Processes are not forked on platforms without :func:`os.fork`, or when
+    other threads run: forked processes would inherit the locks held by
+    these threads in Pango, fontconfig or :mod:`logging`, and wait for them
+    forever.
+
+    """
+    global _FORKED_DOCUMENT
+    if not hasattr(os, 'fork'):
+        return None
+    if threading.active_count() > 1:
+        LOGGER.warning(
+            'Pages are painted in the current process, as forking workers '
+            'while other threads run may deadlock them')
+        return None
+    try:
+        context = multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2 always forks on POSIX
+        context = multiprocessing
+    with _FORK_LOCK:
+        _FORKED_DOCUMENT = document
+        try:
+            return context.Pool(workers)
+        finally:
+            _FORKED_DOCUMENT = None
 
 
 def _get_matrix(box):
@@ -221,6 +333,16 @@ class Page(object):
         :type scale: float
         :type clip: bool
 
+        """
+        self._paint(cairo_context, left_x, top_y, scale, clip)
+
+    def _paint(self, cairo_context, left_x=0, top_y=0, scale=1, clip=False,
+               background_tiles=None):
+        """Paint the page like :meth:`paint`.
+
+        Tile patterns of backgrounds are shared through ``background_tiles``
+        with the other pages painted on the same surface.
+
         """
         with stacked(cairo_context):
             if self._enable_hinting:
@@ -246,7 +368,8 @@ class Page(object):
                         cairo_context.device_to_user_distance(width, height))
                 cairo_context.rectangle(0, 0, width, height)
                 cairo_context.clip()
-            draw_page(self._page_box, cairo_context, self._enable_hinting)
+            draw_page(self._page_box, cairo_context, self._enable_hinting,
+                      background_tiles)
 
 
 class DocumentMetadata(object):
@@ -302,6 +425,73 @@ class DocumentMetadata(object):
         self.attachments = attachments or []
 
 
+class _DocumentUpdater(object):
+    """Render a document and keep what is needed to update it, see
+    :meth:`Document.update`.
+
+    """
+    def __init__(self, html, stylesheets, enable_hinting,
+                 presentational_hints):
+        self.html = html
+        self.enable_hinting = enable_hinting
+        self.presentational_hints = presentational_hints
+        # Fonts may be needed by the next updates, they are removed with
+        # the updater.
+        self.font_config = FontConfiguration()
+        with stage('prefetch'):
+            self.url_fetcher = prefetch(
+                html.root_element, html.url_fetcher, html.media_type)
+        self.user_stylesheets = [
+            css if hasattr(css, 'rules')
+            else CSS(guess=css, media_type=html.media_type)
+            for css in stylesheets or []]
+        self.style_for = self._get_all_computed_styles()
+        self.get_image_from_uri = functools.partial(
+            images.get_image_from_uri, {}, self.url_fetcher,
+            cache_url_fetcher=html.url_fetcher)
+        self._lay_out()
+        # Updates fetch their resources again
+        _forget_prefetched(self.url_fetcher)
+
+    def _get_all_computed_styles(self):
+        with stage('styles'):
+            return get_all_computed_styles(
+                self.html, presentational_hints=self.presentational_hints,
+                user_stylesheets=self.user_stylesheets,
+                font_config=self.font_config, url_fetcher=self.url_fetcher)
+
+    def _build_formatting_structure(self):
+        with stage('boxes'):
+            return build_formatting_structure(
+                self.html.root_element, self.style_for,
+                self.get_image_from_uri)
+
+    def _lay_out(self):
+        with stage('layout'):
+            self.layout = DocumentLayout(
+                self.enable_hinting, self.style_for, self.get_image_from_uri,
+                self._build_formatting_structure(), self.font_config)
+
+    def update(self, changed_elements):
+        """Compute the styles, build the boxes and lay out again."""
+        changed_elements = list(changed_elements)
+        if any(element.tag in ('style', 'link')
+               for changed_element in changed_elements
+               for element in changed_element.iter()):
+            # Stylesheets may have changed, including the styles of pages
+            self.style_for = self._get_all_computed_styles()
+            self._lay_out()
+        else:
+            with stage('styles'):
+                self.style_for.restyle(changed_elements)
+            root_box = self._build_formatting_structure()
+            with stage('layout'):
+                self.layout.update(root_box)
+
+    def __del__(self):
+        self.font_config.clean()
+
+
 class Document(object):
     """A rendered document, with access to individual pages
     ready to be painted on any cairo surfaces.
@@ -314,27 +504,74 @@ class Document(object):
     """
     @classmethod
     def _render(cls, html, stylesheets, enable_hinting,
-                presentational_hints=False):
+                presentational_hints=False, streaming=False,
+                updatable=False):
+        if updatable:
+            updater = _DocumentUpdater(
+                html, stylesheets, enable_hinting, presentational_hints)
+            with stage('pages'):
+                pages = [Page(p, enable_hinting)
+                         for p in updater.layout.decorated_pages]
+            rendering = cls(
+                pages, DocumentMetadata(**html._get_metadata()),
+                html.url_fetcher)
+            rendering._updater = updater
+            return rendering
         font_config = FontConfiguration()
-        style_for = get_all_computed_styles(
-            html, presentational_hints=presentational_hints, user_stylesheets=[
-                css if hasattr(css, 'rules')
-                else CSS(guess=css, media_type=html.media_type)
-                for css in stylesheets or []],
-            font_config=font_config)
+        with stage('prefetch'):
+            url_fetcher = prefetch(
+                html.root_element, html.url_fetcher, html.media_type)
+        with stage('styles'):
+            style_for = get_all_computed_styles(
+                html, presentational_hints=presentational_hints,
+                user_stylesheets=[
+                    css if hasattr(css, 'rules')
+                    else CSS(guess=css, media_type=html.media_type)
+                    for css in stylesheets or []],
+                font_config=font_config, url_fetcher=url_fetcher)
         get_image_from_uri = functools.partial(
-            images.get_image_from_uri, {}, html.url_fetcher)
-        page_boxes = layout_document(
-            enable_hinting, style_for, get_image_from_uri,
-            build_formatting_structure(
-                html.root_element, style_for, get_image_from_uri),
-            font_config)
+            images.get_image_from_uri, {}, url_fetcher,
+            cache_url_fetcher=html.url_fetcher)
+        with stage('boxes'):
+            root_box = build_formatting_structure(
+                html.root_element, style_for, get_image_from_uri)
+        page_boxes = timed_iter('layout', layout_document(
+            enable_hinting, style_for, get_image_from_uri, root_box,
+            font_config, streaming))
+        if streaming:
+            rendering = cls(
+                [], DocumentMetadata(**html._get_metadata()),
+                html.url_fetcher)
+            rendering._streamed_pages = rendering._stream_pages(
+                page_boxes, enable_hinting, font_config, url_fetcher)
+            return rendering
+        pages = []
+        for page_box in page_boxes:
+            with stage('pages'):
+                pages.append(Page(page_box, enable_hinting))
+        _forget_prefetched(url_fetcher)
         rendering = cls(
-            [Page(p, enable_hinting) for p in page_boxes],
-            DocumentMetadata(**html._get_metadata()), html.url_fetcher)
+            pages, DocumentMetadata(**html._get_metadata()), html.url_fetcher)
         font_config.clean()
         return rendering
 
+    def _stream_pages(self, page_boxes, enable_hinting, font_config,
+                      url_fetcher):
+        """Yield pages as they are laid out, to be painted once.
+
+        Painted pages are added to :attr:`pages` without their boxes, so
+        that only their size, links, anchors and bookmarks are kept.
+
+        """
+        for page_box in page_boxes:
+            with stage('pages'):
+                page = Page(page_box, enable_hinting)
+            yield page
+            page._page_box = None
+            self.pages.append(page)
+        _forget_prefetched(url_fetcher)
+        font_config.clean()
+
     def __init__(self, pages, metadata, url_fetcher):
         #: A list of :class:`Page` objects.
         self.pages = pages
@@ -345,6 +582,39 @@ class Document(object):
         #: A ``url_fetcher`` for resources that have to be read when writing
         #: the output.
         self.url_fetcher = url_fetcher
+        # Pages not laid out yet, see _render()
+        self._streamed_pages = None
+        # What is needed by update(), see _render()
+        self._updater = None
+
+    def update(self, changed_elements):
+        """Lay out the document again after changes in some of its elements.
+
+        Only the styles of the changed elements and of their descendants are
+        computed again, and only the pages that may have changed are laid
+        out again, from the first page showing a changed element until the
+        layout gets back to the previous page breaks.
+
+        :param changed_elements:
+            An iterable of elements in the ``root_element`` tree of the
+            rendered :class:`~weasyprint.HTML` object, whose attributes,
+            text or children have been modified.
+        :raises:
+            :exc:`ValueError` if the document was not rendered with
+            ``updatable=True``, see :meth:`HTML.render
+            <weasyprint.HTML.render>`.
+
+        """
+        if self._updater is None:
+            raise ValueError(
+                'Only documents rendered with updatable=True can be updated')
+        pages = dict(izip(self._updater.layout.decorated_pages, self.pages))
+        self._updater.update(changed_elements)
+        self.pages = [
+            pages.get(page_box) or Page(page_box, self._updater.enable_hinting)
+            for page_box in self._updater.layout.decorated_pages]
+        self.metadata = DocumentMetadata(
+            **self._updater.html._get_metadata())
 
     def copy(self, pages='all'):
         """Take a subset of the pages.
@@ -461,7 +731,8 @@ class Document(object):
                 last_by_depth.append(children)
         return root
 
-    def write_pdf(self, target=None, zoom=1, attachments=None):
+    def write_pdf(self, target=None, zoom=1, attachments=None, workers=1,
+                  object_streams=False):
         """Paint the pages in a PDF file, with meta-data.
 
         PDF files written directly by cairo do not have meta-data such as
@@ -469,6 +740,9 @@ class Document(object):
 
         :param target:
             A filename, file-like object, or :obj:`None`.
+            The PDF is written once, in order: file-like objects do not need
+            to be seekable. Existing files are only replaced when the PDF is
+            successfully written.
         :type zoom: float
         :param zoom:
             The zoom factor in PDF units per CSS units.
@@ -480,6 +754,19 @@ class Document(object):
         :param attachments: A list of additional file attachments for the
             generated PDF document or :obj:`None`. The list's elements are
             :class:`Attachment` objects, filenames, URLs or file-like objects.
+        :type workers: int
+        :param workers:
+            The number of processes painting pages in parallel. With more
+            than one worker, page ranges are painted in forked processes and
+            the resulting PDF files are merged. Fonts used on many pages are
+            then embedded once per range. Ignored on platforms without
+            :func:`os.fork`, and with a warning when other threads run in
+            the current process, as forking them is not safe.
+        :type object_streams: bool
+        :param object_streams:
+            Whether the objects added for metadata, links and bookmarks are
+            packed in compressed object streams, with a cross-reference
+            stream. Files are smaller, but require PDF 1.5.
         :returns:
             The PDF as byte string if :obj:`target` is :obj:`None`, otherwise
             :obj:`None` (the PDF is written to :obj:`target`.)
@@ -487,32 +774,58 @@ class Document(object):
         """
         # 0.75 = 72 PDF point (cairo units) per inch / 96 CSS pixel per inch
         scale = zoom * 0.75
-        # Use an in-memory buffer. We will need to seek for metadata
-        # TODO: avoid this if target can seek? Benchmark first.
-        file_obj = io.BytesIO()
-        # (1, 1) is overridden by .set_size() below.
-        surface = cairo.PDFSurface(file_obj, 1, 1)
-        context = cairo.Context(surface)
-        for page in self.pages:
-            surface.set_size(
-                math.floor(page.width * scale),
-                math.floor(page.height * scale))
-            page.paint(context, scale=scale)
-            surface.show_page()
-        surface.finish()
-
-        write_pdf_metadata(self, file_obj, scale, self.metadata, attachments,
-                           self.url_fetcher)
-
         if target is None:
+            file_obj = io.BytesIO()
+            self._write_pdf(
+                file_obj, scale, attachments, workers, object_streams)
             return file_obj.getvalue()
+        elif not hasattr(target, 'write'):
+            with _replacing_file(target) as file_obj:
+                self._write_pdf(
+                    file_obj, scale, attachments, workers, object_streams)
+        else:
+            self._write_pdf(
+                target, scale, attachments, workers, object_streams)
+
+    def _write_pdf(self, file_obj, scale, attachments, workers,
+                   object_streams):
+        """Paint the pages and write the PDF with its metadata to
+        ``file_obj``.
+
+        """
+        pool = None
+        if self._streamed_pages is not None:
+            # Pages are painted as soon as they are laid out
+            pages, self._streamed_pages = self._streamed_pages, None
         else:
-            file_obj.seek(0)
-            if hasattr(target, 'write'):
-                shutil.copyfileobj(file_obj, target)
+            pages = self.pages
+            if workers > 1 and len(pages) > 1:
+                pool = _fork_pool(self, workers)
+        with stage('paint'):
+            if pool is None:
+                source = tempfile.SpooledTemporaryFile(
+                    max_size=PDF_SPOOL_MAX_SIZE)
+                _paint_pdf(pages, source, scale)
+                sources = [source]
             else:
-                with open(target, 'wb') as fd:
-                    shutil.copyfileobj(file_obj, fd)
+                chunk_size = -(-len(self.pages) // workers)  # Round up
+                try:
+                    chunks = pool.map(_paint_forked_pdf_pages, [
+                        (start, start + chunk_size, scale)
+                        for start in range(0, len(self.pages), chunk_size)])
+                    pool.close()
+                    pool.join()
+                finally:
+                    pool.terminate()
+                sources = [io.BytesIO(chunk) for chunk in chunks]
+
+        try:
+            with stage('pdf'):
+                write_pdf(self, sources, file_obj, scale, self.metadata,
+                          attachments, self.url_fetcher, object_streams)
+        finally:
+            for source in sources:
+                source.close()
 
     def write_image_surface(self, resolution=96):
         dppx = resolution / 96
@@ -530,11 +843,14 @@ class Document(object):
         surface = cairo.ImageSurface(
             cairo.FORMAT_ARGB32, max_width, sum_heights)
         context = cairo.Context(surface)
+        background_tiles = make_background_tiles()
         pos_y = 0
-        for page, width, height in izip(self.pages, widths, heights):
-            pos_x = (max_width - width) / 2
-            page.paint(context, pos_x, pos_y, scale=dppx, clip=True)
-            pos_y += height
+        with stage('paint'):
+            for page, width, height in izip(self.pages, widths, heights):
+                pos_x = (max_width - width) / 2
+                page._paint(context, pos_x, pos_y, scale=dppx, clip=True,
+                            background_tiles=background_tiles)
+                pos_y += height
         return surface, max_width, sum_heights
 
     def write_png(self, target=None, resolution=96):
@@ -559,11 +875,12 @@ class Document(object):
 
         """
         surface, max_width, sum_heights = self.write_image_surface(resolution)
-        if target is None:
-            target = io.BytesIO()
-            surface.write_to_png(target)
-            png_bytes = target.getvalue()
-        else:
-            surface.write_to_png(target)
-            png_bytes = None
+        with stage('png'):
+            if target is None:
+                target = io.BytesIO()
+                surface.write_to_png(target)
+                png_bytes = target.getvalue()
+            else:
+                surface.write_to_png(target)
+                png_bytes = None
         return png_bytes, max_width, sum_heights
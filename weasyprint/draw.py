@@ -18,6 +18,7 @@ import operator
 
 import cairocffi as cairo
 
+from .caches import LRUCache
 from .compat import xrange
 from .formatting_structure import boxes
 from .stacking import StackingContext
@@ -25,6 +26,9 @@ from .text import show_first_line
 
 SIDES = ('top', 'right', 'bottom', 'left')
 
+# Maximum number of tile patterns kept while painting a surface
+BACKGROUND_TILES_SIZE = 64
+
 
 @contextlib.contextmanager
 def stacked(context):
@@ -89,22 +93,33 @@ def lighten(color):
     return hsv2rgb(hue, saturation, value) + (color.alpha,)
 
 
-def draw_page(page, context, enable_hinting):
-    """Draw the given PageBox."""
+def draw_page(page, context, enable_hinting, background_tiles=None):
+    """Draw the given PageBox.
+
+    ``background_tiles`` is a cache of tile patterns shared by the pages
+    painted on the same surface, see :func:`make_background_tiles`.
+
+    """
+    if background_tiles is None:
+        background_tiles = make_background_tiles()
     stacking_context = StackingContext.from_page(page)
     draw_background(
         context, stacking_context.box.background, enable_hinting,
-        clip_box=False)
+        background_tiles, clip_box=False)
     draw_background(
-        context, page.canvas_background, enable_hinting, clip_box=False)
+        context, page.canvas_background, enable_hinting, background_tiles,
+        clip_box=False)
     draw_border(context, page, enable_hinting)
-    draw_stacking_context(context, stacking_context, enable_hinting)
+    draw_stacking_context(
+        context, stacking_context, enable_hinting, background_tiles)
 
 
-def draw_box_background_and_border(context, page, box, enable_hinting):
-    draw_background(context, box.background, enable_hinting)
+def draw_box_background_and_border(context, page, box, enable_hinting,
+                                   background_tiles):
+    draw_background(context, box.background, enable_hinting, background_tiles)
     if isinstance(box, boxes.TableBox):
-        draw_table_backgrounds(context, page, box, enable_hinting)
+        draw_table_backgrounds(
+            context, page, box, enable_hinting, background_tiles)
         if box.style.border_collapse == 'separate':
             draw_border(context, box, enable_hinting)
             for row_group in box.children:
@@ -118,7 +133,8 @@ def draw_box_background_and_border(context, page, box, enable_hinting):
         draw_border(context, box, enable_hinting)
 
 
-def draw_stacking_context(context, stacking_context, enable_hinting):
+def draw_stacking_context(context, stacking_context, enable_hinting,
+                          background_tiles):
     """Draw a ``stacking_context`` on ``context``."""
     # See http://www.w3.org/TR/CSS2/zindex.html
     with stacked(context):
@@ -158,7 +174,8 @@ def draw_stacking_context(context, stacking_context, enable_hinting):
                             boxes.InlineBlockBox, boxes.TableCellBox)):
             # The canvas background was removed by set_canvas_background
             draw_box_background_and_border(
-                context, stacking_context.page, box, enable_hinting)
+                context, stacking_context.page, box, enable_hinting,
+                background_tiles)
 
         with stacked(context):
             if box.style.overflow != 'visible':
@@ -170,21 +187,25 @@ def draw_stacking_context(context, stacking_context, enable_hinting):
 
             # Point 3
             for child_context in stacking_context.negative_z_contexts:
-                draw_stacking_context(context, child_context, enable_hinting)
+                draw_stacking_context(
+                    context, child_context, enable_hinting, background_tiles)
 
             # Point 4
             for block in stacking_context.block_level_boxes:
                 draw_box_background_and_border(
-                    context, stacking_context.page, block, enable_hinting)
+                    context, stacking_context.page, block, enable_hinting,
+                    background_tiles)
 
             # Point 5
             for child_context in stacking_context.float_contexts:
-                draw_stacking_context(context, child_context, enable_hinting)
+                draw_stacking_context(
+                    context, child_context, enable_hinting, background_tiles)
 
             # Point 6
             if isinstance(box, boxes.InlineBox):
                 draw_inline_level(
-                    context, stacking_context.page, box, enable_hinting)
+                    context, stacking_context.page, box, enable_hinting,
+                    background_tiles)
 
             # Point 7
             for block in [box] + stacking_context.blocks_and_cells:
@@ -192,7 +213,7 @@ def draw_stacking_context(context, stacking_context, enable_hinting):
                 if marker_box:
                     draw_inline_level(
                         context, stacking_context.page, marker_box,
-                        enable_hinting)
+                        enable_hinting, background_tiles)
 
                 if isinstance(block, boxes.ReplacedBox):
                     draw_replacedbox(context, block)
@@ -202,15 +223,17 @@ def draw_stacking_context(context, stacking_context, enable_hinting):
                             # TODO: draw inline tables
                             draw_inline_level(
                                 context, stacking_context.page, child,
-                                enable_hinting)
+                                enable_hinting, background_tiles)
 
             # Point 8
             for child_context in stacking_context.zero_z_contexts:
-                draw_stacking_context(context, child_context, enable_hinting)
+                draw_stacking_context(
+                    context, child_context, enable_hinting, background_tiles)
 
             # Point 9
             for child_context in stacking_context.positive_z_contexts:
-                draw_stacking_context(context, child_context, enable_hinting)
+                draw_stacking_context(
+                    context, child_context, enable_hinting, background_tiles)
 
         # Point 10
         draw_outlines(context, box, enable_hinting)
@@ -261,7 +284,8 @@ def rounded_box_path(context, radii):
         context.restore()
 
 
-def draw_background(context, bg, enable_hinting, clip_box=True):
+def draw_background(context, bg, enable_hinting, background_tiles,
+                    clip_box=True):
     """Draw the background color and image to a ``cairo.Context``.
 
     If ``clip_box`` is set to ``False``, the background is not clipped to the
@@ -293,26 +317,34 @@ def draw_background(context, bg, enable_hinting, clip_box=True):
 
         # Paint in reversed order: first layer is "closest" to the viewer.
         for layer in reversed(bg.layers):
-            draw_background_image(context, layer, bg.image_rendering)
+            draw_background_image(
+                context, layer, bg.image_rendering, background_tiles)
 
 
-def draw_table_backgrounds(context, page, table, enable_hinting):
+def draw_table_backgrounds(context, page, table, enable_hinting,
+                           background_tiles):
     """Draw the background color and image of the table children."""
     for column_group in table.column_groups:
-        draw_background(context, column_group.background, enable_hinting)
+        draw_background(
+            context, column_group.background, enable_hinting, background_tiles)
         for column in column_group.children:
-            draw_background(context, column.background, enable_hinting)
+            draw_background(
+                context, column.background, enable_hinting, background_tiles)
     for row_group in table.children:
-        draw_background(context, row_group.background, enable_hinting)
+        draw_background(
+            context, row_group.background, enable_hinting, background_tiles)
         for row in row_group.children:
-            draw_background(context, row.background, enable_hinting)
+            draw_background(
+                context, row.background, enable_hinting, background_tiles)
             for cell in row.children:
                 if table.style.border_collapse == 'collapse' or (
                         cell.style.empty_cells == 'show' or not cell.empty):
-                    draw_background(context, cell.background, enable_hinting)
+                    draw_background(
+                        context, cell.background, enable_hinting,
+                        background_tiles)
 
 
-def draw_background_image(context, layer, image_rendering):
+def draw_background_image(context, layer, image_rendering, background_tiles):
     # Background image
     if layer.image is None:
         return
@@ -352,13 +384,9 @@ def draw_background_image(context, layer, image_rendering):
         else:
             repeat_height = image_height
 
-    sub_surface = cairo.PDFSurface(None, repeat_width, repeat_height)
-    sub_context = cairo.Context(sub_surface)
-    sub_context.rectangle(0, 0, image_width, image_height)
-    sub_context.clip()
-    layer.image.draw(sub_context, image_width, image_height, image_rendering)
-    pattern = cairo.SurfacePattern(sub_surface)
-    pattern.set_extend(cairo.EXTEND_REPEAT)
+    pattern = background_tile_pattern(
+        background_tiles, layer.image, image_width, image_height,
+        repeat_width, repeat_height, image_rendering)
 
     with stacked(context):
         if not layer.unbounded:
@@ -373,6 +401,42 @@ def draw_background_image(context, layer, image_rendering):
         context.paint()
 
 
+def make_background_tiles():
+    """Return a new cache of tile patterns, for the pages painted on the same
+    surface.
+
+    The cache must not outlive the painting of the surface: its patterns keep
+    their images and their tiles alive.
+
+    """
+    return LRUCache(maxsize=BACKGROUND_TILES_SIZE)
+
+
+def background_tile_pattern(background_tiles, image, image_width,
+                            image_height, repeat_width, repeat_height,
+                            image_rendering):
+    """Return a repeating pattern of ``image`` drawn on a tile.
+
+    Patterns are shared through ``background_tiles`` by the backgrounds with
+    the same image, size and repeat geometry, so that their tile is drawn and
+    embedded only once.
+
+    """
+    key = (image, image_width, image_height, repeat_width, repeat_height,
+           image_rendering)
+    pattern = background_tiles.get(key)
+    if pattern is None:
+        sub_surface = cairo.PDFSurface(None, repeat_width, repeat_height)
+        sub_context = cairo.Context(sub_surface)
+        sub_context.rectangle(0, 0, image_width, image_height)
+        sub_context.clip()
+        image.draw(sub_context, image_width, image_height, image_rendering)
+        pattern = cairo.SurfacePattern(sub_surface)
+        pattern.set_extend(cairo.EXTEND_REPEAT)
+        background_tiles.set(key, pattern)
+    return pattern
+
+
 def xy_offset(x, y, offset_x, offset_y, offset):
     """Increment X and Y coordinates by the given offsets."""
     return x + offset_x * offset, y + offset_y * offset
@@ -867,20 +931,23 @@ def draw_replacedbox(context, box):
             context, box.width, box.height, box.style.image_rendering)
 
 
-def draw_inline_level(context, page, box, enable_hinting):
+def draw_inline_level(context, page, box, enable_hinting, background_tiles):
     if isinstance(box, StackingContext):
         stacking_context = box
         assert isinstance(stacking_context.box, boxes.InlineBlockBox)
-        draw_stacking_context(context, stacking_context, enable_hinting)
+        draw_stacking_context(
+            context, stacking_context, enable_hinting, background_tiles)
     else:
-        draw_background(context, box.background, enable_hinting)
+        draw_background(
+            context, box.background, enable_hinting, background_tiles)
         draw_border(context, box, enable_hinting)
         if isinstance(box, (boxes.InlineBox, boxes.LineBox)):
             for child in box.children:
                 if isinstance(child, boxes.TextBox):
                     draw_text(context, child, enable_hinting)
                 else:
-                    draw_inline_level(context, page, child, enable_hinting)
+                    draw_inline_level(
+                        context, page, child, enable_hinting, background_tiles)
         elif isinstance(box, boxes.InlineReplacedBox):
             draw_replacedbox(context, box)
         else:
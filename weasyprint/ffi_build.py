@@ -0,0 +1,54 @@
+# coding: utf-8
+"""
+    weasyprint.ffi_build
+    --------------------
+
+    Build an out-of-line cffi module with the C declarations used by
+    WeasyPrint, so that they are not parsed again by each new process::
+
+        python -m weasyprint.ffi_build
+
+    The ``weasyprint._ffi`` module is optional: without it, or when it has
+    been built for other declarations, the declarations are parsed the first
+    time Pango is needed.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division
+
+import os.path
+import sys
+
+import cffi
+
+from . import fonts  # noqa, declares the FontConfig functions
+from .text import ffi as lazy_ffi
+
+# XXX No unicode_literals, cffi likes native strings
+
+
+def build(directory=None):
+    """Write the ``weasyprint._ffi`` module and return its filename.
+
+    The module is written in the ``weasyprint`` package, found in
+    ``directory``. By default, this package is the one of this module.
+
+    """
+    if directory is None:
+        directory = os.path.dirname(os.path.dirname(os.path.abspath(
+            __file__)))
+    ffi = cffi.FFI()
+    ffi.set_source('weasyprint._ffi', None)
+    for declarations in lazy_ffi.declarations:
+        ffi.cdef(declarations)
+    filename = ffi.compile(tmpdir=directory)
+    with open(filename, 'a') as fd:
+        fd.write('\nDECLARATIONS_HASH = %r\n' % lazy_ffi.declarations_hash())
+    return filename
+
+
+if __name__ == '__main__':
+    sys.stdout.write(build() + '\n')
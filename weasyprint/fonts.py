@@ -20,7 +20,7 @@ import warnings
 from .compat import FILESYSTEM_ENCODING
 from .logger import LOGGER
 from .text import (
-    cairo, dlopen, ffi, get_font_features, gobject, pango, pangocairo)
+    LazyLibrary, cairo, ffi, get_font_features, gobject, pango, pangocairo)
 from .urls import fetch
 
 # XXX No unicode_literals, cffi likes native strings
@@ -42,8 +42,6 @@ class FontConfiguration:
 
 if sys.platform.startswith('win'):
     warnings.warn('@font-face is currently not supported on Windows')
-elif pango.pango_version() < 13800:
-    warnings.warn('@font-face support needs Pango >= 1.38')
 else:
     ffi.cdef('''
         // FontConfig
@@ -103,10 +101,12 @@ else:
             cairo_font_type_t fonttype);
     ''')
 
-    fontconfig = dlopen(ffi, 'fontconfig', 'libfontconfig',
-                        'libfontconfig.so.1', 'libfontconfig-1.dylib')
-    pangoft2 = dlopen(ffi, 'pangoft2-1.0', 'libpangoft2-1.0-0',
-                      'libpangoft2-1.0.so', 'libpangoft2-1.0.dylib')
+    fontconfig = LazyLibrary(
+        ffi, ('fontconfig', 'libfontconfig', 'libfontconfig.so.1',
+              'libfontconfig-1.dylib'))
+    pangoft2 = LazyLibrary(
+        ffi, ('pangoft2-1.0', 'libpangoft2-1.0-0', 'libpangoft2-1.0.so',
+              'libpangoft2-1.0.dylib'), requires=(pango,))
 
     FONTCONFIG_WEIGHT_CONSTANTS = {
         'normal': 'normal',
@@ -149,6 +149,13 @@ else:
                     how-to-use-custom-application-fonts.html
 
             """
+            self._filenames = []
+            # Pango is checked here rather than at import time, not to load
+            # the library before it is needed.
+            if pango.pango_version() < 13800:
+                warnings.warn('@font-face support needs Pango >= 1.38')
+                self.font_map = None
+                return
             self._fontconfig_config = ffi.gc(
                 fontconfig.FcInitLoadConfigAndFonts(),
                 fontconfig.FcConfigDestroy)
@@ -161,9 +168,10 @@ else:
                 self._fontconfig_config)
             # pango_fc_font_map_set_config keeps a reference to config
             fontconfig.FcConfigDestroy(self._fontconfig_config)
-            self._filenames = []
 
         def add_font_face(self, rule_descriptors, url_fetcher):
+            if self.font_map is None:
+                return
             for font_type, url in rule_descriptors['src']:
                 if font_type in ('external', 'local'):
                     config = self._fontconfig_config
@@ -80,6 +80,9 @@ class Box(object):
     is_table_wrapper = False
     is_for_root_element = False
     transformation_matrix = None
+    # Set on floats by weasyprint.layout.float.ExcludedShapes, counting the
+    # moves of the shapes it indexes.
+    excluded_shapes_moves = None
 
     # Default, overriden on some subclasses
     def all_children(self):
@@ -115,6 +118,10 @@ class Box(object):
             new_box.style = self.style
         return new_box
 
+    def deepcopy(self):
+        """Return a copy of the box with recursive copies of its children."""
+        return self.copy()
+
     def translate(self, dx=0, dy=0):
         """Change the box’s position.
 
@@ -124,6 +131,8 @@ class Box(object):
         # Overridden in ParentBox to also translate children, if any.
         self.position_x += dx
         self.position_y += dy
+        if self.excluded_shapes_moves is not None:
+            self.excluded_shapes_moves[0] += 1
         for child in self.all_children():
             child.translate(dx, dy)
 
@@ -302,6 +311,9 @@ class ParentBox(Box):
         setattr(self, 'padding_%s' % side, 0)
         setattr(self, 'border_%s_width' % side, 0)
 
+        # The style may be shared with other boxes and with the cache of
+        # computed styles, change a copy.
+        self.style = self.style.copy()
         self.style['margin_%s' % side] = ZERO_PIXELS
         self.style['padding_%s' % side] = ZERO_PIXELS
         self.style['border_%s_width' % side] = 0
@@ -321,6 +333,11 @@ class ParentBox(Box):
         new_box._remove_decoration(not is_start, not is_end)
         return new_box
 
+    def deepcopy(self):
+        result = self.copy()
+        result.children = tuple(child.deepcopy() for child in self.children)
+        return result
+
     def descendants(self):
         """A flat generator for a box, its children and descendants."""
         yield self
@@ -528,6 +545,12 @@ class TableBox(BlockLevelBox, ParentBox):
             position + dx for position in self.column_positions]
         return super(TableBox, self).translate(dx, dy)
 
+    def deepcopy(self):
+        result = super(TableBox, self).deepcopy()
+        result.column_groups = tuple(
+            column_group.deepcopy() for column_group in self.column_groups)
+        return result
+
 
 class InlineTableBox(TableBox):
     """Box for elements with ``display: inline-table``"""
@@ -55,10 +55,11 @@ def build_formatting_structure(element_tree, style_for, get_image_from_uri):
         def root_style_for(element, pseudo_type=None):
             style = style_for(element, pseudo_type)
             if style:
+                style = style.copy()
                 if element.getparent() is None:
-                    style.display = 'block'
+                    style['display'] = 'block'
                 else:
-                    style.display = 'none'
+                    style['display'] = 'none'
             return style
         box, = element_to_box(element_tree, root_style_for, get_image_from_uri)
     box.is_for_root_element = True
@@ -72,13 +73,16 @@ def build_formatting_structure(element_tree, style_for, get_image_from_uri):
 
 
 def make_box(element_tag, sourceline, style, content, get_image_from_uri):
+    # The style may be shared with other elements: copy it before changing it.
     if (style.display in ('table', 'inline-table') and
             style.border_collapse == 'collapse'):
         # Padding do not apply
+        style = style.copy()
         for side in ['top', 'bottom', 'left', 'right']:
             style['padding_' + side] = ZERO_PIXELS
     if style.display.startswith('table-') and style.display != 'table-caption':
         # Margins do not apply
+        style = style.copy()
         for side in ['top', 'bottom', 'left', 'right']:
             style['margin_' + side] = ZERO_PIXELS
 
@@ -294,6 +298,13 @@ def replace_content_lists(element, box, style, counter_values):
     ``bookmark-label``.
 
     """
+    if style.string_set == 'none' and style.bookmark_level == 'none':
+        # Nothing to replace: keep the style, that may be shared with
+        # other elements.
+        return
+    # The strings depend on the element: give the box its own style.
+    box.style = style.copy()
+
     string_set = []
     if style.string_set != 'none':
         for i, (string_name, string_values) in enumerate(style.string_set):
@@ -756,7 +767,12 @@ def collapse_table_borders(table, grid_width, grid_height):
         style['border_%s_width' % side] = twice_width / 2
         style['border_%s_color' % side] = transparent
 
+    def own_style(box):
+        # Computed styles may be shared between elements.
+        box.style = box.style.copy()
+
     def remove_borders(box):
+        own_style(box)
         set_transparent_border(box, 'top', 0)
         set_transparent_border(box, 'right', 0)
         set_transparent_border(box, 'bottom', 0)
@@ -777,6 +793,7 @@ def collapse_table_borders(table, grid_width, grid_height):
         for row in row_group.children:
             remove_borders(row)
             for cell in row.children:
+                own_style(cell)
                 set_transparent_border(cell, 'top', max_horizontal_width(
                     x=cell.grid_x, y=grid_y, w=cell.colspan))
                 set_transparent_border(cell, 'bottom', max_horizontal_width(
@@ -17,30 +17,130 @@
 
 from __future__ import division, unicode_literals
 
+import hashlib
 import logging
 import os.path
 import re
 import sys
+import tempfile
+import threading
 
-from . import CSS
+from . import CSS, VERSION
 from .compat import urljoin, xrange
-from .css import get_child_text
+from .css import SNAPSHOT_FORMAT, dump_rules, get_child_text, load_rules
 from .formatting_structure import boxes
 from .logger import LOGGER
 from .urls import get_url_attribute
 
-# XXX temporarily disable logging for user-agent stylesheet
-level = LOGGER.level
-LOGGER.setLevel(logging.ERROR)
-
 if hasattr(sys, "frozen"):
     root = os.path.dirname(sys.executable)
 else:
     root = os.path.dirname(__file__)
-HTML5_UA_STYLESHEET = CSS(filename=os.path.join(root, 'css', 'html5_ua.css'))
-HTML5_PH_STYLESHEET = CSS(filename=os.path.join(root, 'css', 'html5_ph.css'))
 
-LOGGER.setLevel(level)
+# User-agent and presentational hints stylesheets, keyed by filename and
+# parsed on first use by html5_ua_stylesheet() and html5_ph_stylesheet().
+HTML5_STYLESHEETS = {}
+HTML5_STYLESHEETS_LOCK = threading.Lock()
+
+# Directory where the preprocessed rules of the HTML5 stylesheets are
+# pickled, so that other processes do not parse the stylesheets again.
+# Snapshots are disabled if set to None.
+HTML5_SNAPSHOTS_DIRECTORY = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or
+    os.path.join(os.path.expanduser('~'), '.cache'), 'weasyprint')
+
+# Sources of the objects pickled in snapshots, in the css package.
+SNAPSHOT_SOURCES = (
+    '__init__.py', 'computed_values.py', 'properties.py', 'selectors.py',
+    'validation.py')
+
+
+def html5_stylesheet(filename):
+    """Return the :class:`CSS` object of an HTML5 stylesheet, loaded on
+    first use."""
+    with HTML5_STYLESHEETS_LOCK:
+        if filename not in HTML5_STYLESHEETS:
+            HTML5_STYLESHEETS[filename] = _load_html5_stylesheet(filename)
+        return HTML5_STYLESHEETS[filename]
+
+
+def _load_html5_stylesheet(filename):
+    """Load an HTML5 stylesheet from its snapshot if available, or parse it
+    and write its snapshot."""
+    path = os.path.join(root, 'css', filename)
+    snapshot = None
+    if HTML5_SNAPSHOTS_DIRECTORY is not None:
+        with open(path, 'rb') as fd:
+            digest = hashlib.sha1(fd.read())
+        # Snapshots depend on the stylesheet and its location, used to
+        # resolve URLs, on the code of the pickled objects, and on the
+        # versions of WeasyPrint, of the snapshot format and of Python.
+        for source in SNAPSHOT_SOURCES:
+            try:
+                with open(os.path.join(root, 'css', source), 'rb') as fd:
+                    digest.update(fd.read())
+            except IOError:
+                # Sources are not available in frozen executables
+                pass
+        digest.update(('%s %s %s %s' % (
+            path, VERSION, SNAPSHOT_FORMAT, sys.version_info[:2])
+        ).encode('utf-8'))
+        snapshot = os.path.join(HTML5_SNAPSHOTS_DIRECTORY, '%s-%s.pickle' % (
+            os.path.splitext(filename)[0], digest.hexdigest()))
+        try:
+            with open(snapshot, 'rb') as fd:
+                rules = load_rules(fd)
+        except Exception:
+            # Missing or broken snapshot, parse the stylesheet
+            pass
+        else:
+            stylesheet = CSS(string='', base_url=path)
+            stylesheet.rules = rules
+            return stylesheet
+
+    # XXX temporarily disable logging for user-agent stylesheet
+    level = LOGGER.level
+    LOGGER.setLevel(logging.ERROR)
+    try:
+        stylesheet = CSS(filename=path)
+    finally:
+        LOGGER.setLevel(level)
+    if snapshot is not None:
+        _write_snapshot(stylesheet.rules, snapshot)
+    return stylesheet
+
+
+def _write_snapshot(rules, snapshot):
+    """Pickle ``rules`` in the ``snapshot`` file.
+
+    The file is written atomically, as other processes may read it. Errors
+    are ignored, snapshots are only used to start faster.
+
+    """
+    directory = os.path.dirname(snapshot)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, temporary = tempfile.mkstemp(dir=directory)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as file_obj:
+            dump_rules(rules, file_obj)
+        os.rename(temporary, snapshot)
+    except Exception:
+        # Unwritable directory, or snapshot already written on Windows
+        os.remove(temporary)
+
+
+def html5_ua_stylesheet():
+    """Return the HTML5 user-agent stylesheet."""
+    return html5_stylesheet('html5_ua.css')
+
+
+def html5_ph_stylesheet():
+    """Return the HTML5 presentational hints stylesheet."""
+    return html5_stylesheet('html5_ph.css')
 
 
 # http://whatwg.org/C#space-character
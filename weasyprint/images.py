@@ -12,30 +12,25 @@
 
 from __future__ import division, unicode_literals
 
+import hashlib
 import math
+import threading
 from io import BytesIO
 from xml.etree import ElementTree
 
 import cairocffi
-import cairosvg.parser
-import cairosvg.surface
 
+from .caches import LRUCache
 from .compat import xrange
 from .logger import LOGGER
+from .timing import timed
 from .urls import URLFetchingError, fetch
 
-try:
-    from cairocffi import pixbuf
-except OSError:
-    pixbuf = None
-
-assert cairosvg.surface.cairo is cairocffi, (
-    'CairoSVG is using pycairo instead of cairocffi. '
-    'Make sure it is not imported before WeasyPrint.')
-
-
 CAIRO_HAS_MIME_DATA = cairocffi.cairo_version() >= 11000
 
+# Maximum number of sizes for which each SVG image keeps a rendered surface.
+SVG_SURFACES_PER_IMAGE = 8
+
 # Map values of the image-rendering property to cairo FILTER values:
 # Values are normalized to lower case.
 IMAGE_RENDERING_TO_FILTER = {
@@ -86,15 +81,56 @@ class RasterImage(object):
             context.paint()
 
 
-class ScaledSVGSurface(cairosvg.surface.SVGSurface):
+# Modules imported on first use, as they are slow to import and not needed
+# by all documents. See import_cairosvg() and import_pixbuf().
+LAZY_IMPORTS = {}
+LAZY_IMPORTS_LOCK = threading.Lock()
+
+
+def import_cairosvg():
+    """Import CairoSVG on first use.
+
+    Return the ``cairosvg`` package and the ``ScaledSVGSurface`` class.
+
     """
-    Have the cairo Surface object have intrinsic dimension
-    in pixels instead of points.
+    with LAZY_IMPORTS_LOCK:
+        if 'cairosvg' not in LAZY_IMPORTS:
+            import cairosvg.parser
+            import cairosvg.surface
+
+            assert cairosvg.surface.cairo is cairocffi, (
+                'CairoSVG is using pycairo instead of cairocffi. '
+                'Make sure it is not imported before WeasyPrint.')
+
+            class ScaledSVGSurface(cairosvg.surface.SVGSurface):
+                """
+                Have the cairo Surface object have intrinsic dimension
+                in pixels instead of points.
+                """
+                @property
+                def device_units_per_user_units(self):
+                    scale = super(
+                        ScaledSVGSurface, self).device_units_per_user_units
+                    return scale / 0.75
+
+            LAZY_IMPORTS['cairosvg'] = cairosvg, ScaledSVGSurface
+        return LAZY_IMPORTS['cairosvg']
+
+
+def import_pixbuf():
+    """Import the GDK-Pixbuf module of cairocffi on first use.
+
+    Return :obj:`None` if GDK-Pixbuf is not available.
+
     """
-    @property
-    def device_units_per_user_units(self):
-        scale = super(ScaledSVGSurface, self).device_units_per_user_units
-        return scale / 0.75
+    with LAZY_IMPORTS_LOCK:
+        if 'pixbuf' not in LAZY_IMPORTS:
+            try:
+                from cairocffi import pixbuf
+            except OSError:
+                pixbuf = None
+            LAZY_IMPORTS['pixbuf'] = pixbuf
+        return LAZY_IMPORTS['pixbuf']
 
 
 class FakeSurface(object):
@@ -118,6 +154,20 @@ class SVGImage(object):
         except Exception as e:
             raise ImageLoadingError.from_exception(e)
 
+        # Vector surfaces rendered by CairoSVG, keyed by concrete size and
+        # painted again each time the image is drawn with this size.
+        self._surfaces = LRUCache(maxsize=SVG_SURFACES_PER_IMAGE)
+
+    def copy(self):
+        """Return a new image sharing the parsed SVG document, without the
+        rendered surfaces.
+
+        """
+        image = object.__new__(SVGImage)
+        image.__dict__.update(self.__dict__)
+        image._surfaces = LRUCache(maxsize=SVG_SURFACES_PER_IMAGE)
+        return image
+
     def get_intrinsic_size(self, _image_resolution, font_size):
         # Vector images may be affected by the font size.
         fake_surface = FakeSurface()
@@ -125,37 +175,43 @@ class SVGImage(object):
         # Percentages don't provide an intrinsic size, we transform percentages
         # into 0 using a (0, 0) context size:
         # http://www.w3.org/TR/SVG/coords.html#IntrinsicSizing
-        self._width = cairosvg.surface.size(
-            fake_surface, self._tree.get('width'))
-        self._height = cairosvg.surface.size(
+        # Local variables are used as the image may be shared by renders in
+        # other threads, see IMAGE_CACHE.
+        cairosvg, _ = import_cairosvg()
+        width = cairosvg.surface.size(fake_surface, self._tree.get('width'))
+        height = cairosvg.surface.size(
             fake_surface, self._tree.get('height'))
         _, _, viewbox = cairosvg.surface.node_format(fake_surface, self._tree)
-        self._intrinsic_width = self._width or None
-        self._intrinsic_height = self._height or None
-        self.intrinsic_ratio = None
+        intrinsic_width = width or None
+        intrinsic_height = height or None
+        intrinsic_ratio = None
         if viewbox:
-            if self._width and self._height:
-                self.intrinsic_ratio = self._width / self._height
+            if width and height:
+                intrinsic_ratio = width / height
             else:
                 if viewbox[2] and viewbox[3]:
-                    self.intrinsic_ratio = viewbox[2] / viewbox[3]
-                    if self._width:
-                        self._intrinsic_height = (
-                            self._width / self.intrinsic_ratio)
-                    elif self._height:
-                        self._intrinsic_width = (
-                            self._height * self.intrinsic_ratio)
-        elif self._width and self._height:
-            self.intrinsic_ratio = self._width / self._height
-        return self._intrinsic_width, self._intrinsic_height
+                    intrinsic_ratio = viewbox[2] / viewbox[3]
+                    if width:
+                        intrinsic_height = width / intrinsic_ratio
+                    elif height:
+                        intrinsic_width = height * intrinsic_ratio
+        elif width and height:
+            intrinsic_ratio = width / height
+        self.intrinsic_ratio = intrinsic_ratio
+        return intrinsic_width, intrinsic_height
 
     def draw(self, context, concrete_width, concrete_height, _image_rendering):
+        key = (concrete_width, concrete_height)
         try:
-            svg = ScaledSVGSurface(
-                cairosvg.parser.Tree(
-                    bytestring=self._svg_data, url=self._base_url),
-                output=None, dpi=96, parent_width=concrete_width,
-                parent_height=concrete_height)
+            svg = self._surfaces.get(key)
+            if svg is None:
+                cairosvg, ScaledSVGSurface = import_cairosvg()
+                svg = ScaledSVGSurface(
+                    cairosvg.parser.Tree(
+                        bytestring=self._svg_data, url=self._base_url),
+                    output=None, dpi=96, parent_width=concrete_width,
+                    parent_height=concrete_height)
+                self._surfaces.set(key, svg)
             if svg.width and svg.height:
                 context.scale(
                     concrete_width / svg.width, concrete_height / svg.height)
@@ -166,19 +222,89 @@ class SVGImage(object):
                 'Failed to draw an SVG image at %s : %s', self._base_url, e)
 
 
-def get_image_from_uri(cache, url_fetcher, url, forced_mime_type=None):
-    """Get a cairo Pattern from an image URI."""
+def image_memory(image):
+    """Return an estimation of the memory used by ``image`` in bytes.
+
+    SVG images are counted without their rendered surfaces, as the images
+    of :data:`IMAGE_CACHE` never keep them.
+
+    """
+    if isinstance(image, RasterImage):
+        surface = image.image_surface
+        return surface.get_stride() * surface.get_height()
+    else:
+        return len(image._svg_data)
+
+
+# Images shared by all the documents rendered in the process, keyed by URL
+# fetcher, URL and forced MIME type. Disabled unless its ``maxmemory`` is set
+# to a number of bytes. See :func:`get_image_from_uri`.
+IMAGE_CACHE = LRUCache(maxsize=None, maxmemory=0, sizeof=image_memory)
+
+
+def image_cache_key(url_fetcher, url, forced_mime_type=None):
+    """Return the key of an image in :data:`IMAGE_CACHE`."""
+    # Don't keep long data URLs in the keys
+    return (url_fetcher, hashlib.sha1(url.encode('utf-8')).digest()
+            if url.startswith('data:') else url, forced_mime_type)
+
+
+def get_image_from_uri(cache, url_fetcher, url, forced_mime_type=None,
+                       cache_url_fetcher=None):
+    """Get a cairo Pattern from an image URI.
+
+    ``cache`` is a dict shared by the images of a document. It maps URLs to
+    images, and hashes of the data of raster images to images: the same data
+    fetched from different URLs gives the same image.
+
+    Images are also kept in :data:`IMAGE_CACHE` between documents when it is
+    enabled, if they are fetched by the same ``url_fetcher``, or by the same
+    ``cache_url_fetcher`` if given (the URL fetcher wrapped by
+    ``url_fetcher``, such as a :class:`prefetch.PrefetchedURLFetcher`,
+    giving the same resources). Documents get
+    copies of the SVG images, so that the surfaces they render are not kept
+    by the cache.
+
+    """
     missing = object()
     image = cache.get(url, missing)
-    if image is not missing:
-        return image
+    if image is missing:
+        if IMAGE_CACHE.maxmemory == 0:
+            image = load_image(url_fetcher, url, forced_mime_type, cache)
+        else:
+            key = image_cache_key(
+                url_fetcher if cache_url_fetcher is None
+                else cache_url_fetcher, url, forced_mime_type)
+            image = IMAGE_CACHE.get(key)
+            if image is None:
+                image = load_image(url_fetcher, url, forced_mime_type, cache)
+                if image is not None:
+                    IMAGE_CACHE.set(key, image)
+            if isinstance(image, SVGImage):
+                image = image.copy()
+        cache[url] = image
+    return image
+
+
+@timed('images')
+def load_image(url_fetcher, url, forced_mime_type=None, cache=None):
+    """Fetch and decode an image, return :obj:`None` if it fails.
 
+    Raster images already in ``cache`` with the same data are not decoded
+    again, see :func:`get_image_from_uri`.
+
+    """
     try:
         with fetch(url_fetcher, url) as result:
             if 'string' in result:
                 string = result['string']
             else:
                 string = result['file_obj'].read()
+            # Only raster images are shared: the URL of SVG images is used
+            # to resolve their relative references.
+            data_key = ('raster', hashlib.sha1(string).digest())
+            if cache is not None and data_key in cache:
+                return cache[data_key]
             mime_type = forced_mime_type or result['mime_type']
             if mime_type == 'image/svg+xml':
                 # No fallback for XML-based mimetypes as defined by MIME
@@ -202,6 +328,7 @@ def get_image_from_uri(cache, url_fetcher, url, forced_mime_type=None):
 
                 # Relying on mimetype didn't work, give the image to GDK-Pixbuf
                 if not image:
+                    pixbuf = import_pixbuf()
                     if pixbuf is None:
                         raise ImageLoadingError(
                             'Could not load GDK-Pixbuf. PNG and SVG are '
@@ -220,7 +347,8 @@ def get_image_from_uri(cache, url_fetcher, url, forced_mime_type=None):
     except (URLFetchingError, ImageLoadingError) as exc:
         LOGGER.warning('Failed to load image at "%s" (%s)', url, exc)
         image = None
-    cache[url] = image
+    if cache is not None and isinstance(image, RasterImage):
+        cache[data_key] = image
     return image
 
 
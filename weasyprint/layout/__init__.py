@@ -20,12 +20,18 @@
 """
 from __future__ import division, unicode_literals
 from collections import defaultdict
+from ..caches import LRUCache
 from ..compat import xrange
 
 from .absolute import absolute_box_layout
-from .pages import make_all_pages, make_margin_boxes
+from .float import ExcludedShapes
+from .pages import (
+    make_all_pages, make_margin_boxes, margin_boxes_use_counter)
 from .backgrounds import layout_backgrounds
 
+# Maximum number of text measurements kept during a layout
+TEXT_MEASUREMENT_CACHE_SIZE = 4096
+
 
 def layout_fixed_boxes(context, pages):
     """Lay out and yield the fixed boxes of ``pages``."""
@@ -37,35 +43,106 @@ def layout_fixed_boxes(context, pages):
             yield absolute_box_layout(context, box, page, [])
 
 
+def lay_out_fixed_boxes(context, pages):
+    """Return a list of ``(page_index, box)`` for the laid out fixed boxes
+    of ``pages``.
+
+    Fixed boxes are repeated on every page. Each box is laid out once, in
+    the page where it comes from, and then copied on the other pages with
+    :func:`copy_fixed_boxes`: the layout does not depend on these pages.
+
+    """
+    return [
+        (index, box) for index, page in enumerate(pages)
+        for box in layout_fixed_boxes(context, [page])]
+
+
+def copy_fixed_boxes(fixed_boxes, page_index):
+    """Return copies of the fixed boxes coming from pages before and after
+    the page at ``page_index``, to be painted independently on this page.
+
+    """
+    return (
+        [box.deepcopy() for index, box in fixed_boxes if index < page_index],
+        [box.deepcopy() for index, box in fixed_boxes if index > page_index])
+
+
+def decorate_page(context, page, page_index, page_count, fixed_boxes):
+    """Return a copy of ``page`` with the fixed boxes coming from other
+    pages, its margin boxes and its backgrounds.
+
+    :param page: a page given by :func:`make_all_pages`.
+    :param fixed_boxes: as returned by :func:`lay_out_fixed_boxes`.
+
+    """
+    fixed_boxes_before, fixed_boxes_after = copy_fixed_boxes(
+        fixed_boxes, page_index)
+    root, = page.children
+    root = root.copy_with_children(
+        fixed_boxes_before + list(root.children) + fixed_boxes_after)
+    context.current_page = page_index + 1
+    counter_values = {'page': [page_index + 1], 'pages': [page_count]}
+    page = page.copy_with_children((root,) + tuple(
+        make_margin_boxes(context, page, counter_values)))
+    layout_backgrounds(page, context.get_image_from_uri)
+    return page
+
+
+def needs_first_pass(context, root_box):
+    """Return whether pages need information from following pages.
+
+    Fixed boxes coming from following pages and the ``pages`` counter in
+    margin boxes are only known once the whole document is laid out.
+
+    """
+    return (
+        margin_boxes_use_counter(context, 'pages') or
+        any(box.style.position == 'fixed' for box in root_box.descendants()))
+
+
 def layout_document(enable_hinting, style_for, get_image_from_uri, root_box,
-                    font_config):
+                    font_config, streaming=False):
     """Lay out the whole document.
 
     This includes line breaks, page breaks, absolute size and position for all
     boxes.
 
+    With ``streaming``, each page is yielded as soon as it is laid out and
+    is not referenced anymore by the layout. When the pages need the total
+    number of pages or the fixed boxes of the following pages, the document
+    is first laid out without keeping the pages, to get this information.
+
     :param context: a LayoutContext object.
-    :returns: a list of laid out Page objects.
+    :returns: a generator of laid out Page objects.
 
     """
     context = LayoutContext(
         enable_hinting, style_for, get_image_from_uri, font_config)
-    pages = list(make_all_pages(context, root_box))
-    page_counter = [1]
-    counter_values = {'page': page_counter, 'pages': [len(pages)]}
-    for i, page in enumerate(pages):
-        root_children = []
-        root, = page.children
-        root_children.extend(layout_fixed_boxes(context, pages[:i]))
-        root_children.extend(root.children)
-        root_children.extend(layout_fixed_boxes(context, pages[i + 1:]))
-        root.children = root_children
-        context.current_page = page_counter[0]
-        page.children = (root,) + tuple(
-            make_margin_boxes(context, page, counter_values))
-        layout_backgrounds(page, get_image_from_uri)
-        yield page
-        page_counter[0] += 1
+    if not streaming:
+        pages = list(make_all_pages(context, root_box))
+        page_count = len(pages)
+        fixed_boxes = lay_out_fixed_boxes(context, pages)
+    elif needs_first_pass(context, root_box):
+        first_pass_context = LayoutContext(
+            enable_hinting, style_for, get_image_from_uri, font_config)
+        # Text is measured the same way in both passes
+        first_pass_context.text_measurements = context.text_measurements
+        page_count = 0
+        fixed_boxes = []
+        for page in make_all_pages(first_pass_context, root_box):
+            fixed_boxes.extend(
+                (page_count, box)
+                for box in layout_fixed_boxes(first_pass_context, [page]))
+            page_count += 1
+        pages = make_all_pages(context, root_box)
+    else:
+        # The number of pages is not used
+        page_count = None
+        fixed_boxes = []
+        pages = make_all_pages(context, root_box)
+
+    for page_index, page in enumerate(pages):
+        yield decorate_page(context, page, page_index, page_count, fixed_boxes)
 
 
 class LayoutContext(object):
@@ -80,18 +157,19 @@ class LayoutContext(object):
         self.string_set = defaultdict(lambda: defaultdict(lambda: list()))
         self.current_page = None
         self.strut_layouts = {}
+        # Results of text.split_first_line() and text.line_widths()
+        self.text_measurements = LRUCache(maxsize=TEXT_MEASUREMENT_CACHE_SIZE)
 
     def create_block_formatting_context(self):
-        self.excluded_shapes = []
+        self.excluded_shapes = ExcludedShapes()
         self._excluded_shapes_lists.append(self.excluded_shapes)
 
     def finish_block_formatting_context(self, root_box):
         # See http://www.w3.org/TR/CSS2/visudet.html#root-height
         if root_box.style.height == 'auto' and self.excluded_shapes:
             box_bottom = root_box.content_box_y() + root_box.height
-            max_shape_bottom = max([
-                shape.position_y + shape.margin_height()
-                for shape in self.excluded_shapes] + [box_bottom])
+            max_shape_bottom = max(
+                self.excluded_shapes.max_bottom(), box_bottom)
             root_box.height += max_shape_bottom - box_bottom
         self._excluded_shapes_lists.pop()
         if self._excluded_shapes_lists:
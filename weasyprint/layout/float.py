@@ -10,6 +10,9 @@
 
 from __future__ import division, unicode_literals
 
+import bisect
+import collections
+
 from ..formatting_structure import boxes
 from .markers import list_marker_layout
 from .min_max import handle_min_max_width
@@ -18,6 +21,155 @@ from .preferred import shrink_to_fit
 from .tables import table_wrapper_width
 
 
+# The vertical and horizontal extents of a float, as used by the layout.
+# ``left`` and ``right`` are the margin edges of the box.
+ShapeExtents = collections.namedtuple(
+    'ShapeExtents', 'top bottom left right float shape')
+
+
+class ExcludedShapes(object):
+    """The floats of a block formatting context.
+
+    This is a list of boxes, also keeping an index of their vertical extents
+    so that the floats colliding with a given line or block, and the bottom of
+    the left and right floats, are found without looking at every float.
+
+    Floats are sorted by their top edge, which is usually the order in which
+    they are added. A tree storing the maximum bottom edge of ranges of floats
+    gives the floats that overlap a position in logarithmic time. Floats can be
+    moved after being added, when their parents are translated: the index is
+    then rebuilt on the next query, see :meth:`Box.translate`.
+
+    """
+    def __init__(self, shapes=(), moves=None):
+        self._shapes = list(shapes)
+        # A one-item list shared with the copies and set on the shapes,
+        # counting how many times the shapes have been moved.
+        self._moves = [0] if moves is None else moves
+        # Value of self._moves when the index was built, None if outdated.
+        self._indexed_moves = None
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __iter__(self):
+        return iter(self._shapes)
+
+    def __getitem__(self, index):
+        return self._shapes[index]
+
+    def append(self, shape):
+        """Add the float ``shape``."""
+        shape.excluded_shapes_moves = self._moves
+        self._shapes.append(shape)
+
+    def copy(self):
+        """Return a new object with the same shapes."""
+        return type(self)(self._shapes, self._moves)
+
+    def _index(self):
+        """Bring the index up to date with the shapes."""
+        if self._indexed_moves != self._moves[0]:
+            self._build_index()
+            return
+        for shape in self._shapes[len(self._extents):]:
+            extents = self._get_extents(shape)
+            if (self._extents and extents.top < self._extents[-1].top) or (
+                    len(self._extents) == len(self._tree) // 2):
+                # Not at the end of the sorted list or no room in the tree
+                self._build_index()
+                return
+            self._add(extents)
+            index = len(self._extents) - 1 + len(self._tree) // 2
+            while index:
+                self._tree[index] = max(self._tree[index], extents.bottom)
+                index //= 2
+
+    def _get_extents(self, shape):
+        return ShapeExtents(
+            shape.position_y, shape.position_y + shape.margin_height(),
+            shape.position_x, shape.position_x + shape.margin_width(),
+            shape.style.float, shape)
+
+    def _add(self, extents):
+        self._extents.append(extents)
+        self._tops.append(extents.top)
+        if extents.bottom < extents.top:
+            # Negative margins, the tree can not be used.
+            self._ordered = False
+        max_bottom = self._max_bottoms.get(extents.float)
+        if max_bottom is None or extents.bottom > max_bottom:
+            self._max_bottoms[extents.float] = extents.bottom
+
+    def _build_index(self):
+        self._indexed_moves = self._moves[0]
+        self._extents = []
+        self._tops = []
+        self._max_bottoms = {}
+        self._ordered = True
+        all_extents = sorted(
+            (self._get_extents(shape) for shape in self._shapes),
+            key=lambda extents: extents.top)
+        for extents in all_extents:
+            self._add(extents)
+        # Leave room for the shapes added later.
+        size = 1
+        while size <= len(self._extents):
+            size *= 2
+        tree = [float('-inf')] * (2 * size)
+        for i, extents in enumerate(self._extents):
+            tree[size + i] = extents.bottom
+        for index in range(size - 1, 0, -1):
+            tree[index] = max(tree[2 * index], tree[2 * index + 1])
+        self._tree = tree
+
+    def colliding(self, position_y, height):
+        """Return the :class:`ShapeExtents` of the floats colliding with a
+        box placed at ``position_y`` with ``height``.
+
+        """
+        self._index()
+        bottom_y = position_y + height
+        if self._ordered:
+            # Only floats starting above and ending below the box can collide.
+            stop = bisect.bisect_right(self._tops, max(position_y, bottom_y))
+            low = min(position_y, bottom_y)
+            tree = self._tree
+            size = len(tree) // 2
+            candidates = []
+            nodes = [(1, 0, size)]
+            while nodes:
+                node, start, end = nodes.pop()
+                if start >= stop or tree[node] < low:
+                    continue
+                if node >= size:
+                    candidates.append(self._extents[start])
+                else:
+                    middle = (start + end) // 2
+                    nodes.append((2 * node + 1, middle, end))
+                    nodes.append((2 * node, start, middle))
+        else:
+            candidates = self._extents
+        return [
+            extents for extents in candidates
+            if (extents.top < position_y < extents.bottom) or
+            (extents.top < bottom_y < extents.bottom) or
+            (extents.top >= position_y and extents.bottom <= bottom_y)]
+
+    def max_bottom(self, float_=None):
+        """Return the lowest bottom edge of the floats.
+
+        Only floats on the ``float_`` side are considered if it is ``'left'``
+        or ``'right'``. Return :obj:`None` if there is no such float.
+
+        """
+        self._index()
+        if float_ is None:
+            bottoms = list(self._max_bottoms.values())
+            return max(bottoms) if bottoms else None
+        return self._max_bottoms.get(float_)
+
+
 @handle_min_max_width
 def float_width(box, context, containing_block):
     # Check that box.width is auto even if the caller does it too, because
@@ -114,16 +266,15 @@ def find_float_position(context, box, containing_block):
 
 def get_clearance(context, box, collapsed_margin=0):
     """Return None if there is no clearance, otherwise the clearance value."""
-    clearance = None
-    hypothetical_position = box.position_y + collapsed_margin
+    clear = box.style['clear']
+    if clear == 'none':
+        return None
+    max_bottom = context.excluded_shapes.max_bottom(
+        None if clear == 'both' else clear)
     # Hypothetical position is the position of the top border edge
-    for excluded_shape in context.excluded_shapes:
-        if box.style['clear'] in (excluded_shape.style.float, 'both'):
-            y, h = excluded_shape.position_y, excluded_shape.margin_height()
-            if hypothetical_position < y + h:
-                clearance = max(
-                    (clearance or 0), y + h - hypothetical_position)
-    return clearance
+    hypothetical_position = box.position_y + collapsed_margin
+    if max_bottom is not None and hypothetical_position < max_bottom:
+        return max_bottom - hypothetical_position
 
 
 def avoid_collisions(context, box, containing_block, outer=True):
@@ -137,24 +288,13 @@ def avoid_collisions(context, box, containing_block, outer=True):
         return 0, 0, containing_block.width
 
     while True:
-        colliding_shapes = [
-            shape for shape in excluded_shapes
-            if (shape.position_y < position_y <
-                shape.position_y + shape.margin_height()) or
-            (shape.position_y < position_y + box_height <
-                shape.position_y + shape.margin_height()) or
-            (shape.position_y >= position_y and
-                shape.position_y + shape.margin_height() <=
-                position_y + box_height)
-        ]
+        colliding_shapes = excluded_shapes.colliding(position_y, box_height)
         left_bounds = [
-            shape.position_x + shape.margin_width()
-            for shape in colliding_shapes
-            if shape.style.float == 'left']
+            shape.right for shape in colliding_shapes
+            if shape.float == 'left']
         right_bounds = [
-            shape.position_x
-            for shape in colliding_shapes
-            if shape.style.float == 'right']
+            shape.left for shape in colliding_shapes
+            if shape.float == 'right']
 
         # Set the default maximum bounds
         max_left_bound = containing_block.content_box_x()
@@ -176,8 +316,7 @@ def avoid_collisions(context, box, containing_block, outer=True):
             if box_width > max_right_bound - max_left_bound:
                 # The box does not fit here
                 new_positon_y = min(
-                    shape.position_y + shape.margin_height()
-                    for shape in colliding_shapes)
+                    shape.bottom for shape in colliding_shapes)
                 if new_positon_y > position_y:
                     # We can find a solution with a higher position_y
                     position_y = new_positon_y
@@ -0,0 +1,249 @@
+# coding: utf-8
+"""
+    weasyprint.layout.incremental
+    -----------------------------
+
+    Lay out again the pages of a document changed after its first layout.
+
+    The box tree built for the changed document is compared with the previous
+    one. Pages ending before the first changed box are kept. Following pages
+    are laid out again, until a page ends at the same place as a previous
+    page, after the last changed box: the next pages are the same as before.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, unicode_literals
+
+from . import LayoutContext, decorate_page, layout_fixed_boxes
+from .pages import make_all_pages, margin_boxes_use_counter
+
+# Attributes set on boxes when the formatting structure is built. Boxes
+# are considered the same if these attributes and their style are the same.
+BUILD_ATTRIBUTES = (
+    'element_tag', 'text', 'replacement', 'is_for_root_element',
+    'viewport_overflow', 'is_list_marker', 'is_table_wrapper',
+    'is_attachment', 'grid_x', 'span', 'colspan', 'rowspan', 'is_header',
+    'is_footer', 'collapsed_border_grid')
+
+# Style attributes set on boxes when the formatting structure is built.
+STYLE_ATTRIBUTES = ('style', 'first_letter_style', 'first_line_style')
+
+
+def _same_style(old_style, new_style):
+    if old_style is None or new_style is None:
+        return old_style is new_style
+    # Unchanged elements keep their computed styles, and their copies share
+    # the same values.
+    return old_style._values is new_style._values or old_style == new_style
+
+
+def _same_box(old_box, new_box):
+    """Return whether two boxes are the same, without their children."""
+    if type(old_box) is not type(new_box):
+        return False
+    for name in BUILD_ATTRIBUTES:
+        if getattr(old_box, name, None) != getattr(new_box, name, None):
+            return False
+    for name in STYLE_ATTRIBUTES:
+        if not _same_style(
+                getattr(old_box, name, None), getattr(new_box, name, None)):
+            return False
+    for name in ('outside_list_marker', 'column_groups'):
+        old_boxes = getattr(old_box, name, None)
+        new_boxes = getattr(new_box, name, None)
+        if old_boxes is None or new_boxes is None:
+            if old_boxes is not new_boxes:
+                return False
+            continue
+        if name == 'outside_list_marker':
+            old_boxes, new_boxes = [old_boxes], [new_boxes]
+        if len(old_boxes) != len(new_boxes) or any(
+                box_differences(old, new)
+                for old, new in zip(old_boxes, new_boxes)):
+            return False
+    return True
+
+
+def box_differences(old_box, new_box, path=()):
+    """Compare two box trees built for a document, before layout.
+
+    Return :obj:`None` if they are the same, or the paths of the first and of
+    the last boxes that are different. A path is a tuple of indexes in the
+    ``children`` lists, from ``old_box``. Boxes with a different number of
+    children are different.
+
+    """
+    old_children = getattr(old_box, 'children', ())
+    new_children = getattr(new_box, 'children', ())
+    if (not _same_box(old_box, new_box) or
+            len(old_children) != len(new_children)):
+        return path, path
+    first = last = None
+    for index, (old_child, new_child) in enumerate(
+            zip(old_children, new_children)):
+        differences = box_differences(old_child, new_child, path + (index,))
+        if differences is not None:
+            if first is None:
+                first = differences[0]
+            last = differences[1]
+    if first is None:
+        return None
+    return first, last
+
+
+def skip_stack_path(skip_stack):
+    """Return a skip stack as a tuple of indexes, comparable with the paths
+    returned by :func:`box_differences`.
+
+    The last index may be a position in the text of a box.
+
+    """
+    path = []
+    while skip_stack is not None:
+        index, skip_stack = skip_stack
+        path.append(index)
+    return tuple(path)
+
+
+class DocumentLayout(object):
+    """The laid out pages of a document, that can be updated when the
+    document changes.
+
+    :param root_box: the box tree of the document, before layout.
+
+    """
+    def __init__(self, enable_hinting, style_for, get_image_from_uri,
+                 root_box, font_config):
+        self.context = LayoutContext(
+            enable_hinting, style_for, get_image_from_uri, font_config)
+        self.root_box = root_box
+        #: Pages given by :func:`make_all_pages`, without the boxes added by
+        #: :func:`decorate_page`.
+        self.pages = list(make_all_pages(self.context, root_box))
+        #: The laid out fixed boxes of each page.
+        self.fixed_boxes = [
+            list(layout_fixed_boxes(self.context, [page]))
+            for page in self.pages]
+        self._uses_page_count = margin_boxes_use_counter(
+            self.context, 'pages')
+        #: The pages returned by :func:`decorate_page`.
+        self.decorated_pages = []
+        self._decorate(0, len(self.pages))
+
+    def _decorate(self, start, stop):
+        """Decorate the pages from ``start`` to ``stop``."""
+        fixed_boxes = [
+            (page_index, box)
+            for page_index, boxes in enumerate(self.fixed_boxes)
+            for box in boxes]
+        self.decorated_pages[start:stop] = [
+            decorate_page(
+                self.context, self.pages[page_index], page_index,
+                len(self.pages), fixed_boxes)
+            for page_index in range(start, stop)]
+
+    def update(self, root_box):
+        """Lay out the pages again with ``root_box``, a new box tree for the
+        changed document.
+
+        Update :attr:`decorated_pages`. Pages that have not changed are kept,
+        and can be compared by identity.
+
+        """
+        differences = box_differences(self.root_box, root_box)
+        self.root_box = root_box
+        if differences is None:
+            return
+        first_difference, last_difference = differences
+        context = self.context
+
+        # The first page that may change is the one before the page where
+        # the first changed box is: page breaks depend on the following
+        # boxes (eg. with widows or with page-break-before: avoid).
+        first_page = 0
+        for page_index, page in enumerate(self.pages):
+            resume_at = page.next_state[2]
+            if resume_at is None:
+                first_page = max(0, page_index - 1)
+                break
+            path = skip_stack_path(resume_at)
+            if path == first_difference:
+                # The changed box is at the top of the next page
+                first_page = page_index
+                break
+            elif path > first_difference:
+                first_page = max(0, page_index - 1)
+                break
+
+        # Named strings are set again for new pages.
+        old_string_set = {}
+        for name, pages in context.string_set.items():
+            for page_number in list(pages):
+                if page_number > first_page:
+                    old_string_set.setdefault(name, {})[page_number] = (
+                        pages.pop(page_number))
+
+        state = self.pages[first_page - 1].next_state if first_page else None
+        new_pages = []
+        converged_page = None
+        for page in make_all_pages(context, root_box, state):
+            new_pages.append(page)
+            _, right_page, resume_at, next_page = page.next_state
+            if resume_at is None:
+                break
+            path = skip_stack_path(resume_at)
+            if path <= last_difference or (
+                    path[:len(last_difference)] == last_difference):
+                # Still before the end of the changed boxes
+                continue
+            for page_index in range(first_page, len(self.pages)):
+                if self.pages[page_index].next_state[1:] == (
+                        right_page, resume_at, next_page):
+                    converged_page = page_index
+                    break
+            if converged_page is not None:
+                break
+        new_fixed_boxes = [
+            list(layout_fixed_boxes(context, [page])) for page in new_pages]
+
+        if converged_page is None:
+            old_stop = len(self.pages)
+        else:
+            old_stop = converged_page + 1
+        shift = len(new_pages) - (old_stop - first_page)
+        for page in self.pages[old_stop:]:
+            page_number, right_page, resume_at, next_page = page.next_state
+            page.next_state = (
+                page_number + shift, right_page, resume_at, next_page)
+        for name, pages in old_string_set.items():
+            for page_number, strings in pages.items():
+                if page_number > old_stop:
+                    context.string_set[name][page_number + shift] = strings
+
+        # Pages are decorated again when their fixed boxes, their named
+        # strings, their number or the number of pages may have changed.
+        changed_fixed_boxes = any(self.fixed_boxes[first_page:old_stop]) or (
+            any(new_fixed_boxes))
+        new_stop = first_page + len(new_pages)
+        changed_strings = any(
+            first_page < page_number <= new_stop
+            for pages in context.string_set.values()
+            for page_number, strings in pages.items() if strings) or any(
+            page_number <= old_stop
+            for pages in old_string_set.values()
+            for page_number, strings in pages.items() if strings)
+        old_count = len(self.pages)
+        self.pages[first_page:old_stop] = new_pages
+        self.fixed_boxes[first_page:old_stop] = new_fixed_boxes
+        del self.decorated_pages[first_page:old_stop]
+        self.decorated_pages[first_page:first_page] = [None] * len(new_pages)
+        if changed_fixed_boxes or (
+                self._uses_page_count and len(self.pages) != old_count):
+            self._decorate(0, len(self.pages))
+        elif changed_strings or shift:
+            self._decorate(first_page, len(self.pages))
+        else:
+            self._decorate(first_page, first_page + len(new_pages))
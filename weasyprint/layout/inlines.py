@@ -88,7 +88,7 @@ def get_next_linebox(context, linebox, position_y, skip_stack,
         context, linebox, containing_block, outer=False)
     candidate_height = linebox.height
 
-    excluded_shapes = context.excluded_shapes[:]
+    excluded_shapes = context.excluded_shapes.copy()
 
     while 1:
         linebox.position_x = position_x
@@ -1002,7 +1002,7 @@ def add_word_spacing(context, box, extra_word_spacing, x_advance):
     if isinstance(box, boxes.TextBox):
         box.position_x += x_advance
         style = box.style.copy()
-        style.word_spacing += extra_word_spacing
+        style['word_spacing'] += extra_word_spacing
         nb_spaces = count_spaces(box)
         if nb_spaces > 0:
             layout, _, resume_at, width, _, _ = split_first_line(
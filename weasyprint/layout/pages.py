@@ -12,6 +12,7 @@
 
 from __future__ import division, unicode_literals
 
+from ..css import PAGE_PSEUDOCLASS_TARGETS
 from ..formatting_structure import boxes, build
 from .absolute import absolute_layout
 from .blocks import block_container_layout, block_level_layout
@@ -19,6 +20,18 @@ from .min_max import handle_min_max_height, handle_min_max_width
 from .percentages import resolve_percentages
 from .preferred import max_content_width, min_content_width
 
+# At-keywords of all the margin boxes
+MARGIN_BOXES = tuple(
+    '@%s-%s' % (prefix, suffix)
+    for prefix, suffixes in [
+        ('top', ['left', 'center', 'right']),
+        ('bottom', ['left', 'center', 'right']),
+        ('left', ['top', 'middle', 'bottom']),
+        ('right', ['top', 'middle', 'bottom']),
+        ('top', ['left-corner', 'right-corner']),
+        ('bottom', ['left-corner', 'right-corner'])]
+    for suffix in suffixes)
+
 
 class OrientedBox(object):
     @property
@@ -278,6 +291,23 @@ def compute_variable_dimension(context, side_boxes, vertical, outer_sum):
         box.restore_box_attributes()
 
 
+def margin_boxes_use_counter(context, counter_name):
+    """Return whether ``counter_name`` is displayed in a margin box of any
+    page type.
+
+    """
+    for page_type in PAGE_PSEUDOCLASS_TARGETS[None]:
+        for at_keyword in MARGIN_BOXES:
+            style = context.style_for(page_type, at_keyword)
+            if style is None or style.content in ('normal', 'none'):
+                continue
+            for type_, value in style.content:
+                if type_ in ('counter', 'counters') and (
+                        value[0] == counter_name):
+                    return True
+    return False
+
+
 def make_margin_boxes(context, page, counter_values):
     """Yield laid-out margin boxes for this page."""
     # This is a closure only to make calls shorter
@@ -533,30 +563,38 @@ def make_page(context, root_box, page_type, resume_at, content_empty,
     return page, resume_at, next_page
 
 
-def make_all_pages(context, root_box):
-    """Return a list of laid out pages without margin boxes."""
-    prefix = 'first_'
-
-    # Special case the root box
-    page_break = root_box.style.break_before
-    # TODO: take care of text direction and writing mode
-    # https://www.w3.org/TR/css3-page/#progression
-    if page_break in 'right':
-        right_page = True
-    elif page_break == 'left':
-        right_page = False
-    elif page_break in 'recto':
-        right_page = root_box.style.direction == 'ltr'
-    elif page_break == 'verso':
-        right_page = root_box.style.direction == 'rtl'
-    else:
-        right_page = root_box.style.direction == 'ltr'
+def make_all_pages(context, root_box, state=None):
+    """Yield laid out pages without margin boxes.
+
+    Each page gets a ``next_state`` attribute, a ``(page_number, right_page,
+    resume_at, next_page)`` tuple describing where the following page starts.
+    ``resume_at`` is ``None`` after the last page.
 
-    resume_at = None
-    next_page = 'any'
-    page_number = 0
+    :param state:
+        The ``next_state`` of a page previously laid out with the same
+        ``root_box``, to start from the following page instead of the first.
+
+    """
+    if state is None:
+        # Special case the root box
+        page_break = root_box.style.break_before
+        # TODO: take care of text direction and writing mode
+        # https://www.w3.org/TR/css3-page/#progression
+        if page_break in 'right':
+            right_page = True
+        elif page_break == 'left':
+            right_page = False
+        elif page_break in 'recto':
+            right_page = root_box.style.direction == 'ltr'
+        elif page_break == 'verso':
+            right_page = root_box.style.direction == 'rtl'
+        else:
+            right_page = root_box.style.direction == 'ltr'
+        state = 1, right_page, None, 'any'
+
+    page_number, right_page, resume_at, next_page = state
     while True:
-        page_number += 1
+        prefix = 'first_' if page_number == 1 else ''
         content_empty = ((next_page == 'left' and right_page) or
                          (next_page == 'right' and not right_page))
         if content_empty:
@@ -566,8 +604,9 @@ def make_all_pages(context, root_box):
             context, root_box, page_type, resume_at, content_empty,
             page_number)
         assert next_page
+        page_number += 1
+        right_page = not right_page
+        page.next_state = page_number, right_page, resume_at, next_page
         yield page
         if resume_at is None:
             return
-        prefix = ''
-        right_page = not right_page
@@ -623,6 +623,7 @@ def trailing_whitespace_size(context, box):
         assert resume is None
         return old_box.width - stripped_box.width
     else:
-        _, _, _, width, _, _ = split_first_line(
+        layout, _, _, width, _, _ = split_first_line(
             box.text, box.style, context, None, None)
+        layout.release()
         return width
@@ -3,7 +3,7 @@ r"""
     weasyprint.pdf
     --------------
 
-    Post-process the PDF files created by cairo and add metadata such as
+    Write PDF files with the pages painted by cairo and with metadata such as
     hyperlinks and bookmarks.
 
 
@@ -37,17 +37,24 @@ import mimetypes
 import os
 import re
 import string
+import struct
 import sys
 import zlib
 
 import cairocffi as cairo
 
 from . import VERSION_STRING, Attachment
-from .compat import iteritems, izip, unquote, xrange
+from .compat import izip, unquote, xrange
 from .html import W3C_DATE_RE
 from .logger import LOGGER
 from .urls import URLFetchingError, iri_to_uri, urlsplit
 
+# Maximum number of objects in each compressed object stream.
+OBJECT_STREAM_SIZE = 100
+
+# Number of bytes read at the start of objects to find image XObjects.
+IMAGE_HEADER_SIZE = 512
+
 
 def pdf_escape(value):
     """Escape parentheses and backslashes in ``value``.
@@ -145,13 +152,21 @@ class PDFDictionary(object):
 class PDFFile(object):
     """
     :param fileobj:
-        A seekable binary file-like object for a PDF generated by cairo.
+        A seekable and readable binary file-like object for a PDF generated
+        by cairo. Only the ``seek``, ``read`` and ``readline`` methods are
+        used.
 
     """
     trailer_re = re.compile(
         b'\ntrailer\n(.+)\nstartxref\n(\d+)\n%%EOF\n$', re.DOTALL)
 
     def __init__(self, fileobj):
+        fileobj.seek(0)
+        header = fileobj.readline()
+        assert header.startswith(b'%PDF-')
+        #: The PDF version of the file, as a byte string like ``b'1.5'``.
+        self.version = header[5:].strip()
+
         # cairo’s trailer only has Size, Root and Info.
         # The trailer + startxref + EOF is typically under 100 bytes
         fileobj.seek(-200, os.SEEK_END)
@@ -160,20 +175,20 @@ class PDFFile(object):
         startxref = int(startxref)
 
         fileobj.seek(startxref)
-        line = next(fileobj)
+        line = fileobj.readline()
         assert line == b'xref\n'
 
-        line = next(fileobj)
+        line = fileobj.readline()
         first_object, total_objects = line.split()
         assert first_object == b'0'
         total_objects = int(total_objects)
 
-        line = next(fileobj)
+        line = fileobj.readline()
         assert line == b'0000000000 65535 f \n'
 
         objects_offsets = [None]
         for object_number in xrange(1, total_objects):
-            line = next(fileobj)
+            line = fileobj.readline()
             assert line[10:] == b' 00000 n \n'
             objects_offsets.append(int(line[:10]))
 
@@ -194,10 +209,6 @@ class PDFFile(object):
         self.page_tree = page_tree
         self.pages = pages
 
-        self.finished = False
-        self.overwritten_objects_offsets = {}
-        self.new_objects_offsets = []
-
     def read_object(self, object_number):
         """
         :param object_number:
@@ -208,47 +219,181 @@ class PDFFile(object):
         """
         fileobj = self.fileobj
         fileobj.seek(self.objects_offsets[object_number])
-        line = next(fileobj)
+        line = fileobj.readline()
         assert line.endswith(b' 0 obj\n')
         assert int(line[:-7]) == object_number  # len(b' 0 obj\n') == 7
         object_lines = []
-        for line in fileobj:
+        for line in iter(fileobj.readline, b''):
             if line == b'>>\n':
-                assert next(fileobj) == b'endobj\n'
+                assert fileobj.readline() == b'endobj\n'
                 # No newline, we’ll add it when writing.
                 object_lines.append(b'>>')
                 return b''.join(object_lines)
             object_lines.append(line)
 
-    def overwrite_object(self, object_number, byte_string):
-        """Write the new content for an existing object at the end of the file.
 
-        :param object_number:
-            An integer N so that 1 <= N < len(self.objects_offsets)
-        :param byte_string:
-            The new object content as a byte string.
+class PDFWriter(object):
+    """Write a PDF file with the pages of PDF files generated by cairo.
+
+    The objects painted by cairo (content streams, fonts, images…) are
+    copied once from the sources, and renumbered. Identical image XObjects,
+    painted on different pages or in different sources, are only copied
+    once. The page tree, the catalog, the info dictionary and the page
+    dictionaries are kept in memory, where metadata is added, and are
+    written with the cross-reference section by :meth:`finish`.
+
+    :param sources:
+        A list of :class:`PDFFile` objects, whose pages are concatenated.
+    :param fileobj:
+        A binary file-like object where the PDF is written. Only its
+        ``write`` method is used.
+    :param object_streams:
+        Whether the objects that are not streams, except the ones copied from
+        the sources, are packed in compressed object streams, with a
+        cross-reference stream. This requires PDF 1.5.
+
+    """
+    reference_re = re.compile(br'(\d+) 0 R')
+
+    def __init__(self, sources, fileobj, object_streams=False):
+        self.fileobj = fileobj
+        self.object_streams = object_streams
+        self.finished = False
+        #: Bytes written since the start of the file
+        self.position = 0
+
+        first = sources[0]
+        #: The PDF version of the file, as a byte string like ``b'1.5'``.
+        self.version = first.version
+        #: Maps object number -> bytes from the start of the file, or
+        #: :obj:`None` for objects that are kept in memory or packed.
+        self.objects_offsets = [None]
+        # Maps object numbers to the content of the objects to pack
+        self.packed_objects = {}
+        #: Maps hashes of image XObjects to their object numbers
+        self.images_numbers = {}
+
+        self.page_tree_number = self._new_object_number()
+        self.catalog = PDFDictionary(self._new_object_number(), None)
+        self.info = PDFDictionary(self._new_object_number(), None)
+        self.pages = []
+
+        first.fileobj.seek(0)
+        self._write(first.fileobj.read(min(first.objects_offsets[1:])))
+        for source in sources:
+            renumber = self._copy_objects(source)
+            if source is first:
+                self.catalog.byte_string = renumber(first.catalog.byte_string)
+                self.info.byte_string = renumber(first.info.byte_string)
+
+    def _copy_objects(self, source):
+        """Copy the objects of ``source``, except its document structure.
+
+        Return a function renumbering the references of ``source`` in a
+        byte string.
 
         """
-        self.overwritten_objects_offsets[object_number] = (
-            self._write_object(object_number, byte_string))
+        # Maps object numbers in ``source`` to object numbers in the new file
+        numbers = {source.page_tree.object_number: self.page_tree_number}
+
+        def new_number(match):
+            object_number = int(match.group(1))
+            if object_number not in numbers:
+                numbers[object_number] = self._new_object_number()
+            return pdf_format('{0} 0 R', numbers[object_number])
+
+        def renumber(byte_string):
+            return self.reference_re.sub(new_number, byte_string)
+
+        skipped = set([
+            source.catalog.object_number, source.info.object_number,
+            source.page_tree.object_number])
+        skipped.update(page.object_number for page in source.pages)
+        starts = sorted(source.objects_offsets[1:])
+        ends = dict(izip(starts, starts[1:] + [source.startxref]))
+
+        # Images are copied first: objects referencing them may come before
+        # them, and must use the number of the first identical image.
+        others = []
+        for start, object_number in sorted(
+                (offset, object_number) for object_number, offset
+                in enumerate(source.objects_offsets) if offset is not None):
+            if object_number in skipped:
+                continue
+            size = ends[start] - start
+            source.fileobj.seek(start)
+            data = source.fileobj.read(min(size, IMAGE_HEADER_SIZE))
+            if b'/Subtype /Image' not in data.split(b'\nstream\n', 1)[0]:
+                others.append((start, object_number))
+                continue
+            data += source.fileobj.read(size - len(data))
+            dictionary, stream = self._split_object(data)
+            dictionary = renumber(dictionary)
+            if object_number not in numbers:
+                # Not referenced by an image copied before
+                key = hashlib.sha1(dictionary + stream).digest()
+                if key in self.images_numbers:
+                    numbers[object_number] = self.images_numbers[key]
+                    continue
+                numbers[object_number] = self.images_numbers[key] = (
+                    self._new_object_number())
+            self._copy_object(numbers[object_number], dictionary, stream)
+
+        for start, object_number in others:
+            source.fileobj.seek(start)
+            dictionary, stream = self._split_object(
+                source.fileobj.read(ends[start] - start))
+            dictionary = renumber(dictionary)
+            if object_number not in numbers:
+                numbers[object_number] = self._new_object_number()
+            self._copy_object(numbers[object_number], dictionary, stream)
+
+        for page in source.pages:
+            byte_string = renumber(page.byte_string)
+            if page.object_number not in numbers:
+                numbers[page.object_number] = self._new_object_number()
+            self.pages.append(
+                PDFDictionary(numbers[page.object_number], byte_string))
+        return renumber
+
+    @staticmethod
+    def _split_object(data):
+        """Split an object copied from a source, without its "N 0 obj" line,
+        in its dictionary and the rest of the object: only references in the
+        dictionary are changed.
+
+        """
+        _, data = data.split(b'\n', 1)
+        dictionary, stream_start, stream = data.partition(b'\nstream\n')
+        return dictionary, stream_start + stream
+
+    def _copy_object(self, object_number, dictionary, stream):
+        self.objects_offsets[object_number] = self.position
+        self._write(pdf_format('{0} 0 obj\n', object_number))
+        self._write(dictionary)
+        self._write(stream)
+
+    def _new_object_number(self):
+        object_number = self.next_object_number()
+        self.objects_offsets.append(None)
+        return object_number
 
     def extend_dict(self, dictionary, new_content):
-        """Overwrite a dictionary object after adding content inside
-        the << >> delimiters.
+        """Add content inside the << >> delimiters of the catalog, the info
+        dictionary or a page dictionary.
 
         """
         assert dictionary.byte_string.endswith(b'>>')
-        self.overwrite_object(
-            dictionary.object_number,
+        dictionary.byte_string = (
             dictionary.byte_string[:-2] + new_content + b'\n>>')
 
     def next_object_number(self):
         """Return the object number that would be used by write_new_object().
         """
-        return len(self.objects_offsets) + len(self.new_objects_offsets)
+        return len(self.objects_offsets)
 
     def write_new_object(self, byte_string):
-        """Write a new object at the end of the file.
+        """Write a new object.
 
         :param byte_string:
             The object content as a byte string.
@@ -256,45 +401,109 @@ class PDFFile(object):
             The new object number.
 
         """
-        object_number = self.next_object_number()
-        self.new_objects_offsets.append(
-            self._write_object(object_number, byte_string))
+        object_number = self._new_object_number()
+        self._write_or_pack_object(object_number, byte_string)
         return object_number
 
+    def _write_or_pack_object(self, object_number, byte_string):
+        if self.object_streams and not byte_string.endswith(b'endstream'):
+            self.packed_objects[object_number] = byte_string
+        else:
+            self.objects_offsets[object_number] = self._write_object(
+                object_number, byte_string)
+
     def finish(self):
-        """
-        Write the cross-reference table and the trailer for the new and
-        overwritten objects. This makes `fileobj` a valid (updated) PDF file.
+        """Write the document structure, the cross-reference section and the
+        trailer. This makes `fileobj` a valid PDF file.
 
         """
-        new_startxref, write = self._start_writing()
+        page_tree = pdf_format(
+            '<< /Type /Pages\n   /Kids [ {0} ]\n   /Count {1}\n>>',
+            ' '.join('{0} 0 R'.format(page.object_number)
+                     for page in self.pages),
+            len(self.pages))
+        self._write_or_pack_object(self.page_tree_number, page_tree)
+        for dictionary in self.pages + [self.catalog, self.info]:
+            self._write_or_pack_object(
+                dictionary.object_number, dictionary.byte_string)
+
+        if self.object_streams:
+            self._finish_with_streams()
+            return
+        startxref, write = self._start_writing()
         self.finished = True
-        write(b'xref\n')
-
-        # Don’t bother sorting or finding contiguous numbers,
-        # just write a new sub-section for each overwritten object.
-        for object_number, offset in iteritems(
-                self.overwritten_objects_offsets):
-            write(pdf_format(
-                '{0} 1\n{1:010} 00000 n \n', object_number, offset))
-
-        if self.new_objects_offsets:
-            first_new_object = len(self.objects_offsets)
-            write(pdf_format(
-                '{0} {1}\n', first_new_object, len(self.new_objects_offsets)))
-            for object_number, offset in enumerate(
-                    self.new_objects_offsets, start=first_new_object):
-                write(pdf_format('{0:010} 00000 n \n', offset))
+        assert None not in self.objects_offsets[1:]
+        write(pdf_format(
+            'xref\n0 {0}\n0000000000 65535 f \n', len(self.objects_offsets)))
+        for offset in self.objects_offsets[1:]:
+            write(pdf_format('{0:010} 00000 n \n', offset))
+        write(pdf_format(
+            'trailer\n<< /Size {0}\n   /Root {1} 0 R\n   /Info {2} 0 R\n>>\n'
+            'startxref\n{3}\n%%EOF\n',
+            len(self.objects_offsets), self.catalog.object_number,
+            self.info.object_number, startxref))
+
+    def _finish_with_streams(self):
+        """Write the packed objects in object streams, then the
+        cross-reference stream.
+
+        """
+        # (type, field 2, field 3) entries of packed objects, see
+        # "Cross-Reference Streams" in the PDF 1.5 specification.
+        packed_entries = {}
+        numbers = sorted(self.packed_objects)
+        for start in xrange(0, len(numbers), OBJECT_STREAM_SIZE):
+            stream_number = self.next_object_number()
+            offsets = []
+            objects = []
+            position = 0
+            for index, object_number in enumerate(
+                    numbers[start:start + OBJECT_STREAM_SIZE]):
+                offsets.append(pdf_format('{0} {1}', object_number, position))
+                objects.append(self.packed_objects[object_number] + b'\n')
+                position += len(objects[-1])
+                packed_entries[object_number] = (2, stream_number, index)
+            first = b' '.join(offsets) + b'\n'
+            data = zlib.compress(first + b''.join(objects))
+            self.write_new_object(pdf_format(
+                '<< /Type /ObjStm /N {0} /First {1} /Filter /FlateDecode '
+                '/Length {2} >>\nstream\n',
+                len(objects), len(first), len(data)) + data + b'\nendstream')
+        self.packed_objects = {}
+
+        xref_number = self.next_object_number()
+        startxref, write = self._start_writing()
+        self.objects_offsets.append(startxref)
+        entries = [(0, 0, 65535)]
+        for object_number, offset in enumerate(self.objects_offsets):
+            if object_number:
+                entries.append(packed_entries[object_number]
+                               if offset is None else (1, offset, 0))
+        # Offsets and object stream numbers take 4 bytes, or 8 bytes for huge
+        # files. Indexes in object streams take 2 bytes.
+        if startxref < 2 ** 32:
+            row_format, width = '>BIH', 4
+        else:
+            row_format, width = '>BQH', 8
+        data = zlib.compress(b''.join(
+            struct.pack(row_format, *entry) for entry in entries))
 
+        self.finished = True
+        write(pdf_format(
+            '{number} 0 obj\n'
+            '<< /Type /XRef /Size {size} /W [1 {width} 2]\n'
+            '   /Root {root} 0 R /Info {info} 0 R\n'
+            '   /Filter /FlateDecode /Length {length} >>\nstream\n',
+            number=xref_number, size=len(entries), width=width,
+            root=self.catalog.object_number, info=self.info.object_number,
+            length=len(data)))
+        write(data)
         write(pdf_format(
-            'trailer\n<< '
-            '/Size {size} /Root {root} 0 R /Info {info} 0 R /Prev {prev}'
-            ' >>\nstartxref\n{startxref}\n%%EOF\n',
-            size=self.next_object_number(),
-            root=self.catalog.object_number,
-            info=self.info.object_number,
-            prev=self.startxref,
-            startxref=new_startxref))
+            '\nendstream\nendobj\nstartxref\n{0}\n%%EOF\n', startxref))
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.position += len(data)
 
     def _write_object(self, object_number, byte_string):
         offset, write = self._start_writing()
@@ -305,9 +514,7 @@ class PDFFile(object):
 
     def _start_writing(self):
         assert not self.finished
-        fileobj = self.fileobj
-        fileobj.seek(0, os.SEEK_END)
-        return fileobj.tell(), fileobj.write
+        return self.position, self._write
 
 
 def flatten_bookmarks(bookmarks, depth=1):
@@ -433,7 +640,7 @@ def _write_compressed_file_object(pdf, file):
     write(b'\nendstream\n')
     write(b'endobj\n')
 
-    pdf.new_objects_offsets.append(offset)
+    pdf.objects_offsets.append(offset)
 
     pdf.write_new_object(pdf_format("{0}", compressed_length))
     pdf.write_new_object(pdf_format("<{0}>", md5.hexdigest()))
@@ -588,10 +795,22 @@ def _write_pdf_annotation_files(pdf, links, url_fetcher):
     return annot_files
 
 
-def write_pdf_metadata(document, fileobj, scale, metadata, attachments,
-                       url_fetcher):
-    """Append to a seekable file-like object to add PDF metadata."""
-    pdf = PDFFile(fileobj)
+def write_pdf(document, sources, fileobj, scale, metadata, attachments,
+              url_fetcher, object_streams=False):
+    """Write a PDF file with the pages of PDF files generated by cairo, and
+    with metadata such as hyperlinks and bookmarks.
+
+    :param sources:
+        A list of seekable and readable binary file-like objects for the PDF
+        files generated by cairo, for consecutive pages of ``document``.
+    :param fileobj:
+        A binary file-like object where the PDF is written.
+
+    See :class:`PDFWriter` for ``object_streams``.
+
+    """
+    pdf = PDFWriter(
+        [PDFFile(source) for source in sources], fileobj, object_streams)
     bookmark_root_id = pdf.next_object_number()
     bookmark_root, bookmarks, links = prepare_metadata(
         document, bookmark_root_id, scale)
@@ -621,14 +840,16 @@ def write_pdf_metadata(document, fileobj, scale, metadata, attachments,
     embedded_files_id = _write_pdf_embedded_files(
         pdf, metadata.attachments + (attachments or []), url_fetcher)
 
-    if bookmarks or embedded_files_id is not None:
-        params = b''
-        if bookmarks:
-            params += pdf_format(' /Outlines {0} 0 R /PageMode /UseOutlines',
-                                 bookmark_root_id)
-        if embedded_files_id is not None:
-            params += pdf_format(' /Names << /EmbeddedFiles {0} 0 R >>',
-                                 embedded_files_id)
+    params = b''
+    if bookmarks:
+        params += pdf_format(' /Outlines {0} 0 R /PageMode /UseOutlines',
+                             bookmark_root_id)
+    if embedded_files_id is not None:
+        params += pdf_format(' /Names << /EmbeddedFiles {0} 0 R >>',
+                             embedded_files_id)
+    if object_streams and pdf.version < b'1.5':
+        params += b' /Version /1.5'
+    if params:
         pdf.extend_dict(pdf.catalog, params)
 
     # A single link can be split in multiple regions. We don't want to embedded
@@ -701,7 +922,7 @@ def write_pdf_metadata(document, fileobj, scale, metadata, attachments,
             info.append(pdf_format('/{0} (D:{1})', key, value))
     # TODO: write metadata['CreationDate'] and metadata['ModDate'] as dates.
     info.append(b' >>')
-    pdf.overwrite_object(pdf.info.object_number, b''.join(info))
+    pdf.info.byte_string = b''.join(info)
 
     pdf.finish()
 
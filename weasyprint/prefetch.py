@@ -0,0 +1,273 @@
+# coding: utf-8
+"""
+    weasyprint.prefetch
+    -------------------
+
+    Fetch the external resources of a document concurrently, before the
+    cascade and the layout need them.
+
+    Stylesheets, images and fonts are otherwise fetched one at a time, when
+    they are found. Over HTTP, each resource then costs a whole round trip.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, unicode_literals
+
+import functools
+import threading
+from multiprocessing.pool import ThreadPool
+
+from .compat import basestring, urljoin, urlsplit
+from .css import PARSER, evaluate_media_query, get_child_text
+from .html import element_has_link_type
+from .images import IMAGE_CACHE, image_cache_key
+from .urls import (
+    default_url_fetcher, element_base_url, iri_to_uri, url_is_absolute)
+
+# Maximum number of resources fetched at the same time, 0 disables
+# prefetching.
+PREFETCH_THREADS = 8
+
+# Resources with other schemes (such as local files and data URLs) are fast
+# enough to be fetched when they are needed.
+PREFETCH_SCHEMES = ('http', 'https', 'ftp')
+
+# Attributes of HTML elements giving the URL of a resource
+RESOURCE_ATTRIBUTES = {
+    'img': 'src',
+    'embed': 'src',
+    'object': 'data',
+}
+
+# Properties whose url() values are fetched by the rendering. Fonts are not
+# prefetched: only one of the sources of @font-face rules is used, if any.
+URL_PROPERTIES = frozenset([
+    'background', 'background-image', 'list-style', 'list-style-image',
+    'content'])
+
+
+class PrefetchedURLFetcher(object):
+    """A URL fetcher giving the resources fetched by :func:`prefetch`.
+
+    Each prefetched resource is given once, other requests are made with the
+    wrapped ``url_fetcher``. Resources that could not be fetched raise the
+    same exception again.
+
+    """
+    def __init__(self, url_fetcher):
+        self.url_fetcher = url_fetcher
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        with self._lock:
+            result = self.results.pop(url, None)
+        if result is None:
+            return self.url_fetcher(url)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def clear(self):
+        """Forget the prefetched resources that have not been used."""
+        with self._lock:
+            self.results.clear()
+
+
+def _resolve(base_url, url):
+    """Return the absolute URL of a resource, or :obj:`None`."""
+    url = url.strip()
+    if not url or url.startswith('#'):
+        return None
+    if not url_is_absolute(url):
+        if not base_url:
+            return None
+        url = urljoin(base_url, url)
+    url = iri_to_uri(url)
+    if urlsplit(url).scheme.lower() not in PREFETCH_SCHEMES:
+        return None
+    return url
+
+
+def _declarations_urls(base_url, declarations):
+    """Yield the resolved URLs of the images used by ``declarations``."""
+    for declaration in declarations:
+        if declaration.name in URL_PROPERTIES:
+            for token in declaration.value:
+                if token.type == 'URI':
+                    url = _resolve(base_url, token.value)
+                    if url is not None:
+                        yield url
+
+
+def _rules_urls(base_url, rules, media_type):
+    """Yield the resolved URLs of the stylesheets imported by ``rules`` and
+    of the images they use, for the ``media_type`` medium.
+
+    """
+    for rule in rules:
+        if not rule.at_keyword:
+            for url in _declarations_urls(base_url, rule.declarations):
+                yield url
+        elif rule.at_keyword == '@import':
+            if evaluate_media_query(rule.media, media_type):
+                url = _resolve(base_url, rule.uri)
+                if url is not None:
+                    yield url
+        elif rule.at_keyword == '@media':
+            if evaluate_media_query(rule.media, media_type):
+                for url in _rules_urls(base_url, rule.rules, media_type):
+                    yield url
+        elif rule.at_keyword == '@page':
+            declarations = list(rule.declarations)
+            for margin_rule in rule.at_rules:
+                declarations.extend(margin_rule.declarations)
+            for url in _declarations_urls(base_url, declarations):
+                yield url
+
+
+def _stylesheet_element_matches(element, media_type):
+    """Return whether the ``<style>`` or ``<link>`` ``element`` gives a CSS
+    stylesheet applying to the ``media_type`` medium.
+
+    """
+    mime_type = element.get('type', 'text/css').split(';', 1)[0].strip()
+    media = element.get('media', '').strip() or 'all'
+    return mime_type == 'text/css' and evaluate_media_query(
+        [medium.strip() for medium in media.split(',')], media_type)
+
+
+def document_urls(root_element, media_type='print'):
+    """Yield the resolved URLs of the resources of a document rendered for
+    the ``media_type`` medium: images, linked stylesheets, and resources of
+    style elements and attributes.
+
+    """
+    for url, _forced_mime_type in _document_resources(
+            root_element, media_type):
+        yield url
+
+
+def _document_resources(root_element, media_type):
+    """Yield ``(url, forced_mime_type)`` tuples for the resources of a
+    document, see :func:`document_urls`.
+
+    ``forced_mime_type`` is the type given by ``<embed>`` and ``<object>``
+    elements, used with the URL as a key of :data:`images.IMAGE_CACHE`.
+
+    """
+    for element in root_element.iter():
+        if not isinstance(element.tag, basestring):
+            # Comments and processing instructions
+            continue
+        tag = element.tag
+        base_url = element_base_url(element)
+        url = None
+        forced_mime_type = None
+        if tag in RESOURCE_ATTRIBUTES:
+            url = element.get(RESOURCE_ATTRIBUTES[tag])
+            if tag != 'img':
+                forced_mime_type = element.get('type', '').strip()
+        elif tag == 'link':
+            if (element_has_link_type(element, 'stylesheet') and
+                    not element_has_link_type(element, 'alternate') and
+                    _stylesheet_element_matches(element, media_type)):
+                url = element.get('href')
+        elif tag == 'style':
+            if _stylesheet_element_matches(element, media_type):
+                stylesheet = PARSER.parse_stylesheet(get_child_text(element))
+                for style_url in _rules_urls(
+                        base_url, stylesheet.rules, media_type):
+                    yield style_url, None
+        if url is not None:
+            url = _resolve(base_url, url)
+            if url is not None:
+                yield url, forced_mime_type
+        if element.get('style'):
+            declarations, _errors = PARSER.parse_style_attr(
+                element.get('style'))
+            for style_url in _declarations_urls(base_url, declarations):
+                yield style_url, None
+
+
+def _fetch(url_fetcher, url):
+    """Fetch ``url`` and read the whole resource.
+
+    Return the result of ``url_fetcher``, or the exception raised.
+
+    """
+    try:
+        result = url_fetcher(url)
+        if 'file_obj' in result:
+            file_obj = result.pop('file_obj')
+            try:
+                result['string'] = file_obj.read()
+            finally:
+                file_obj.close()
+    except Exception as exception:
+        return exception
+    return result
+
+
+def _image_cached(url_fetcher, url, forced_mime_type=None):
+    """Return whether ``url`` is an image kept in :data:`images.IMAGE_CACHE`.
+    """
+    return IMAGE_CACHE.maxmemory != 0 and image_cache_key(
+        url_fetcher, url, forced_mime_type) in IMAGE_CACHE
+
+
+def prefetch(root_element, url_fetcher, media_type='print'):
+    """Fetch the resources of a document concurrently.
+
+    Resources of fetched stylesheets are fetched too, until all the resources
+    are known. Images already kept in :data:`images.IMAGE_CACHE` are not
+    fetched.
+
+    :returns:
+        A :class:`PrefetchedURLFetcher` giving the resources, or
+        ``url_fetcher`` if nothing has been prefetched. Call its
+        :meth:`~PrefetchedURLFetcher.clear` method once the document is
+        rendered, to forget the resources that have not been used.
+
+    Only the resources fetched by :func:`default_url_fetcher` are
+    prefetched, as other URL fetchers are not known to be thread-safe.
+
+    """
+    if url_fetcher is not default_url_fetcher or not PREFETCH_THREADS:
+        return url_fetcher
+    seen = set()
+    urls = [
+        url for url, forced_mime_type in _document_resources(
+            root_element, media_type)
+        if not _image_cached(url_fetcher, url, forced_mime_type)]
+    if not urls:
+        return url_fetcher
+
+    prefetched = PrefetchedURLFetcher(url_fetcher)
+    pool = ThreadPool(PREFETCH_THREADS)
+    try:
+        while urls:
+            urls = [url for url in set(urls) if url not in seen]
+            seen.update(urls)
+            results = pool.map(functools.partial(_fetch, url_fetcher), urls)
+            new_urls = []
+            for url, result in zip(urls, results):
+                prefetched.results[url] = result
+                if (not isinstance(result, Exception) and
+                        result.get('mime_type') == 'text/css'):
+                    stylesheet = PARSER.parse_stylesheet_bytes(
+                        result['string'],
+                        protocol_encoding=result.get('encoding'))
+                    new_urls.extend(
+                        new_url for new_url in _rules_urls(
+                            result.get('redirected_url') or url,
+                            stylesheet.rules, media_type)
+                        if not _image_cached(url_fetcher, new_url))
+            urls = new_urls
+    finally:
+        pool.close()
+        pool.join()
+    return prefetched
@@ -0,0 +1,574 @@
+# coding: utf-8
+"""
+    weasyprint.server
+    -----------------
+
+    A render server, turning HTML into PDF or PNG over HTTP.
+
+    Documents are rendered by a pool of long-lived worker processes, so that
+    the native libraries, the user agent stylesheets and the caches filled by
+    previous documents (parsed stylesheets, fonts, text layouts) are already
+    warm when a request comes in. A worker exceeding the request timeout is
+    killed and replaced.
+
+    Clients can not make the server read its files or request other
+    servers: documents are given as strings, and only ``data:`` URLs and the
+    URLs allowed when starting the server are fetched.
+
+    Start it with ``python -m weasyprint.server``. See :func:`main`.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+# Do NOT import unicode_literals here. Raw WSGI requires native strings.
+from __future__ import division
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from . import batch, html
+from .compat import (
+    HTTPError, HTTPRedirectHandler, basestring, build_opener, queue,
+    socketserver, unquote, urlsplit)
+from .css import STYLESHEET_CACHE
+from .images import IMAGE_CACHE
+from .text import FONT_DESCRIPTION_CACHE
+from .urls import fetch_with_opener
+
+# Default number of seconds allowed to render a document.
+DEFAULT_TIMEOUT = 60
+
+# Default maximum size of request bodies in bytes.
+DEFAULT_MAX_REQUEST_SIZE = 32 * 1024 * 1024
+
+# Job keys accepted in requests. Files are never written by the server, and
+# attachments given as filenames would be read from its file system.
+REQUEST_KEYS = (
+    frozenset(batch.JOB_DEFAULTS) - frozenset(['output', 'attachments']))
+
+# Job keys giving URLs, only accepted when the URLs are allowed.
+URL_REQUEST_KEYS = ('input', 'stylesheets')
+
+CONTENT_TYPES = {'pdf': 'application/pdf', 'png': 'image/png'}
+
+
+def _url_origin(parts):
+    """Return the scheme, host and port of a split URL."""
+    return parts.scheme.lower(), (parts.hostname or '').lower(), parts.port
+
+
+def url_allowed(url, allowed_urls=()):
+    """Return whether the render server may fetch ``url``.
+
+    ``data:`` URLs are always allowed. Other URLs must have the scheme, host
+    and port of one of the ``allowed_urls`` prefixes, such as
+    ``'https://example.com/static/'``, and a path in the path of this
+    prefix: ``'https://example.com/static'`` allows
+    ``'https://example.com/static/logo.png'`` but not
+    ``'https://example.com/static-private/'``. Paths can not go up with
+    ``..`` segments.
+
+    """
+    if url.lower().startswith('data:'):
+        return True
+    parts = urlsplit(url)
+    path = unquote(parts.path)
+    try:
+        origin = _url_origin(parts)
+    except ValueError:
+        # Invalid port
+        return False
+    if '..' in path.split('/'):
+        return False
+    for allowed_url in allowed_urls:
+        allowed_parts = urlsplit(allowed_url)
+        try:
+            if _url_origin(allowed_parts) != origin:
+                continue
+        except ValueError:
+            continue
+        allowed_path = unquote(allowed_parts.path)
+        if (not allowed_path or path == allowed_path or path.startswith(
+                allowed_path.rstrip('/') + '/')):
+            return True
+    return False
+
+
+class _RestrictedRedirectHandler(HTTPRedirectHandler):
+    """Redirect handler only following the redirects to allowed URLs."""
+    def __init__(self, allowed_urls):
+        self.allowed_urls = allowed_urls
+
+    def redirect_request(self, request, file_obj, code, message, headers,
+                         new_url):
+        if not url_allowed(new_url, self.allowed_urls):
+            raise HTTPError(
+                new_url, code,
+                'Redirection not allowed by the render server: %s' % new_url,
+                headers, file_obj)
+        return HTTPRedirectHandler.redirect_request(
+            self, request, file_obj, code, message, headers, new_url)
+
+
+def restricted_url_fetcher(url, allowed_urls=()):
+    """Fetch ``url`` with the default URL fetcher if it is allowed, see
+    :func:`url_allowed`.
+
+    HTTP redirects are only followed to allowed URLs.
+
+    """
+    if not url_allowed(url, allowed_urls):
+        raise ValueError('URL not allowed by the render server: %s' % url)
+    return fetch_with_opener(
+        url, build_opener(_RestrictedRedirectHandler(allowed_urls)))
+
+
+def _worker_loop(connection, image_cache_memory=0, allowed_urls=(),
+                 snapshots_directory=None):
+    """Render the jobs received on ``connection`` until it is closed."""
+    IMAGE_CACHE.maxmemory = image_cache_memory
+    html.HTML5_SNAPSHOTS_DIRECTORY = snapshots_directory
+    url_fetcher = functools.partial(
+        restricted_url_fetcher, allowed_urls=tuple(allowed_urls))
+    batch.init_worker()
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        result = batch.render_job(job, url_fetcher)
+        result['caches'] = {
+            'stylesheets': STYLESHEET_CACHE.stats(),
+            'font_descriptions': FONT_DESCRIPTION_CACHE.stats(),
+            'images': IMAGE_CACHE.stats()}
+        connection.send(result)
+
+
+def _process_context():
+    """Return the :mod:`multiprocessing` context starting workers.
+
+    Workers are forked by a fork server: forking the server process itself
+    from a request thread could deadlock the new process on the locks held
+    by other threads. Python 2 has no fork server, workers are forked there.
+
+    """
+    try:
+        get_context = multiprocessing.get_context
+    except AttributeError:
+        return multiprocessing
+    try:
+        context = get_context('forkserver')
+    except ValueError:
+        # No fork server on Windows
+        return get_context('spawn')
+    context.set_forkserver_preload(['weasyprint.server'])
+    return context
+
+
+class Worker(object):
+    """A worker process, rendering one job at a time.
+
+    :param image_cache_memory: the memory in bytes used to keep images
+        between documents, see :data:`weasyprint.images.IMAGE_CACHE`.
+    :param allowed_urls: the prefixes of the URLs fetched by the worker,
+        see :func:`url_allowed`.
+
+    Workers are not forked from the current process, but they use its
+    :data:`weasyprint.html.HTML5_SNAPSHOTS_DIRECTORY`.
+
+    """
+    def __init__(self, image_cache_memory=0, allowed_urls=()):
+        context = _process_context()
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_worker_loop,
+            args=(child_connection, image_cache_memory, tuple(allowed_urls),
+                  html.HTML5_SNAPSHOTS_DIRECTORY))
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+        self.renders = 0
+        self.caches = {}
+
+    def render(self, job, timeout):
+        """Render ``job`` and return its result, see
+        :func:`weasyprint.batch.render_job`.
+
+        Return :obj:`None` if the job is not finished after ``timeout``
+        seconds.
+
+        """
+        self.connection.send(job)
+        if not self.connection.poll(timeout):
+            return None
+        result = self.connection.recv()
+        self.renders += 1
+        self.caches = result.pop('caches')
+        return result
+
+    def kill(self):
+        """Stop the worker process, even if it is rendering."""
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+class WorkerPool(object):
+    """A fixed number of :class:`Worker` processes.
+
+    :param workers: the number of processes, defaults to the number of CPUs.
+    :param timeout: the maximum time allowed to render a job, in seconds.
+    :param image_cache_memory: the memory in bytes used by each worker to
+        keep images between documents, see :class:`Worker`.
+    :param allowed_urls: the prefixes of the URLs fetched by workers, see
+        :func:`url_allowed`.
+
+    """
+    def __init__(self, workers=None, timeout=DEFAULT_TIMEOUT,
+                 image_cache_memory=0, allowed_urls=()):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.timeout = timeout
+        self.image_cache_memory = image_cache_memory
+        self.allowed_urls = tuple(allowed_urls)
+        self.workers = [
+            Worker(image_cache_memory, self.allowed_urls)
+            for _ in range(workers)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+        self._lock = threading.Lock()
+
+    def render(self, job):
+        """Render ``job`` with the first idle worker.
+
+        Return the result, or :obj:`None` if the job is not finished or not
+        even started before the timeout. Workers that time out or die are
+        replaced by new ones.
+
+        """
+        start = time.time()
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            return None
+        try:
+            result = worker.render(
+                job, max(0, start + self.timeout - time.time()))
+        except (EOFError, IOError, OSError):
+            # The worker process died, eg. killed by the system.
+            result = dict(
+                bytes=None, error='The rendering process died',
+                warnings=[], time=time.time() - start)
+            worker = self._replace(worker)
+        else:
+            if result is None:
+                worker = self._replace(worker)
+        self._idle.put(worker)
+        return result
+
+    def _replace(self, worker):
+        worker.kill()
+        new_worker = Worker(self.image_cache_memory, self.allowed_urls)
+        with self._lock:
+            self.workers[self.workers.index(worker)] = new_worker
+        return new_worker
+
+    def stats(self):
+        """Return a list of dicts describing the workers."""
+        with self._lock:
+            workers = list(self.workers)
+        return [dict(pid=worker.process.pid, renders=worker.renders,
+                     caches=worker.caches) for worker in workers]
+
+    def close(self):
+        """Stop all the worker processes."""
+        with self._lock:
+            workers = list(self.workers)
+        for worker in workers:
+            worker.kill()
+
+
+class RenderApplication(object):
+    """The WSGI application of the render server.
+
+    ``POST /render`` takes a JSON object describing a job, as accepted
+    by :func:`weasyprint.render_many` but without ``output`` and
+    ``attachments``, and returns the PDF or PNG document. For example::
+
+        {"string": "<h1>Hello</h1>", "css": ["h1 { color: red }"],
+         "format": "png", "resolution": 150}
+
+    ``input`` and ``stylesheets`` must be URLs allowed by the pool, see
+    :func:`url_allowed`. The resources of documents (images, stylesheets,
+    fonts and attachments) are only fetched from these URLs too, others
+    are reported as warnings.
+
+    The rendering time and the number of warnings are given in the
+    ``X-Render-Time`` and ``X-Render-Warnings`` headers. Jobs with
+    ``"timing": true`` also get the time spent in each stage of the
+    rendering as JSON in the ``X-Render-Timings`` header. Failed renders
+    return a ``500`` status with a JSON object giving the ``error`` and the
+    ``warnings``, timeouts a ``504`` status.
+
+    Bodies larger than ``max_request_size`` bytes return a ``413`` status.
+
+    ``GET /metrics`` returns a JSON object with counters about requests and
+    the state of the caches in workers.
+
+    :param pool: a :class:`WorkerPool`.
+    :param max_request_size: the maximum size of request bodies in bytes.
+
+    """
+    def __init__(self, pool, max_request_size=DEFAULT_MAX_REQUEST_SIZE):
+        self.pool = pool
+        self.max_request_size = max_request_size
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.counters = dict(
+            requests=0, renders=0, errors=0, timeouts=0, bad_requests=0,
+            in_progress=0, render_time=0, max_render_time=0)
+
+    def _count(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self.counters[key] += value
+
+    def metrics(self):
+        """Return a dict with the counters and the state of the workers."""
+        with self._lock:
+            metrics = dict(self.counters)
+        metrics['uptime'] = time.time() - self.started
+        metrics['workers'] = self.pool.stats()
+        return metrics
+
+    def render(self, environ):
+        """Render the job posted in ``environ``.
+
+        Return a ``(status, content_type, body, headers)`` tuple.
+
+        """
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            if length < 0:
+                raise ValueError('Invalid Content-Length')
+            if length > self.max_request_size:
+                self._count(bad_requests=1)
+                return error_response(
+                    '413 Request Entity Too Large',
+                    'The request body is larger than %i bytes' %
+                    self.max_request_size)
+            job = json.loads(environ['wsgi.input'].read(length).decode('utf8'))
+            if not isinstance(job, dict):
+                raise ValueError('The job must be a JSON object')
+            unknown = set(job) - REQUEST_KEYS
+            if unknown:
+                raise ValueError(
+                    'Unknown job options: %s' % ', '.join(sorted(unknown)))
+            self._check_urls(job)
+            format_ = batch.output_format(dict(batch.JOB_DEFAULTS, **job))
+        except ValueError as exception:
+            self._count(bad_requests=1)
+            return error_response('400 Bad Request', '%s' % exception)
+
+        self._count(in_progress=1)
+        try:
+            result = self.pool.render(job)
+        finally:
+            self._count(in_progress=-1)
+        if result is None:
+            self._count(timeouts=1)
+            return error_response(
+                '504 Gateway Timeout',
+                'The document was not rendered in %s seconds' %
+                self.pool.timeout)
+
+        render_time = result['time']
+        with self._lock:
+            self.counters['render_time'] += render_time
+            self.counters['max_render_time'] = max(
+                self.counters['max_render_time'], render_time)
+        if result['error'] is not None:
+            self._count(errors=1)
+            return error_response(
+                '500 Internal Server Error', result['error'],
+                result['warnings'])
+        self._count(renders=1)
+        headers = [
+            ('X-Render-Time', '%.6f' % render_time),
+            ('X-Render-Warnings', str(len(result['warnings'])))]
+        if 'timings' in result:
+            headers.append((
+                'X-Render-Timings',
+                json.dumps(result['timings'], sort_keys=True)))
+        return '200 OK', CONTENT_TYPES[format_], result['bytes'], headers
+
+    def _check_urls(self, job):
+        """Raise :exc:`ValueError` if ``job`` names forbidden URLs."""
+        urls = []
+        for key in URL_REQUEST_KEYS:
+            value = job.get(key)
+            if value is None:
+                continue
+            values = value if key == 'stylesheets' else [value]
+            if not isinstance(values, list):
+                raise ValueError('%s must be a list' % key)
+            urls.extend(values)
+        for url in urls:
+            if not isinstance(url, basestring) or not url_allowed(
+                    url, self.pool.allowed_urls):
+                raise ValueError('URL not allowed: %r' % (url,))
+
+    def __call__(self, environ, start_response):
+        self._count(requests=1)
+        path = environ['PATH_INFO']
+        method = environ.get('REQUEST_METHOD', 'GET')
+        headers = []
+        if path == '/render':
+            if method == 'POST':
+                status, content_type, body, headers = self.render(environ)
+            else:
+                status, content_type, body, _ = error_response(
+                    '405 Method Not Allowed', 'Use POST')
+                headers = [('Allow', 'POST')]
+        elif path == '/metrics':
+            status = '200 OK'
+            content_type = 'application/json'
+            body = json.dumps(self.metrics(), sort_keys=True).encode('ascii')
+        else:
+            status, content_type, body, _ = error_response(
+                '404 Not Found', 'Not found')
+        start_response(status, [
+            ('Content-Type', content_type),
+            ('Content-Length', str(len(body))),
+        ] + headers)
+        return [body]
+
+
+def error_response(status, message, warnings=()):
+    """Return a response tuple for an error, see
+    :meth:`RenderApplication.render`.
+
+    """
+    body = json.dumps(dict(error=message, warnings=list(warnings)))
+    return status, 'application/json', body.encode('ascii'), []
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """A WSGI server handling each request in a thread."""
+    daemon_threads = True
+
+
+class UnixWSGIServer(ThreadingWSGIServer):
+    """A WSGI server listening on a Unix socket."""
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a (host, port) address.
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+        self.setup_environ()
+
+
+class UnixRequestHandler(WSGIRequestHandler):
+    """A request handler for clients without an IP address."""
+    def setup(self):
+        self.client_address = ('unix', 0)
+        WSGIRequestHandler.setup(self)
+
+
+def make_server(application, host='127.0.0.1', port=5001, unix_socket=None):
+    """Return a WSGI server for ``application``, listening on ``host``
+    and ``port``, or on ``unix_socket`` if given.
+
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixWSGIServer(unix_socket, UnixRequestHandler)
+    else:
+        server = ThreadingWSGIServer((host, port), WSGIRequestHandler)
+    server.set_app(application)
+    return server
+
+
+def main(argv=None):
+    """Run the render server::
+
+        python -m weasyprint.server [--host HOST] [--port PORT]
+                                    [--unix-socket PATH] [--workers N]
+                                    [--timeout SECONDS]
+                                    [--image-cache MIB]
+                                    [--allow-url PREFIX ...]
+                                    [--max-request-size MIB]
+
+    It listens on http://127.0.0.1:5001/ by default. See
+    :class:`RenderApplication` for the requests it handles.
+
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m weasyprint.server',
+        description='Serve WeasyPrint renders over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Host to listen on, defaults to 127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001,
+                        help='Port to listen on, defaults to 5001')
+    parser.add_argument('--unix-socket',
+                        help='Listen on this Unix socket instead of a port')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of worker processes, '
+                             'defaults to the number of CPUs')
+    parser.add_argument('-t', '--timeout', type=float,
+                        default=DEFAULT_TIMEOUT,
+                        help='Maximum time to render a document in seconds, '
+                             'defaults to %s' % DEFAULT_TIMEOUT)
+    parser.add_argument('--image-cache', type=float, default=0,
+                        metavar='MIB',
+                        help='Memory used by each worker to keep images '
+                             'between documents, in MiB. Defaults to 0 '
+                             '(disabled).')
+    parser.add_argument('--allow-url', action='append', default=[],
+                        metavar='PREFIX', dest='allowed_urls',
+                        help='Allow documents to fetch the URLs starting '
+                             'with this prefix. Can be repeated. Only data '
+                             'URLs are fetched by default.')
+    parser.add_argument('--max-request-size', type=float,
+                        default=DEFAULT_MAX_REQUEST_SIZE / 1024 / 1024,
+                        metavar='MIB',
+                        help='Maximum size of request bodies in MiB, '
+                             'defaults to %i' %
+                             (DEFAULT_MAX_REQUEST_SIZE / 1024 / 1024))
+    args = parser.parse_args(argv)
+
+    pool = WorkerPool(
+        args.workers, args.timeout, int(args.image_cache * 1024 * 1024),
+        args.allowed_urls)
+    application = RenderApplication(
+        pool, int(args.max_request_size * 1024 * 1024))
+    server = make_server(
+        application, args.host, args.port, args.unix_socket)
+    if args.unix_socket:
+        print('Listening on %s ...' % args.unix_socket)
+    else:
+        print('Listening on http://%s:%s/ ...' % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -15,8 +15,11 @@ from __future__ import division, unicode_literals
 import contextlib
 import gzip
 import io
+import json
 import math
 import os
+import re
+import subprocess
 import sys
 import threading
 import unicodedata
@@ -28,7 +31,10 @@ import lxml.html
 
 import pytest
 
-from .. import CSS, HTML, __main__, default_url_fetcher, navigator
+from .. import (
+    CSS, HTML, Document, __main__, batch, collect_timings,
+    default_url_fetcher, images, navigator, prefetch, render_many, server,
+    text, timing)
 from ..compat import iteritems, urlencode, urljoin, urlparse_uses_relative
 from ..document import _TaggedTuple
 from ..urls import path2url
@@ -271,6 +277,44 @@ def test_python_render():
         assert read_file(png_filename) == png_bytes
         assert read_file(pdf_filename) == pdf_bytes
 
+        pdf_filename = os.path.join(temp, '3.pdf')
+        with open(pdf_filename, 'w+b') as pdf_file:
+            html.write_pdf(pdf_file, stylesheets=[css])
+        assert read_file(pdf_filename) == pdf_bytes
+
+        # Existing files are kept when the PDF can not be written
+        document = html.render(stylesheets=[css])
+
+        def failing_write_pdf(file_obj, *args):
+            file_obj.write(b'%PDF')
+            raise ValueError('Painting failed')
+        document._write_pdf = failing_write_pdf
+        with pytest.raises(ValueError):
+            document.write_pdf(pdf_filename)
+        assert read_file(pdf_filename) == pdf_bytes
+        assert sorted(os.listdir(temp)) == [
+            '1.pdf', '1.png', '2.pdf', '2.png', '3.pdf']
+
+    pdf_file = io.BytesIO()
+    html.write_pdf(pdf_file, stylesheets=[css])
+    assert pdf_file.getvalue() == pdf_bytes
+    # Written from the current position
+    pdf_file = io.BytesIO(b'%PDF')
+    pdf_file.seek(4)
+    html.write_pdf(pdf_file, stylesheets=[css])
+    assert pdf_file.getvalue() == b'%PDF' + pdf_bytes
+
+    # Only the write() method is used, the PDF is written once in order
+    class Writer(object):
+        def __init__(self):
+            self.chunks = []
+
+        def write(self, data):
+            self.chunks.append(data)
+    pdf_file = Writer()
+    html.write_pdf(pdf_file, stylesheets=[css])
+    assert b''.join(pdf_file.chunks) == pdf_bytes
+
     x2_png_bytes = html.write_png(stylesheets=[css], resolution=192)
     check_png_pattern(x2_png_bytes, x2=True)
 
@@ -289,6 +333,114 @@ def test_python_render():
     ).write_png() == rotated_png_bytes
 
 
+@assert_no_logs
+def test_parallel_pdf():
+    """Test painting PDF pages in parallel processes."""
+    document = FakeHTML(string='''
+        <style>
+            @page { size: 20px }
+            h1 { page-break-before: always; font-size: 2px }
+        </style>
+        <h1 id=a>a</h1><h1>b</h1><h1><a href=#a>c</a></h1>
+    ''').render()
+    pdf_bytes = document.write_pdf()
+    parallel_pdf_bytes = document.write_pdf(workers=2)
+    assert parallel_pdf_bytes.startswith(b'%PDF')
+    page_re = re.compile(br'/Type /Page\b(?!s)')
+    assert len(page_re.findall(pdf_bytes)) == 3
+    assert len(page_re.findall(parallel_pdf_bytes)) == 3
+    for pdf in (pdf_bytes, parallel_pdf_bytes):
+        assert b'/Outlines' in pdf
+        assert b'/Subtype /Link' in pdf
+        assert pdf.endswith(b'%%EOF\n')
+
+    # Processes are not forked while other threads run
+    event = threading.Event()
+    thread = threading.Thread(target=event.wait)
+    thread.start()
+    try:
+        with capture_logs() as logs:
+            threaded_pdf_bytes = document.write_pdf(workers=2)
+    finally:
+        event.set()
+        thread.join()
+    assert len(logs) == 1
+    assert 'Pages are painted in the current process' in logs[0]
+    assert len(page_re.findall(threaded_pdf_bytes)) == 3
+
+
+@assert_no_logs
+def test_streamed_pdf():
+    """Test painting PDF pages as soon as they are laid out."""
+    page_re = re.compile(br'/Type /Page\b(?!s)')
+    for css in ['', '@page { @top-center { content: counter(pages) } }',
+                'header { position: fixed }']:
+        html = FakeHTML(string='''
+            <style>
+                @page { size: 20px }
+                h1 { page-break-before: always; font-size: 2px }
+                %s
+            </style>
+            <header>h</header>
+            <h1 id=a>a</h1><h1>b</h1><h1><a href=#a>c</a></h1>
+        ''' % css)
+        pdf_bytes = html.write_pdf(streaming=True)
+        assert len(page_re.findall(pdf_bytes)) == 3
+        assert b'/Outlines' in pdf_bytes
+        assert b'/Subtype /Link' in pdf_bytes
+        assert pdf_bytes.endswith(b'%%EOF\n')
+
+        document = Document._render(html, [], False, streaming=True)
+        assert document.pages == []
+        document.write_pdf(workers=2)
+        assert [page.width for page in document.pages] == [20, 20, 20]
+        assert [page._page_box for page in document.pages] == [None] * 3
+        assert document.pages[2].links
+
+
+@assert_no_logs
+def test_document_update():
+    """Test laying out again a changed document."""
+    def positions(document):
+        return [[(box.element_tag, box.position_y, box.height)
+                 for box in page._page_box.descendants()
+                 if box.element_tag == 'div']
+                for page in document.pages]
+
+    source = '''
+        <style>
+            @page { size: 100px; margin: 0 }
+            body { margin: 0 }
+            div { height: 40px }
+        </style>
+        <div></div><div></div><div></div><div></div><div></div><div></div>
+        <div></div><div></div>'''
+    html = FakeHTML(string=source)
+    document = html.render(updatable=True)
+    assert len(document.pages) == 4
+    first_page, second_page, _, last_page = document.pages
+
+    divs = list(html.root_element.iter('div'))
+    divs[4].set('style', 'height: 30px')
+    document.update([divs[4]])
+    assert len(document.pages) == 4
+    # Pages before the changed element are kept, next pages laid out again
+    # until the page breaks are the same as before.
+    assert document.pages[0] is first_page
+    assert document.pages[1] is not second_page
+    assert document.pages[3] is last_page
+
+    divs[7].set('style', 'height: 90px')
+    document.update([divs[7]])
+    assert len(document.pages) == 5
+
+    expected = FakeHTML(string=lxml.html.tostring(html.root_element))
+    assert positions(document) == positions(expected.render())
+
+    with pytest.raises(ValueError):
+        FakeHTML(string=source).render().update([divs[0]])
+
+
 @assert_no_logs
 def test_command_line_render():
     """Test rendering with the command-line API."""
@@ -407,6 +559,162 @@ def test_command_line_render():
             assert stdout == png_bytes
 
 
+@assert_no_logs
+def test_batch_render():
+    """Test rendering many documents at once."""
+    html = '<body><img src=pattern.png>'
+    css = '@page { margin: 2px; size: 8px } body { margin: 0 }'
+    base_url = resource_filename('dummy.html')
+    reference = FakeHTML(string=html, base_url=base_url)
+    png_bytes = reference.write_png(stylesheets=[CSS(string=css)])
+
+    with temp_directory() as temp:
+        write_file(os.path.join(temp, 'style.css'), css.encode('ascii'))
+        stylesheets = [os.path.join(temp, 'style.css')]
+        jobs = [
+            dict(string=html, base_url=base_url, format='png',
+                 stylesheets=stylesheets),
+            dict(string=html, base_url=base_url, stylesheets=stylesheets,
+                 output=os.path.join(temp, 'out.png')),
+            dict(string='<img src=missing.png>', base_url=base_url),
+            dict(input=os.path.join(temp, 'missing.html')),
+            dict(string=html, colour='red'),
+        ]
+        try:
+            batch.HTML = FakeHTML
+            with capture_logs() as logs:
+                results = dict(render_many(jobs, workers=1))
+            # Warnings are logged as usual and reported with the job
+            assert len(logs) == 1
+
+            assert sorted(results) == [0, 1, 2, 3, 4]
+            assert results[0]['bytes'] == png_bytes
+            assert results[0]['error'] is None
+            assert results[1]['bytes'] is None
+            assert read_file(os.path.join(temp, 'out.png')) == png_bytes
+            assert results[2]['bytes'].startswith(b'%PDF')
+            assert len(results[2]['warnings']) == 1
+            assert results[2]['warnings'][0].startswith('Failed to load image')
+            assert results[3]['bytes'] is None
+            assert results[3]['error'] is not None
+            assert results[4]['error'] == (
+                'ValueError: Unknown job options: colour')
+            for result in results.values():
+                assert result['time'] >= 0
+
+            manifest = '\n'.join(json.dumps(dict(
+                string=html, base_url=base_url,
+                output=os.path.join(temp, '%i.png' % i))) for i in range(2))
+            stdout = io.BytesIO()
+            status = __main__.main(
+                ['--batch', '-', '-s', stylesheets[0], '-w', '1'],
+                stdin=io.BytesIO(manifest.encode('ascii')), stdout=stdout)
+        finally:
+            batch.HTML = HTML
+        assert status == 0
+        lines = [json.loads(line.decode('ascii'))
+                 for line in stdout.getvalue().splitlines()]
+        assert [line['index'] for line in lines] == [0, 1]
+        assert all(line['error'] is None for line in lines)
+        assert read_file(os.path.join(temp, '0.png')) == png_bytes
+        assert read_file(os.path.join(temp, '1.png')) == png_bytes
+
+
+@assert_no_logs
+def test_timings(capsys):
+    """Test measuring the stages of renders."""
+    html = '''
+        <style>
+            @page { size: 10px; margin: 0 }
+            p { page-break-before: always }
+        </style>
+        <img src=pattern.png><p>a'''
+    base_url = resource_filename('dummy.html')
+    FakeHTML(string=html, base_url=base_url).write_pdf()
+
+    with collect_timings() as timings:
+        FakeHTML(string=html, base_url=base_url).write_pdf()
+    stages = timings.stages
+    assert set(stages) >= set([
+        'styles', 'boxes', 'layout', 'pages', 'paint', 'pdf',
+        'images', 'url_fetching'])
+    assert stages['styles']['calls'] == 1
+    assert stages['layout']['calls'] == 2
+    assert stages['pages']['calls'] == 2
+    for stats in stages.values():
+        assert stats['time'] >= 0
+    assert json.loads(timings.to_json()) == stages
+
+    # Peak memory is measured for each stage, nested stages included
+    if timing.TRACE_MEMORY:
+        with collect_timings(memory=True) as timings:
+            with timing.stage('outer'):
+                with timing.stage('big'):
+                    bytearray(10 ** 7)
+            with timing.stage('small'):
+                pass
+        stages = timings.stages
+        assert stages['big']['peak_memory'] >= 10 ** 7
+        assert stages['outer']['peak_memory'] >= 10 ** 7
+        assert stages['small']['peak_memory'] < 10 ** 7
+    with collect_timings() as timings:
+        with timing.stage('small'):
+            pass
+    assert timings.stages['small']['peak_memory'] is None
+
+    with collect_timings() as timings:
+        FakeHTML(string=html + 'b', base_url=base_url).write_png()
+    assert timings.stages['text_shaping']['calls'] >= 1
+    assert 'png' in timings.stages
+    assert 'pdf' not in timings.stages
+
+    with collect_timings() as timings:
+        pass
+    FakeHTML(string=html, base_url=base_url).write_pdf()
+    assert timings.stages == {}
+
+    with temp_directory() as temp:
+        with chdir(temp):
+            write_file('in.html', html.encode('ascii'))
+            write_file('pattern.png', read_file(
+                resource_filename('pattern.png')))
+            try:
+                __main__.HTML = FakeHTML
+                __main__.main(['--timing', 'in.html', 'out.pdf'])
+            finally:
+                __main__.HTML = HTML
+    stages = json.loads(capsys.readouterr()[1])
+    assert stages['paint']['calls'] == 1
+
+
+def test_lazy_import():
+    """Test that importing WeasyPrint leaves the rendering resources alone."""
+    code = '''if True:
+        import time
+        start = time.time()
+        import weasyprint
+        import_time = time.time() - start
+        from weasyprint import html, images, text
+        print(text.ffi._ffi is None)
+        print(text.pango._library is None)
+        print(not html.HTML5_STYLESHEETS)
+        print(not images.LAZY_IMPORTS)
+        print(import_time)
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+    lines = output.decode('ascii').split()
+    assert lines[:4] == ['True'] * 4
+    # Only a benchmark, not an assertion: the time depends on the machine
+    sys.stdout.write('Import time: %.3f s\n' % float(lines[4]))
+
+    # Resources are loaded when they are needed
+    FakeHTML(string='<p>a</p>').render()
+    assert text.ffi._ffi is not None
+    assert text.pango._library is not None
+
+
 @assert_no_logs
 def test_unicode_filenames():
     """Test non-ASCII filenames both in Unicode or bytes form."""
@@ -892,6 +1200,154 @@ def test_navigator():
                 b')\n/A << /Type /Action /S /GoTo') in body
 
 
+@assert_no_logs
+def test_render_server_urls():
+    """Test the URLs fetched by the render server."""
+    allowed_urls = ['https://example.com/static', 'http://127.0.0.1:8000/']
+    for url in [
+            'https://example.com/static', 'https://example.com/static/a.png',
+            'HTTPS://EXAMPLE.COM/static/a.png', 'http://127.0.0.1:8000/a.png',
+            'data:,a']:
+        assert server.url_allowed(url, allowed_urls)
+    for url in [
+            'https://example.com.evil.org/static/a.png',
+            'https://example.com@evil.org/static/a.png',
+            'https://example.com/static-private/a.png',
+            'https://example.com/static/../private/a.png',
+            'https://example.com/static/%2e%2e/private/a.png',
+            'https://example.com:8443/static/a.png',
+            'http://example.com/static/a.png',
+            'http://127.0.0.1:8001/a.png', 'http://127.0.0.1:8000:x/a.png',
+            'file:///etc/passwd']:
+        assert not server.url_allowed(url, allowed_urls)
+
+    def redirect(path):
+        def handle(environ):
+            location = 'http://%s%s' % (environ['HTTP_HOST'], path)
+            return b'', [('Location', location)], '302 Found'
+        return handle
+
+    with http_server({
+        '/static/a.css': redirect('/static/b.css'),
+        '/static/b.css': lambda environ: (b'p {}', [
+            ('Content-Type', 'text/css')]),
+        '/static/c.css': redirect('/private.css'),
+        '/private.css': lambda environ: (b'p {}', [
+            ('Content-Type', 'text/css')]),
+    }) as root_url:
+        allowed_urls = [root_url + '/static']
+        result = server.restricted_url_fetcher(
+            root_url + '/static/a.css', allowed_urls)
+        try:
+            assert result['file_obj'].read() == b'p {}'
+            assert result['redirected_url'] == root_url + '/static/b.css'
+        finally:
+            result['file_obj'].close()
+        # Redirects to other URLs are refused
+        with pytest.raises(IOError) as exc_info:
+            server.restricted_url_fetcher(
+                root_url + '/static/c.css', allowed_urls)
+        assert 'not allowed' in str(exc_info.value)
+        with pytest.raises(ValueError):
+            server.restricted_url_fetcher(
+                root_url + '/private.css', allowed_urls)
+
+
+@assert_no_logs
+def test_render_server():
+    """Test the render server application."""
+    def client(path, job=None):
+        start_response_calls = []
+
+        def start_response(status, headers):
+            start_response_calls.append((status, headers))
+        environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET'}
+        if job is not None:
+            body = job if isinstance(job, bytes) else json.dumps(job).encode()
+            environ.update({
+                'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': str(len(body)),
+                'wsgi.input': io.BytesIO(body)})
+        response = b''.join(application(environ, start_response))
+        status, headers = start_response_calls[0]
+        return status, dict(headers), response
+
+    css = '@page { margin: 2px; size: 8px } body { margin: 0 }'
+    html = '<body><img src=pattern.png>'
+    base_url = resource_filename('dummy.html')
+    # Workers are started by a fork server and do not inherit patches such
+    # as FakeHTML, render with the default user agent stylesheet instead.
+    png_bytes = HTML(string=html, base_url=base_url).write_png(
+        stylesheets=[CSS(string=css)])
+
+    resources_url = path2url(resource_filename('')) + '/'
+    pool = server.WorkerPool(
+        workers=1, timeout=30, allowed_urls=[resources_url])
+    application = server.RenderApplication(pool)
+    try:
+        worker_pid = pool.workers[0].process.pid
+        for _ in range(2):
+            status, headers, body = client('/render', dict(
+                string=html, base_url=base_url, css=[css], format='png'))
+            assert status == '200 OK'
+            assert headers['Content-Type'] == 'image/png'
+            assert headers['X-Render-Warnings'] == '0'
+            assert body == png_bytes
+
+        status, headers, body = client('/render', dict(
+            string='<img src=missing.png>', base_url=base_url))
+        assert status == '200 OK'
+        assert headers['Content-Type'] == 'application/pdf'
+        assert headers['X-Render-Warnings'] == '1'
+        assert body.startswith(b'%PDF')
+
+        status, headers, body = client(
+            '/render', dict(input=resources_url + 'missing.html'))
+        assert status == '500 Internal Server Error'
+        assert json.loads(body.decode('ascii'))['error']
+
+        # Files and URLs out of the allowed URLs are not fetched
+        status, headers, body = client('/render', dict(
+            string='<img src="%s">' % path2url(__file__), base_url=base_url))
+        assert status == '200 OK'
+        assert headers['X-Render-Warnings'] == '1'
+
+        for job in (b'{', b'[]', dict(string=html, output='out.pdf'),
+                    dict(input=resource_filename('doc1.html')),
+                    dict(input=resources_url + '../test_api.py'),
+                    dict(string=html, stylesheets=['/etc/passwd']),
+                    dict(string=html, attachments=['/etc/passwd'])):
+            status, headers, body = client('/render', job)
+            assert status == '400 Bad Request'
+        assert client('/render')[0] == '405 Method Not Allowed'
+
+        application.max_request_size = 10
+        assert client('/render', dict(string=html))[0] == (
+            '413 Request Entity Too Large')
+        application.max_request_size = server.DEFAULT_MAX_REQUEST_SIZE
+        assert client('/lipsum')[0] == '404 Not Found'
+
+        # The worker is replaced when the timeout is reached
+        pool.timeout = 0
+        status, headers, body = client('/render', dict(string=html))
+        assert status == '504 Gateway Timeout'
+        assert pool.workers[0].process.pid != worker_pid
+        pool.timeout = 30
+
+        status, headers, body = client('/metrics')
+        assert status == '200 OK'
+        assert headers['Content-Type'] == 'application/json'
+        metrics = json.loads(body.decode('ascii'))
+        assert metrics['requests'] == 17
+        assert metrics['renders'] == 4
+        assert metrics['errors'] == 1
+        assert metrics['timeouts'] == 1
+        assert metrics['bad_requests'] == 8
+        assert metrics['in_progress'] == 0
+        assert len(metrics['workers']) == 1
+    finally:
+        pool.close()
+
+
 # Make relative URL references work with our custom URL scheme.
 urlparse_uses_relative.append('weasyprint-custom')
 
@@ -940,6 +1396,64 @@ def test_url_fetcher():
                     'é_%e9.css"><body>', url_fetcher=fetcher_2).render()
 
 
+@assert_no_logs
+def test_image_cache():
+    fetched = []
+
+    def fetcher(url):
+        fetched.append(url)
+        return default_url_fetcher(url)
+
+    def render(html, url_fetcher=fetcher):
+        FakeHTML(string=html, url_fetcher=url_fetcher,
+                 base_url=resource_filename('dummy.html')).render()
+
+    images.IMAGE_CACHE.clear()
+    render('<img src=pattern.png><img src=logo_small.png>')
+    assert len(fetched) == 2
+    # Disabled by default
+    assert images.IMAGE_CACHE.stats()['size'] == 0
+
+    images.IMAGE_CACHE.maxmemory = 10 * 1024 * 1024
+    try:
+        del fetched[:]
+        for _ in range(2):
+            render('<img src=pattern.png><img src=logo_small.png>')
+        assert len(fetched) == 2
+        stats = images.IMAGE_CACHE.stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 2
+        assert stats['hit_rate'] == 0.5
+        assert stats['size'] == 2
+        assert 0 < stats['memory'] < 10 * 1024 * 1024
+
+        # Images fetched by other URL fetchers are not shared
+        render('<img src=pattern.png>', url_fetcher=default_url_fetcher)
+        assert images.IMAGE_CACHE.stats()['size'] == 3
+
+        # The least recently used images are removed above the budget
+        images.IMAGE_CACHE.maxmemory = images.IMAGE_CACHE.memory
+        render('<img src=icon.png>')
+        assert images.IMAGE_CACHE.memory <= images.IMAGE_CACHE.maxmemory
+        assert images.IMAGE_CACHE.stats()['size'] < 4
+        del fetched[:]
+        render('<img src=pattern.png><img src=icon.png>')
+        assert fetched == [path2url(resource_filename('pattern.png'))]
+
+        # Cached SVG images do not keep the surfaces rendered by documents
+        images.IMAGE_CACHE.maxmemory = 10 * 1024 * 1024
+        for _ in range(2):
+            FakeHTML(string='<img src=pattern.svg>', url_fetcher=fetcher,
+                     base_url=resource_filename('dummy.html')).write_png()
+        svg_image, = [
+            image for image, _memory in images.IMAGE_CACHE._entries.values()
+            if isinstance(image, images.SVGImage)]
+        assert len(svg_image._surfaces) == 0
+    finally:
+        images.IMAGE_CACHE.maxmemory = 0
+        images.IMAGE_CACHE.clear()
+
+
 @assert_no_logs
 def test_html_meta():
     def assert_meta(html, **meta):
@@ -1024,3 +1538,96 @@ def test_http():
         assert HTML(root_url + '/gzip').root_element.get('test') == 'ok'
         assert HTML(root_url + '/deflate').root_element.get('test') == 'ok'
         assert HTML(root_url + '/raw-deflate').root_element.get('test') == 'ok'
+
+
+@assert_no_logs
+def test_prefetch():
+    with open(resource_filename('pattern.png'), 'rb') as fd:
+        png = fd.read()
+    requests = []
+
+    def handler(response, mime_type):
+        def handle(environ):
+            requests.append(environ['PATH_INFO'])
+            return response, [('Content-Type', mime_type)]
+        return handle
+
+    with http_server({
+        '/style.css': handler(
+            b'@import "imported.css"; @import "screen.css" screen;'
+            b'/* body { background: url(comment.png) } */'
+            b'@font-face { font-family: x; src: url(font.woff) }'
+            b'@media screen { body { background: url(screen.png) } }'
+            b'body { background: url(bg.png) }',
+            'text/css'),
+        '/imported.css': handler(b'p { color: blue }', 'text/css'),
+        '/bg.png': handler(png, 'image/png'),
+        '/img.png': handler(png, 'image/png'),
+    }) as root_url:
+        html = HTML(string='''
+            <link rel=stylesheet href=style.css>
+            <link rel=stylesheet href=screen.css media=screen>
+            <link rel="alternate stylesheet" href=alternate.css>
+            <style media=print>p { list-style: url(bg.png) }</style>
+            <p style="background: url('bg.png')"><img src=img.png>
+            <img src="data:image/png,nothing"><img src=missing.png>
+        ''', base_url=root_url + '/')
+        assert sorted(prefetch.document_urls(html.root_element)) == [
+            root_url + '/bg.png', root_url + '/bg.png', root_url + '/img.png',
+            root_url + '/missing.png', root_url + '/style.css']
+        assert sorted(prefetch.document_urls(html.root_element, 'screen')) == [
+            root_url + '/bg.png', root_url + '/img.png',
+            root_url + '/missing.png', root_url + '/screen.css',
+            root_url + '/style.css']
+
+        # Each resource is fetched once, concurrently or not
+        with capture_logs() as logs:
+            document = html.render()
+        assert sorted(requests) == [
+            '/bg.png', '/img.png', '/imported.css', '/style.css']
+        assert len(document.pages) == 1
+        assert len(logs) == 2  # Invalid data URL and missing image
+
+        # Failures are raised again, not fetched again
+        prefetched = prefetch.prefetch(html.root_element, default_url_fetcher)
+        exception = prefetched.results[root_url + '/missing.png']
+        assert isinstance(exception, Exception)
+        with pytest.raises(type(exception)) as exc_info:
+            prefetched(root_url + '/missing.png')
+        assert exc_info.value is exception
+
+        # Resources not used by the layout are forgotten
+        document = html.render(updatable=True)
+        assert isinstance(
+            document._updater.url_fetcher, prefetch.PrefetchedURLFetcher)
+        assert document._updater.url_fetcher.results == {}
+
+        # Cached images are not kept with the prefetched resources, and are
+        # not fetched again
+        images.IMAGE_CACHE.clear()
+        images.IMAGE_CACHE.maxmemory = 10 * 1024 * 1024
+        try:
+            html.render()
+            keys = list(images.IMAGE_CACHE._entries)
+            assert keys
+            assert all(key[0] is default_url_fetcher for key in keys)
+
+            images_html = HTML(
+                string='<p style="background: url(bg.png)"><img src=img.png>',
+                base_url=root_url + '/')
+            del requests[:]
+            images_html.render()
+            assert requests == []
+        finally:
+            images.IMAGE_CACHE.maxmemory = 0
+            images.IMAGE_CACHE.clear()
+
+        del requests[:]
+        old_threads = prefetch.PREFETCH_THREADS
+        prefetch.PREFETCH_THREADS = 0
+        try:
+            assert prefetch.prefetch(
+                html.root_element, default_url_fetcher) is default_url_fetcher
+        finally:
+            prefetch.PREFETCH_THREADS = old_threads
+        assert not requests
@@ -12,14 +12,20 @@
 
 from __future__ import division, unicode_literals
 
+import os
+
+import cssselect
+import lxml.etree
 from pytest import raises
 
-from .. import CSS, css, default_url_fetcher
+from .. import CSS, HTML, css, default_url_fetcher, html
 from ..css import get_all_computed_styles
 from ..css.computed_values import strut_layout
+from ..css.selectors import depends_on_siblings
+from ..formatting_structure import build
 from ..urls import open_data_url, path2url
 from .testing_utils import (
-    FakeHTML, assert_no_logs, capture_logs, resource_filename)
+    FakeHTML, assert_no_logs, capture_logs, resource_filename, temp_directory)
 
 
 @assert_no_logs
@@ -68,6 +74,36 @@ def test_style_dict():
         style.position  # pylint: disable=W0104
 
 
+@assert_no_logs
+def test_style_dict_copy():
+    """Test that copies of a ``StyleDict`` are independent."""
+    style = css.StyleDict(css.properties.INITIAL_VALUES)
+    style['font_size'] = 20
+    copy = style.copy()
+    assert copy == style
+    assert copy._values is style._values
+    copy['font_size'] = 10
+    assert copy.font_size == 10
+    assert style.font_size == 20
+    style['clear'] = 'both'
+    assert style.clear == 'both'
+    assert copy.clear == 'none'
+
+    anonymous = style.inherit_from()
+    assert anonymous.anonymous and not style.anonymous
+    assert anonymous.font_size == 20
+    assert anonymous.clear == 'none'
+    assert anonymous.copy().anonymous
+    # Anonymous styles share their values until they are modified
+    other_anonymous = style.inherit_from()
+    assert other_anonymous._values is anonymous._values
+    other_anonymous['margin_top'] = (1, 'px')
+    assert anonymous.margin_top == (0, 'px')
+    style['font_size'] = 30
+    assert style.inherit_from().font_size == 30
+    assert anonymous.font_size == 20
+
+
 @assert_no_logs
 def test_find_stylesheets():
     """Test if the stylesheets are found in a HTML document."""
@@ -323,6 +359,185 @@ def test_error_recovery():
     assert len(logs) == 4
 
 
+@assert_no_logs
+def test_stylesheet_cache():
+    """Test that stylesheets are only parsed once per process."""
+    css.STYLESHEET_CACHE.clear()
+    source = 'p { color: red } foo { margin-top: red }'
+    with capture_logs() as logs:
+        sheet_1 = CSS(string=source)
+        sheet_2 = CSS(string=source)
+        sheet_3 = CSS(string=source, base_url='http://weasyprint.org/')
+    assert css.STYLESHEET_CACHE.stats()['hits'] == 1
+    assert css.STYLESHEET_CACHE.stats()['misses'] == 2
+    # The rule lists are not shared, but parsed rules and selectors are.
+    assert sheet_1.rules is not sheet_2.rules
+    assert sheet_1.rules == sheet_2.rules
+    assert sheet_1.rules[0][1][0] is sheet_2.rules[0][1][0]
+    assert sheet_1.rules[0][1][0] is not sheet_3.rules[0][1][0]
+    # Warnings are logged again when the cache is hit.
+    assert len(logs) == 3
+    assert all('invalid value' in message for message in logs)
+
+    css.STYLESHEET_CACHE.clear()
+    source = '@import "invalid-protocol://absolute-URL"; p { color: red }'
+    with capture_logs() as logs:
+        CSS(string=source)
+        CSS(string=source)
+    assert len(logs) == 2
+    assert css.STYLESHEET_CACHE.stats()['hits'] == 0
+
+
+@assert_no_logs
+def test_selector_index():
+    """Test that indexed selectors match the same elements as XPath."""
+    sheet = CSS(string='''
+        p, .a, #b, p.a, ul > li.a#b, div p, h1 + p:first-child, *,
+        h1 ~ p ~ ul a::after, li:nth-child(2), a[href^=http], :not(p),
+        li:lang(fr), .a .b > .c ~ .d + .e { margin: 0 }
+        @page :first { margin: 0 }
+    ''')
+    selectors = [selector for _rule, selector_list, _declarations
+                 in sheet.rules for selector in selector_list]
+    assert [selector.key for selector in selectors[:5]] == [
+        ('tag', 'p'), ('class', 'a'), ('id', 'b'), ('class', 'a'),
+        ('id', 'b')]
+    assert selectors[0].test is None
+    assert selectors[3].test is not None
+    assert selectors[-1].key is None  # @page
+
+    document = FakeHTML(string='''
+        <div><p class="b a" id=b>1<p class=A>2</div><h1>3</h1><p>4
+        <ul lang=fr><li class=a id=b>5<li class="a  d"><a href=http://a>6</a>
+        <!-- comment --><li class="c"><i class=d></i><i class=e></i></ul>
+        <section class=a><span class="b"><i class=c></i><i class=d></i>
+        <i class=e></i></span></section>
+    ''')
+    element_tree = document.root_element
+    expected = [
+        (element, index) for index, selector in enumerate(selectors)
+        for element in selector.match(element_tree)]
+    matched = list(css.match_selectors(
+        element_tree, [(selector, index)
+                       for index, selector in enumerate(selectors)]))
+    assert sorted(matched, key=repr) == sorted(expected, key=repr)
+    # For each element, selectors are in the order of the stylesheet.
+    for element in element_tree.iter():
+        indexes = [index for matched_element, index in matched
+                   if matched_element is element]
+        assert indexes == sorted(indexes)
+
+
+@assert_no_logs
+def test_sibling_selectors():
+    """Test the detection of selectors depending on siblings."""
+    for selector, expected in (
+            ('p', False), ('div > p', False), ('div p.a#b', False),
+            ('a:not(.b)', False), ('a[href]:hover', False),
+            ('h1 + p', True), ('h1 ~ p', True), ('div h1 ~ p > a', True),
+            ('li:first-child', True), ('li:last-child', True),
+            ('li:only-child', True), ('li:only-of-type', True),
+            ('li:nth-last-child(2)', True), ('li:nth-of-type(odd)', True),
+            ('p:empty', True), ('li:not(:last-child)', True)):
+        tree = cssselect.parse(selector)[0].parsed_tree
+        assert depends_on_siblings(tree) == expected, selector
+
+    document = FakeHTML(string='''
+        <style>li:last-child { color: red }</style>
+        <ul><li>a</li><li>b</li></ul>''')
+    style_for = get_all_computed_styles(document)
+    ul, = document.root_element.iter('ul')
+    assert [style_for(li).color for li in ul] == [
+        (0, 0, 0, 1), (1, 0, 0, 1)]
+    lxml.etree.SubElement(ul, 'li').text = 'c'
+    style_for.restyle([ul[2]])
+    assert [style_for(li).color for li in ul] == [
+        (0, 0, 0, 1), (0, 0, 0, 1), (1, 0, 0, 1)]
+
+
+@assert_no_logs
+def test_html5_snapshots():
+    """Test that HTML5 stylesheets are loaded from their snapshots."""
+    source = '''
+        <h1>a</h1><p align=center>b</p>
+        <ul><li><a href=#c>c</a></li></ul><table border=1><td>d</table>'''
+    stylesheets = dict(html.HTML5_STYLESHEETS)
+    directory = html.HTML5_SNAPSHOTS_DIRECTORY
+    snapshot_format = html.SNAPSHOT_FORMAT
+    styles = []
+    loaded_rules = []
+    with temp_directory() as temp:
+        html.HTML5_SNAPSHOTS_DIRECTORY = temp
+        try:
+            # Snapshots of other formats are not loaded
+            for html.SNAPSHOT_FORMAT in (
+                    snapshot_format, snapshot_format, snapshot_format + 1):
+                html.HTML5_STYLESHEETS.clear()
+                document = HTML(string=source)
+                style_for = get_all_computed_styles(
+                    document, presentational_hints=True)
+                styles.append([
+                    style_for(element)
+                    for element in document.root_element.iter()])
+                loaded_rules.append(html.html5_ua_stylesheet().rules)
+            snapshots = sorted(os.listdir(temp))
+        finally:
+            html.HTML5_SNAPSHOTS_DIRECTORY = directory
+            html.SNAPSHOT_FORMAT = snapshot_format
+            html.HTML5_STYLESHEETS.clear()
+            html.HTML5_STYLESHEETS.update(stylesheets)
+    assert sorted(name.split('-')[0] for name in snapshots) == [
+        'html5_ph', 'html5_ph', 'html5_ua', 'html5_ua']
+    # Parsed, loaded without the tinycss rules, then parsed again
+    assert loaded_rules[0][0][0] is not None
+    assert loaded_rules[1][0][0] is None
+    assert loaded_rules[2][0][0] is not None
+    assert len(loaded_rules[0]) == len(loaded_rules[1])
+    assert styles[0] == styles[1] == styles[2]
+
+
+@assert_no_logs
+def test_style_sharing():
+    """Test that elements with the same cascade share computed styles."""
+    document = FakeHTML(string='''
+        <style>
+            table { border-collapse: collapse; padding: 3px }
+            td { color: red; margin: 2px }
+            td.a { color: blue }
+            td::before { content: attr(title) }
+        </style>
+        <table><tr><td>1</td><td>2</td><td class=a>3</td></tr>
+        <tr style="font-size: 16px"><td>4</td><td style="color: red">5</td>
+        </tr></table>
+        <p><a href=#a>6</a><a href=#b>7</a></p>
+    ''')
+    style_for = get_all_computed_styles(document)
+    td_1, td_2, td_3, td_4, td_5 = document.root_element.iter('td')
+    assert style_for(td_1) is style_for(td_2)
+    assert style_for(td_1) is not style_for(td_3)
+    assert style_for(td_3).color == (0, 0, 1, 1)
+    # Same cascade, different parent styles
+    assert style_for(td_1) is not style_for(td_4)
+    assert style_for(td_1) == style_for(td_4)
+    # Style attributes give new declarations
+    assert style_for(td_1) is not style_for(td_5)
+    assert style_for(td_1) == style_for(td_5)
+    # attr() depends on the element
+    assert style_for(td_1, 'before') is not style_for(td_2, 'before')
+
+    a_1, a_2 = document.root_element.iter('a')
+    assert style_for(a_1) is not style_for(a_2)
+    assert style_for(a_1).link == ('internal', 'a')
+    assert style_for(a_2).link == ('internal', 'b')
+
+    # Building boxes does not change the shared styles
+    build.build_formatting_structure(
+        document.root_element, style_for, lambda *args: None)
+    table, = document.root_element.iter('table')
+    assert style_for(td_1).margin_top == (2, 'px')
+    assert style_for(table).padding_top == (3, 'px')
+
+
 @assert_no_logs
 def test_line_height_inheritance():
     document = FakeHTML(string='''
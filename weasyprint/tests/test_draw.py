@@ -20,7 +20,7 @@ import tempfile
 
 import cairocffi as cairo
 
-from .. import HTML
+from .. import HTML, draw
 from ..compat import ints_from_bytes, izip, xrange
 from ..html import HTML_HANDLERS
 from ..urls import ensure_url
@@ -1421,6 +1421,66 @@ def test_images():
     ''')
 
 
+@assert_no_logs
+def test_svg_image_surfaces():
+    """Test that SVG images are rendered once per size."""
+    document = FakeHTML(base_url=resource_filename('dummy.html'), string='''
+        <style>
+            @page { size: 8px }
+            body { margin: 2px 0 0 2px; background: #fff; font-size: 0 }
+            img { display: block; page-break-after: always }
+        </style>
+        <img src=pattern.svg><img src=pattern.svg><img src=pattern.svg>
+        <img src=pattern.svg style="width: 2px">
+    ''').render()
+    images = set(
+        box.replacement for page in document.pages
+        for box in page._page_box.descendants()
+        if getattr(box, 'replacement', None) is not None)
+    image, = images
+    png_bytes, _, _ = document.write_png()
+    stats = image._surfaces.stats()
+    assert stats['misses'] == 2
+    assert stats['hits'] == 2
+    # Painting again gives the same result
+    assert document.write_png()[0] == png_bytes
+    assert image._surfaces.stats()['misses'] == 2
+
+
+@assert_no_logs
+def test_background_tile_patterns():
+    """Test that identical background tiles are drawn once."""
+    document = FakeHTML(base_url=resource_filename('dummy.html'), string='''
+        <style>
+            @page { size: 12px 8px }
+            body { margin: 0 }
+            div { float: left; width: 4px; height: 8px;
+                  background: url(pattern.png) }
+        </style>
+        <div></div><div></div><div></div>
+    ''').render()
+    images = set(
+        layer.image for page in document.pages
+        for box in page._page_box.descendants()
+        if box.background is not None
+        for layer in box.background.layers if layer.image is not None)
+    image, = images
+    page, = document.pages
+    background_tiles = draw.make_background_tiles()
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 12, 8)
+    page._paint(
+        cairo.Context(surface), background_tiles=background_tiles)
+    stats = background_tiles.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 2
+    key, = background_tiles._entries
+    assert key[0] is image
+    # Tiles are only kept for the surface they are painted on
+    png_bytes, _, _ = document.write_png()
+    assert document.write_png()[0] == png_bytes
+    assert background_tiles.stats()['misses'] == 1
+
+
 def test_image_resolution():
     assert_same_rendering(20, 20, [
         ('image_resolution_ref', '''
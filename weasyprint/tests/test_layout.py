@@ -2833,6 +2833,31 @@ def test_fixed_positioning():
     html, = page_3.children
     assert [c.element_tag for c in html.children] == ['p', 'body']
 
+    # Fixed boxes are laid out once and copied on the other pages
+    pages = parse('''
+        <style>
+            @page { size: 100px; margin: 10px }
+            header { position: fixed; top: 5px; right: 0; width: 20px }
+            header img { float: left }
+            div { page-break-before: always }
+        </style>
+        <header><img src=pattern.png></header>
+        <div></div><div></div><div></div>
+    ''')
+    assert len(pages) == 4
+    headers = []
+    for page in pages:
+        html, = page.children
+        header, = [
+            child for child in html.children if child.element_tag == 'header']
+        headers.append(header)
+    for header in headers:
+        assert (header.position_x, header.position_y) == (70, 15)
+        img, = header.children
+        assert (img.position_x, img.position_y) == (70, 15)
+    assert len(set(map(id, headers))) == 4
+    assert len(set(id(header.children[0]) for header in headers)) == 4
+
 
 @assert_no_logs
 def test_floats():
@@ -3015,6 +3040,40 @@ def test_floats():
     page, = parse('''<div style="top:100%; float:left">''')
 
 
+@assert_no_logs
+def test_many_floats():
+    """Test the layout of many floats, moved with their parent."""
+    page, = parse('''
+        <style>
+            body { width: 100px }
+            img { float: left; width: 10px; height: 10px }
+            img:nth-child(3n) { float: right; height: 15px }
+            p { clear: both; margin: 0 }
+            div { margin-top: 5px }
+        </style>
+        <div>%s</div><p></p>''' % ('<img src=pattern.png>' * 100))
+    html, = page.children
+    body, = html.children
+    div, paragraph = body.children
+    images = div.children
+    assert len(images) == 100
+    left_images = [image for i, image in enumerate(images) if i % 3 != 2]
+    right_images = [image for i, image in enumerate(images) if i % 3 == 2]
+    # Floats are moved down with the margin of the div
+    assert images[0].position_y == 5
+    lefts = [(image.position_x, image.position_y) for image in left_images]
+    rights = [(image.position_x, image.position_y) for image in right_images]
+    # Left floats go below the first row of left floats, right floats are
+    # taller and go below the first row of right floats.
+    assert lefts[:9] == [
+        (0, 5), (10, 5), (20, 5), (30, 5), (40, 5), (50, 5), (60, 5),
+        (0, 15), (10, 15)]
+    assert rights[:6] == [(90, 5), (80, 5), (70, 5), (60, 15), (50, 15),
+                          (40, 25)]
+    assert images[-1].position_y == 190
+    assert paragraph.position_y == 205
+
+
 @assert_no_logs
 def test_floats_page_breaks():
     """Tests the page breaks when floated boxes
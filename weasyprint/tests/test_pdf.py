@@ -12,9 +12,12 @@
 
 from __future__ import division, unicode_literals
 
+import base64
 import hashlib
 import io
 import os
+import re
+import zlib
 
 import cairocffi
 
@@ -447,3 +450,104 @@ def test_annotation_files():
     assert hashlib.md5(b'some data').hexdigest().encode('ascii') in pdf_bytes
     assert b'/FileAttachment' in pdf_bytes
     assert b'/EmbeddedFiles' not in pdf_bytes
+
+
+@assert_no_logs
+def test_object_streams():
+    html = FakeHTML(string='''
+        <title>Test document</title>
+        <style>a { display: block; height: 1px }</style>
+        <h1>Links</h1>
+        %s
+    ''' % ''.join('<a href="http://weasyprint.org/%i"></a>' % i
+                  for i in range(200)))
+    pdf_bytes = html.write_pdf()
+    compressed_bytes = html.write_pdf(object_streams=True)
+    assert len(compressed_bytes) < len(pdf_bytes)
+    assert b'/Type /ObjStm' in compressed_bytes
+    assert b'/Type /XRef' in compressed_bytes
+    assert b'/Subtype /Link' not in compressed_bytes
+
+    # The cross-reference stream is the last object
+    xref_offset = int(compressed_bytes.split(b'startxref\n')[-1].split()[0])
+    dictionary, stream = compressed_bytes[xref_offset:].split(
+        b'\nstream\n', 1)
+    length = int(dictionary.split(b'/Length ')[1].split()[0])
+    rows = zlib.decompress(stream[:length])
+    assert len(rows) % 7 == 0  # 1 + 4 + 2 bytes per object
+
+    # Objects in object streams are found with their stream offsets
+    objects = b''
+    for part in compressed_bytes.split(b'/Type /ObjStm ')[1:]:
+        dictionary, stream = part.split(b'\nstream\n', 1)
+        length = int(dictionary.split(b'/Length ')[1].split()[0])
+        objects += zlib.decompress(stream[:length])
+    assert objects.count(b'/Subtype /Link') == 200
+    assert b'/Outlines' in objects
+    assert b'/Title (\xfe\xff' in objects
+
+
+@assert_no_logs
+def test_single_pass_pdf():
+    document = FakeHTML(string='''
+        <title>Test document</title>
+        <style>
+            @page { size: 20px }
+            h1 { page-break-before: always; font-size: 2px }
+        </style>
+        <h1 id=a>a</h1><h1>b</h1><h1><a href=#a>c</a></h1>
+    ''').render()
+    for pdf_bytes in (document.write_pdf(), document.write_pdf(workers=2)):
+        # A single cross-reference section, without incremental updates
+        assert pdf_bytes.count(b'\nxref\n') == 1
+        assert pdf_bytes.count(b'trailer\n') == 1
+        assert pdf_bytes.count(b'%%EOF') == 1
+        assert b'/Prev' not in pdf_bytes.split(b'trailer\n')[1]
+
+        # Each object is written once, at its offset in the table
+        numbers = [int(number) for number in re.findall(
+            br'\n(\d+) 0 obj\n', pdf_bytes)]
+        assert sorted(numbers) == list(range(1, len(numbers) + 1))
+        xref = pdf_bytes.split(b'\nxref\n')[1].split(b'trailer\n')[0]
+        lines = xref.splitlines()
+        assert lines[:2] == [
+            ('0 %i' % (len(numbers) + 1)).encode('ascii'),
+            b'0000000000 65535 f ']
+        for number, line in enumerate(lines[2:], start=1):
+            offset = int(line.split()[0])
+            assert pdf_bytes[offset:].startswith(
+                ('%i 0 obj\n' % number).encode('ascii'))
+
+        assert len(re.findall(br'/Type /Page\b(?!s)', pdf_bytes)) == 3
+        assert pdf_bytes.count(b'/Type /Pages') == 1
+        assert b'/Outlines' in pdf_bytes
+        assert b'/Subtype /Link' in pdf_bytes
+        assert b'/Title (\xfe\xff' in pdf_bytes
+
+
+@assert_no_logs
+def test_image_xobjects():
+    def count_images(html, **kwargs):
+        pdf_bytes = FakeHTML(
+            base_url=resource_filename('dummy.html'), string=html).write_pdf(
+            **kwargs)
+        return pdf_bytes.count(b'/Subtype /Image')
+
+    with open(resource_filename('pattern.png'), 'rb') as fd:
+        data_url = 'data:image/png;base64,' + base64.b64encode(
+            fd.read()).decode('ascii')
+    expected = count_images('<img src=pattern.png>')
+    assert expected
+
+    # The same image on each page, in backgrounds and from another URL
+    html = '''
+        <style>
+            @page { size: 20px; background: url(pattern.png) }
+            div { page-break-before: always; background: url(%s) }
+        </style>
+        <img src=pattern.png>
+        <div><img src=pattern.png></div>
+        <div><img src="%s"></div>
+    ''' % (data_url, data_url)
+    assert count_images(html) == expected
+    assert count_images(html, workers=2) == expected
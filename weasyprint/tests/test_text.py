@@ -14,7 +14,9 @@ from __future__ import division, unicode_literals
 
 from ..css import StyleDict
 from ..css.properties import INITIAL_VALUES
-from ..text import split_first_line
+from ..fonts import FontConfiguration
+from ..layout import LayoutContext
+from ..text import Layout, get_size, line_widths, split_first_line
 from .test_layout import body_children, parse
 from .testing_utils import FONTS, assert_no_logs
 
@@ -78,6 +80,64 @@ def test_text_dimension():
     assert width_1 * height_1 < width_2 * height_2
 
 
+@assert_no_logs
+def test_layout_pool():
+    """Test that released Pango layouts are reset and reused."""
+    style = StyleDict(INITIAL_VALUES)
+    style['font_family'] = FONTS
+    layout = Layout(context=None, font_size=20, style=style)
+    pango_layout = layout.layout
+    layout.set_text('This is a text for test')
+    line, = layout.iter_lines()
+    width, _ = get_size(line, style)
+    layout.release()
+    assert layout.layout is None
+
+    layout = Layout(context=None, font_size=20, style=style)
+    assert layout.layout is pango_layout
+    line, = layout.iter_lines()
+    assert line.length == 0
+    layout.set_text('This is a text for test')
+    line, = layout.iter_lines()
+    assert get_size(line, style)[0] == width
+
+    # Different fonts do not share layouts
+    other_layout = Layout(context=None, font_size=10, style=style)
+    assert other_layout.layout is not pango_layout
+
+
+@assert_no_logs
+def test_text_measurement_cache():
+    """Test that identical texts are measured once per layout."""
+    context = LayoutContext(
+        enable_hinting=False, style_for=None, get_image_from_uri=None,
+        font_config=FontConfiguration())
+    style = StyleDict(INITIAL_VALUES)
+    style['font_family'] = FONTS
+    result = split_first_line('0.00', style, context, 100, None)
+    assert split_first_line('0.00', style, context, 100, None) is result
+    assert split_first_line('0.00', style, context, 50, None) is not result
+    assert context.text_measurements.stats()['hits'] == 1
+
+    # Layouts kept by the cache are not given back to the pool
+    layout = result[0]
+    pango_layout = layout.layout
+    layout.release()
+    assert layout.layout is pango_layout
+
+    bigger_style = style.copy()
+    bigger_style['font_size'] = 32
+    _, _, _, width, _, _ = result
+    _, _, _, bigger_width, _, _ = split_first_line(
+        '0.00', bigger_style, context, 100, None)
+    assert bigger_width > width
+
+    widths = list(line_widths('0.00 N/A', style, context, 0))
+    assert list(line_widths('0.00 N/A', style, context, 0)) == widths
+    assert len(widths) == 2
+    assert context.text_measurements.stats()['hits'] == 2
+
+
 @assert_no_logs
 def test_text_font_size_zero():
     """Test a text with a font size set to 0."""
@@ -24,9 +24,13 @@ import wsgiref.simple_server
 
 import pytest
 
-from .. import CSS, HTML, text
+from .. import CSS, HTML, html, text
 from ..logger import LOGGER
 
+# Do not write snapshots of the HTML5 stylesheets in the cache directory of
+# the user running the tests, see test_css.test_html5_snapshots
+html.HTML5_SNAPSHOTS_DIRECTORY = None
+
 # TODO: find a way to not depend on a specific font
 FONTS = 'Liberation Sans, Arial'
 
@@ -108,8 +112,11 @@ def http_server(handlers):
     def wsgi_app(environ, start_response):
         handler = handlers.get(environ['PATH_INFO'])
         if handler:
-            status = str('200 OK')
-            response, headers = handler(environ)
+            # Handlers return (response, headers) or (response, headers,
+            # status) tuples
+            result = handler(environ)
+            status = str(result[2] if len(result) > 2 else '200 OK')
+            response, headers = result[:2]
             headers = [(str(name), str(value)) for name, value in headers]
         else:
             status = str('404 Not Found')
@@ -12,15 +12,20 @@
 
 from __future__ import division
 
+import hashlib
+import math
 import re
+import threading
 import warnings
 
 import cairocffi as cairo
 import cffi
 import pyphen
 
+from .caches import LRUCache
 from .compat import basestring
 from .logger import LOGGER
+from .timing import timed
 
 # XXX No unicode_literals, cffi likes native strings
 
@@ -32,7 +37,97 @@ if cairo.cairo_version() <= 11400:
 PANGO_ATTR_FONT_FEATURES_CACHE = {}
 
 
-ffi = cffi.FFI()
+class LazyFFI(object):
+    """A :class:`cffi.FFI` object created on first use.
+
+    C declarations given to :meth:`cdef` are only parsed when an attribute
+    of the FFI object is needed. If the optional out-of-line module built
+    by :mod:`weasyprint.ffi_build` is available and has been built with the
+    same declarations, its precompiled declarations are used instead.
+
+    """
+    def __init__(self):
+        self.declarations = []
+        self.precompiled = False
+        self._ffi = None
+        self._lock = threading.Lock()
+
+    def cdef(self, declarations):
+        """Add C declarations, parsed when the FFI object is created."""
+        with self._lock:
+            self.declarations.append(declarations)
+            if self._ffi is not None and not self.precompiled:
+                self._ffi.cdef(declarations)
+
+    def declarations_hash(self):
+        """Return a hash of the C declarations."""
+        return hashlib.sha1(
+            ''.join(self.declarations).encode('utf-8')).hexdigest()
+
+    def load(self):
+        """Create the FFI object if needed and return it."""
+        if self._ffi is None:
+            with self._lock:
+                if self._ffi is None:
+                    try:
+                        from ._ffi import ffi, DECLARATIONS_HASH
+                    except ImportError:
+                        ffi = None
+                    else:
+                        if DECLARATIONS_HASH == self.declarations_hash():
+                            self.precompiled = True
+                        else:
+                            ffi = None
+                    if ffi is None:
+                        ffi = cffi.FFI()
+                        for declarations in self.declarations:
+                            ffi.cdef(declarations)
+                    self._ffi = ffi
+        return self._ffi
+
+    def __getattr__(self, name):
+        # Only called for missing attributes: keep them on the instance, so
+        # that next lookups are as fast as on the FFI object itself.
+        value = getattr(self.load(), name)
+        setattr(self, name, value)
+        return value
+
+
+class LazyLibrary(object):
+    """A C library opened with :func:`dlopen` on first use.
+
+    ``requires`` are the libraries that must be loaded before this one, and
+    ``initialize`` the name of a function called once the library is open.
+
+    """
+    def __init__(self, ffi, names, requires=(), initialize=None):
+        self.ffi = ffi
+        self.names = names
+        self.requires = requires
+        self.initialize = initialize
+        self._library = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Open the library if needed and return it."""
+        if self._library is None:
+            for library in self.requires:
+                library.load()
+            with self._lock:
+                if self._library is None:
+                    library = dlopen(self.ffi, *self.names)
+                    if self.initialize is not None:
+                        getattr(library, self.initialize)()
+                    self._library = library
+        return self._library
+
+    def __getattr__(self, name):
+        value = getattr(self.load(), name)
+        setattr(self, name, value)
+        return value
+
+
+ffi = LazyFFI()
 ffi.cdef('''
     // Cairo
 
@@ -230,43 +325,89 @@ def dlopen(ffi, *names):
     return ffi.dlopen(names[0])  # pragma: no cover
 
 
-gobject = dlopen(ffi, 'gobject-2.0', 'libgobject-2.0-0', 'libgobject-2.0.so',
-                 'libgobject-2.0.dylib')
-pango = dlopen(ffi, 'pango-1.0', 'libpango-1.0-0', 'libpango-1.0.so',
-               'libpango-1.0.dylib')
-pangocairo = dlopen(ffi, 'pangocairo-1.0', 'libpangocairo-1.0-0',
-                    'libpangocairo-1.0.so', 'libpangocairo-1.0.dylib')
+# Libraries are only opened when they are first needed, so that importing
+# WeasyPrint stays fast.
+gobject = LazyLibrary(
+    ffi, ('gobject-2.0', 'libgobject-2.0-0', 'libgobject-2.0.so',
+          'libgobject-2.0.dylib'), initialize='g_type_init')
+pango = LazyLibrary(
+    ffi, ('pango-1.0', 'libpango-1.0-0', 'libpango-1.0.so',
+          'libpango-1.0.dylib'), requires=(gobject,))
+pangocairo = LazyLibrary(
+    ffi, ('pangocairo-1.0', 'libpangocairo-1.0-0', 'libpangocairo-1.0.so',
+          'libpangocairo-1.0.dylib'), requires=(pango,))
+
+# Same as pango_units_to_double and pango_units_from_double, without calls
+# through cffi.
+PANGO_SCALE = 1024
+
 
-gobject.g_type_init()
+def units_to_double(units):
+    return units / PANGO_SCALE
+
+
+def units_from_double(value):
+    return int(math.floor(value * PANGO_SCALE + 0.5))
 
-units_to_double = pango.pango_units_to_double
-units_from_double = pango.pango_units_from_double
 
 PYPHEN_DICTIONARY_CACHE = {}
 
+# keys: (font_family, font_style, font_stretch, font_weight, font_size)
+# values: PangoFontDescription objects, copied by the layouts using them
+FONT_DESCRIPTION_CACHE = LRUCache(maxsize=256)
+
+# Maximum number of released PangoLayout objects kept for a given key, and
+# maximum number of keys in the pool of a thread.
+LAYOUT_POOL_SIZE = 8
+LAYOUT_POOL_KEYS = 64
+
+
+class ThreadState(threading.local):
+    """Pango and cairo objects reused by the layouts of a thread."""
+    def __init__(self):
+        # keys: hinting, values: cairo contexts drawing on dummy surfaces
+        self.dummy_contexts = {}
+        # keys: (font description key, language, hinting, font map)
+        # values: lists of released PangoLayout objects
+        self.layout_pools = {}
+
+
+THREAD_STATE = ThreadState()
+
+# Properties of the style used to shape and break lines of text.
+TEXT_MEASUREMENT_PROPERTIES = (
+    'white_space', 'font_family', 'font_size', 'font_style', 'font_stretch',
+    'font_weight', 'font_language_override', 'lang', 'word_spacing',
+    'letter_spacing', 'font_kerning', 'font_variant_ligatures',
+    'font_variant_position', 'font_variant_caps', 'font_variant_numeric',
+    'font_variant_alternates', 'font_variant_east_asian',
+    'font_feature_settings', 'tab_size', 'hyphens', 'hyphenate_character',
+    'hyphenate_limit_chars', 'hyphenate_limit_zone', 'overflow_wrap')
 
+
+# Names of Pango constants, only looked up when needed
 PANGO_STYLE = {
-    'normal': pango.PANGO_STYLE_NORMAL,
-    'oblique': pango.PANGO_STYLE_OBLIQUE,
-    'italic': pango.PANGO_STYLE_ITALIC,
+    'normal': 'PANGO_STYLE_NORMAL',
+    'oblique': 'PANGO_STYLE_OBLIQUE',
+    'italic': 'PANGO_STYLE_ITALIC',
 }
 
 PANGO_STRETCH = {
-    'ultra-condensed': pango.PANGO_STRETCH_ULTRA_CONDENSED,
-    'extra-condensed': pango.PANGO_STRETCH_EXTRA_CONDENSED,
-    'condensed': pango.PANGO_STRETCH_CONDENSED,
-    'semi-condensed': pango.PANGO_STRETCH_SEMI_CONDENSED,
-    'normal': pango.PANGO_STRETCH_NORMAL,
-    'semi-expanded': pango.PANGO_STRETCH_SEMI_EXPANDED,
-    'expanded': pango.PANGO_STRETCH_EXPANDED,
-    'extra-expanded': pango.PANGO_STRETCH_EXTRA_EXPANDED,
-    'ultra-expanded': pango.PANGO_STRETCH_ULTRA_EXPANDED,
+    'ultra-condensed': 'PANGO_STRETCH_ULTRA_CONDENSED',
+    'extra-condensed': 'PANGO_STRETCH_EXTRA_CONDENSED',
+    'condensed': 'PANGO_STRETCH_CONDENSED',
+    'semi-condensed': 'PANGO_STRETCH_SEMI_CONDENSED',
+    'normal': 'PANGO_STRETCH_NORMAL',
+    'semi-expanded': 'PANGO_STRETCH_SEMI_EXPANDED',
+    'expanded': 'PANGO_STRETCH_EXPANDED',
+    'extra-expanded': 'PANGO_STRETCH_EXTRA_EXPANDED',
+    'ultra-expanded': 'PANGO_STRETCH_ULTRA_EXPANDED',
 }
 
 PANGO_WRAP_MODE = {
-    'WRAP_WORD': pango.PANGO_WRAP_WORD,
-    'WRAP_CHAR': pango.PANGO_WRAP_CHAR,
-    'WRAP_WORD_CHAR': pango.PANGO_WRAP_WORD_CHAR
+    'WRAP_WORD': 'PANGO_WRAP_WORD',
+    'WRAP_CHAR': 'PANGO_WRAP_CHAR',
+    'WRAP_WORD_CHAR': 'PANGO_WRAP_WORD_CHAR'
 }
 
 # From http://www.microsoft.com/typography/otspec/languagetags.htm
@@ -611,51 +752,113 @@ def first_line_metrics(first_line, text, layout, resume_at, space_collapse,
     return layout, length, resume_at, width, height, baseline
 
 
-class Layout(object):
-    """Object holding PangoLayout-related cdata pointers."""
-    def __init__(self, context, font_size, style):
-        self.context = context
-        hinting = context.enable_hinting if context else False
-        cairo_dummy_context = (
+def get_dummy_context(hinting):
+    """Return the cairo context used to create layouts in this thread."""
+    dummy_context = THREAD_STATE.dummy_contexts.get(hinting)
+    if dummy_context is None:
+        dummy_context = (
             cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
             if hinting else cairo.Context(cairo.PDFSurface(None, 1, 1)))
-        self.layout = ffi.gc(
-            pangocairo.pango_cairo_create_layout(ffi.cast(
-                'cairo_t *', cairo_dummy_context._pointer)),
-            gobject.g_object_unref)
-        pango_context = pango.pango_layout_get_context(self.layout)
-        if context and context.font_config.font_map:
-            pango.pango_context_set_font_map(
-                pango_context, context.font_config.font_map)
-        self.font = ffi.gc(
+        THREAD_STATE.dummy_contexts[hinting] = dummy_context
+    return dummy_context
+
+
+def get_font_description(style, font_size):
+    """Return ``(key, font)`` for the font properties of ``style``."""
+    assert not isinstance(style.font_family, basestring), (
+        'font_family should be a list')
+    key = (tuple(style.font_family), style.font_style, style.font_stretch,
+           style.font_weight, font_size)
+    font = FONT_DESCRIPTION_CACHE.get(key)
+    if font is None:
+        font = ffi.gc(
             pango.pango_font_description_new(),
             pango.pango_font_description_free)
+        family_p, family = unicode_to_char_p(','.join(style.font_family))
+        pango.pango_font_description_set_family(font, family_p)
+        pango.pango_font_description_set_style(
+            font, getattr(pango, PANGO_STYLE[style.font_style]))
+        pango.pango_font_description_set_stretch(
+            font, getattr(pango, PANGO_STRETCH[style.font_stretch]))
+        pango.pango_font_description_set_weight(font, style.font_weight)
+        pango.pango_font_description_set_absolute_size(
+            font, units_from_double(font_size))
+        FONT_DESCRIPTION_CACHE.set(key, font)
+    return key, font
+
+
+class Layout(object):
+    """Object holding PangoLayout-related cdata pointers.
+
+    PangoLayout objects are taken from a pool when available. Layouts that
+    are not needed anymore can be given back with :meth:`release`.
+
+    """
+    def __init__(self, context, font_size, style):
+        self.context = context
+        hinting = context.enable_hinting if context else False
+        font_map = (
+            context.font_config.font_map
+            if context and context.font_config.font_map else None)
         if style.font_language_override != 'normal':
-            lang_p, lang = unicode_to_char_p(LST_TO_ISO.get(
+            lang = LST_TO_ISO.get(
                 style.font_language_override.lower(),
-                style.font_language_override))
+                style.font_language_override)
         elif style.lang:
-            lang_p, lang = unicode_to_char_p(style.lang)
+            lang = style.lang
         else:
             lang = None
-            self.language = pango.pango_language_get_default()
         if lang:
+            lang_p, lang = unicode_to_char_p(lang)
             self.language = pango.pango_language_from_string(lang_p)
-            pango.pango_context_set_language(pango_context, self.language)
+        else:
+            self.language = pango.pango_language_get_default()
+        font_key, self.font = get_font_description(style, font_size)
+
+        # True if the layout is kept by the text measurement cache
+        self.shared = False
+        self.pool_key = (font_key, lang, hinting, font_map)
+        pool = THREAD_STATE.layout_pools.get(self.pool_key)
+        if pool:
+            # The font description, language and font map are already set
+            self.layout = pool.pop()
+            self.set_text('')
+            pango.pango_layout_set_width(self.layout, -1)
+            pango.pango_layout_set_attributes(self.layout, ffi.NULL)
+            pango.pango_layout_set_tabs(self.layout, ffi.NULL)
+            self.set_wrap(getattr(pango, PANGO_WRAP_MODE['WRAP_WORD']))
+            return
 
-        assert not isinstance(style.font_family, basestring), (
-            'font_family should be a list')
-        family_p, family = unicode_to_char_p(','.join(style.font_family))
-        pango.pango_font_description_set_family(self.font, family_p)
-        pango.pango_font_description_set_style(
-            self.font, PANGO_STYLE[style.font_style])
-        pango.pango_font_description_set_stretch(
-            self.font, PANGO_STRETCH[style.font_stretch])
-        pango.pango_font_description_set_weight(self.font, style.font_weight)
-        pango.pango_font_description_set_absolute_size(
-            self.font, units_from_double(font_size))
+        self.layout = ffi.gc(
+            pangocairo.pango_cairo_create_layout(ffi.cast(
+                'cairo_t *', get_dummy_context(hinting)._pointer)),
+            gobject.g_object_unref)
+        pango_context = pango.pango_layout_get_context(self.layout)
+        if font_map is not None:
+            pango.pango_context_set_font_map(pango_context, font_map)
+        if lang:
+            pango.pango_context_set_language(pango_context, self.language)
         pango.pango_layout_set_font_description(self.layout, self.font)
 
+    def release(self):
+        """Give the PangoLayout back to the pool of the current thread.
+
+        The layout, and the lines got from it, must not be used anymore.
+        Layouts shared by the text measurement cache are not released.
+
+        """
+        if self.shared:
+            return
+        pools = THREAD_STATE.layout_pools
+        pool = pools.get(self.pool_key)
+        if pool is None:
+            if len(pools) >= LAYOUT_POOL_KEYS:
+                pools.clear()
+            pool = pools[self.pool_key] = []
+        if len(pool) < LAYOUT_POOL_SIZE:
+            pool.append(self.layout)
+        self.layout = None
+
     def iter_lines(self):
         layout_iter = ffi.gc(
             pango.pango_layout_get_iter(self.layout),
@@ -687,6 +890,7 @@ class Layout(object):
             line, = layout.iter_lines()
             width, _ = get_size(line, style)
             width = int(round(width))
+            layout.release()
         else:
             width = style.tab_size.value
         # TODO: 0 is not handled correctly by Pango
@@ -916,7 +1120,25 @@ def split_first_line(text, style, context, max_width, line_width):
     ``height``: height in pixels of the first line
     ``baseline``: baseline in pixels of the first line
 
+    Results are cached in ``context``, the same layout may be returned for
+    identical texts and styles.
+
     """
+    key = measurement_key(text, style, context, max_width)
+    if key is not None:
+        result = context.text_measurements.get(key)
+        if result is not None:
+            return result
+    result = _split_first_line(text, style, context, max_width)
+    if key is not None:
+        result[0].shared = True
+        context.text_measurements.set(key, result)
+    return result
+
+
+@timed('text_shaping')
+def _split_first_line(text, style, context, max_width):
+    """Do the work of :func:`split_first_line`, without cache."""
     text_wrap = style.white_space in ('pre', 'nowrap')
     space_collapse = style.white_space in ('normal', 'nowrap', 'pre-line')
 
@@ -1060,6 +1282,7 @@ def split_first_line(text, style, context, max_width, line_width):
                             new_space >= 0 or
                             first_word_part == dictionary_iterations[-1]):
                         hyphenated = True
+                        layout.release()
                         layout = new_layout
                         first_line = new_first_line
                         second_line = new_second_line
@@ -1067,6 +1290,7 @@ def split_first_line(text, style, context, max_width, line_width):
                         if text[len(new_first_line_text)] == soft_hyphen:
                             resume_at += len(soft_hyphen.encode('utf8'))
                         break
+                    new_layout.release()
 
                 if not hyphenated and not first_line_text:
                     # Recreate the layout with no max_width to be sure that
@@ -1113,7 +1337,7 @@ def split_first_line(text, style, context, max_width, line_width):
         layout.set_text(text)
         pango.pango_layout_set_width(
             layout.layout, units_from_double(max_width))
-        layout.set_wrap(PANGO_WRAP_MODE['WRAP_CHAR'])
+        layout.set_wrap(getattr(pango, PANGO_WRAP_MODE['WRAP_CHAR']))
         temp_lines = layout.iter_lines()
         next(temp_lines, None)
         temp_second_line = next(temp_lines, None)
@@ -1140,12 +1364,51 @@ def split_first_line(text, style, context, max_width, line_width):
         style.hyphenate_character)
 
 
+def measurement_key(text, style, context, max_width):
+    """Return a key for the measurements of ``text`` in ``context``.
+
+    Return :obj:`None` if measurements can not be cached.
+
+    """
+    if context is None or getattr(context, 'text_measurements', None) is None:
+        return None
+    key = [text, max_width, context.enable_hinting,
+           context.font_config.font_map]
+    for name in TEXT_MEASUREMENT_PROPERTIES:
+        value = style[name]
+        if isinstance(value, list):
+            value = tuple(value)
+        key.append(value)
+    key = tuple(key)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
 def line_widths(text, style, context, width):
     """Return the width for each line."""
+    key = measurement_key(text, style, context, width)
+    if key is not None:
+        key = ('line_widths',) + key
+        widths = context.text_measurements.get(key)
+        if widths is None:
+            widths = list(_line_widths(text, style, context, width))
+            context.text_measurements.set(key, widths)
+        for width in widths:
+            yield width
+    else:
+        for width in _line_widths(text, style, context, width):
+            yield width
+
+
+def _line_widths(text, style, context, width):
     layout = create_layout(text, style, context, width)
     for line in layout.iter_lines():
         width, _height = get_size(line, style)
         yield width
+    layout.release()
 
 
 def show_first_line(context, pango_layout, hinting):
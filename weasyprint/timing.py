@@ -0,0 +1,216 @@
+# coding: utf-8
+"""
+    weasyprint.timing
+    -----------------
+
+    Measure where renders spend their time.
+
+    The stages of the rendering and some hot paths are wrapped with
+    :func:`stage`. Nothing is measured unless timings are collected with
+    :func:`collect_timings`, in the thread doing the rendering.
+
+    The peak memory of each stage is measured with :mod:`tracemalloc`, on
+    Python 3.9 and later.
+
+    :copyright: Copyright 2011-2014 Simon Sapin and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+"""
+
+from __future__ import division, unicode_literals
+
+import contextlib
+import functools
+import json
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+# Whether the peak of traced memory can be reset at the start of stages
+TRACE_MEMORY = hasattr(tracemalloc, 'reset_peak')
+
+
+class _TimingState(threading.local):
+    def __init__(self):
+        # Timings objects collecting the stages measured in this thread
+        self.collectors = []
+        # Peak memory of the running stages, outermost first, not counting
+        # the allocations since the last reset of the tracemalloc peak.
+        self.peaks = []
+
+
+_STATE = _TimingState()
+
+
+def _start_memory():
+    """Start measuring the peak memory of a stage.
+
+    Return whether memory is measured.
+
+    """
+    if not (TRACE_MEMORY and tracemalloc.is_tracing()):
+        return False
+    peaks = _STATE.peaks
+    if peaks:
+        peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    peaks.append(0)
+    return True
+
+
+def _stop_memory(traced):
+    """Return the peak memory in bytes of the stage ending, or :obj:`None`
+    if ``traced`` (returned by :func:`_start_memory`) is false.
+
+    """
+    if not traced:
+        return None
+    peaks = _STATE.peaks
+    peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+    if peaks:
+        peaks[-1] = max(peaks[-1], peak)
+    return peak
+
+
+class Timings(object):
+    """The timings collected by :func:`collect_timings`.
+
+    Stages may be nested, the time of a stage includes the time of its nested
+    stages.
+
+    """
+    def __init__(self):
+        #: A dict of stage names to dicts with the total wall ``time`` in
+        #: seconds, the number of ``calls`` and the ``peak_memory`` in bytes,
+        #: the largest memory allocated by Python during one of the calls.
+        #: ``peak_memory`` is :obj:`None` unless memory is traced, see
+        #: :func:`collect_timings`.
+        self.stages = {}
+
+    def add(self, name, duration, memory):
+        """Add a call of ``name`` that took ``duration`` seconds."""
+        stats = self.stages.get(name)
+        if stats is None:
+            self.stages[name] = dict(
+                time=duration, calls=1, peak_memory=memory)
+        else:
+            stats['time'] += duration
+            stats['calls'] += 1
+            if memory is not None:
+                stats['peak_memory'] = max(stats['peak_memory'] or 0, memory)
+
+    def to_json(self):
+        """Return the timings as a JSON string."""
+        return json.dumps(self.stages, sort_keys=True)
+
+
+@contextlib.contextmanager
+def collect_timings(memory=False):
+    """Measure the renders done in the current thread, in a ``with``
+    block::
+
+        with collect_timings() as timings:
+            HTML('http://weasyprint.org/').write_pdf('weasyprint.pdf')
+        print(timings.stages['layout']['time'])
+
+    Stages are ``prefetch`` (fetching the resources of documents
+    concurrently), ``styles`` (parsing stylesheets and computing styles),
+    ``boxes`` (building the boxes), ``layout``, ``pages`` (gathering the
+    links, anchors and bookmarks of pages), ``paint``, ``pdf`` (writing PDF
+    files with their metadata) and ``png``. Hot paths are ``text_shaping``
+    (breaking lines of text with Pango, cached results excluded),
+    ``images`` (loading and decoding images) and ``url_fetching``.
+
+    :type memory: bool
+    :param memory:
+        Whether the peak memory of stages is measured. Memory is measured
+        with :mod:`tracemalloc`, started for the block if needed, which
+        slows the rendering down. It is also measured when
+        :mod:`tracemalloc` is already tracing. Allocations made by other
+        threads at the same time are counted too.
+    :returns: A :class:`~weasyprint.timing.Timings` object.
+
+    """
+    start_tracing = (
+        memory and TRACE_MEMORY and not tracemalloc.is_tracing())
+    if start_tracing:
+        tracemalloc.start()
+    timings = Timings()
+    _STATE.collectors.append(timings)
+    try:
+        yield timings
+    finally:
+        _STATE.collectors.remove(timings)
+        if start_tracing:
+            tracemalloc.stop()
+
+
+def _record(name, start, traced):
+    duration = time.time() - start
+    memory = _stop_memory(traced)
+    for timings in _STATE.collectors:
+        timings.add(name, duration, memory)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Measure the ``with`` block as a call of the stage called ``name``."""
+    if not _STATE.collectors:
+        yield
+        return
+    start = time.time()
+    traced = _start_memory()
+    try:
+        yield
+    finally:
+        _record(name, start, traced)
+
+
+def timed(name):
+    """Decorate a function, measuring its calls as a stage called ``name``.
+
+    Cheaper than :func:`stage` when timings are not collected.
+
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _STATE.collectors:
+                return function(*args, **kwargs)
+            start = time.time()
+            traced = _start_memory()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(name, start, traced)
+        return wrapper
+    return decorator
+
+
+def timed_iter(name, iterable):
+    """Iterate over ``iterable``, measuring each step as a call of the stage
+    called ``name``.
+
+    """
+    iterator = iter(iterable)
+    while True:
+        if not _STATE.collectors:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            yield item
+            continue
+        start = time.time()
+        traced = _start_memory()
+        try:
+            item = next(iterator)
+        except BaseException:
+            _stop_memory(traced)
+            raise
+        _record(name, start, traced)
+        yield item
@@ -29,6 +29,7 @@ from .compat import (
     urljoin, urllib_get_charset, urllib_get_content_type, urllib_get_filename,
     urlopen, urlsplit)
 from .logger import LOGGER
+from .timing import stage
 
 # Unlinke HTML, CSS and PNG, the SVG MIME type is not always builtin
 # in some Python version and therefore not reliable.
@@ -257,12 +258,26 @@ def default_url_fetcher(url):
         If a ``file_obj`` key is given, it is the caller’s responsability
         to call ``file_obj.close()``.
 
+    """
+    return fetch_with_opener(url)
+
+
+def fetch_with_opener(url, opener=None):
+    """Fetch ``url`` like :func:`default_url_fetcher`.
+
+    URLs other than ``data:`` URLs are opened with ``opener``, a
+    :class:`urllib.request.OpenerDirector` object such as those returned by
+    :func:`urllib.request.build_opener`, or with
+    :func:`urllib.request.urlopen` by default.
+
     """
     if url.lower().startswith('data:'):
         return open_data_url(url)
     elif UNICODE_SCHEME_RE.match(url):
         url = iri_to_uri(url)
-        response = urlopen(Request(url, headers=HTTP_HEADERS))
+        request = Request(url, headers=HTTP_HEADERS)
+        response = (
+            urlopen(request) if opener is None else opener.open(request))
         result = dict(redirected_url=response.geturl(),
                       mime_type=urllib_get_content_type(response),
                       encoding=urllib_get_charset(response),
@@ -297,7 +312,8 @@ class URLFetchingError(IOError):
 def fetch(url_fetcher, url):
     """Call an url_fetcher, fill in optional data, and clean up."""
     try:
-        result = url_fetcher(url)
+        with stage('url_fetching'):
+            result = url_fetcher(url)
     except Exception as exc:
         name = type(exc).__name__
         value = str(exc)